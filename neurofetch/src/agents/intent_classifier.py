@@ -0,0 +1,120 @@
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+
+DEFAULT_EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "data", "intent_examples.jsonl")
+
+class IntentClassifier:
+    """In-process query intent classifier: regex and keyword features fed to a small linear model"""
+    
+    LABELS = ["table", "chat", "retrieval", "definition", "comparison", "other"]
+    
+    def __init__(self, query_patterns: Dict[str, str], table_keywords: List[str], chat_keywords: List[str],
+                 model_path: Optional[str] = None, examples_path: str = DEFAULT_EXAMPLES_PATH,
+                 log_path: Optional[str] = None):
+        self.query_patterns = {name: re.compile(pattern) for name, pattern in query_patterns.items()}
+        self.table_keywords = table_keywords
+        self.chat_keywords = chat_keywords
+        self.model_path = model_path
+        self.examples_path = examples_path
+        # Queries labelled by the LLM fallback are appended here so the model can be retrained on them
+        self.log_path = log_path
+        self.weights: Dict[str, List[float]] = {}
+        self.logger = logging.getLogger("intent_classifier")
+        self._log_lock = threading.Lock()
+        
+        if model_path and os.path.exists(model_path):
+            self.load(model_path)
+        else:
+            self.train(self.load_examples())
+    
+    def predict(self, query: str) -> Tuple[str, float]:
+        """Return the most likely intent and its probability"""
+        probabilities = self.predict_proba(query)
+        best = max(range(len(self.LABELS)), key=probabilities.__getitem__)
+        return self.LABELS[best], probabilities[best]
+    
+    def predict_proba(self, query: str) -> List[float]:
+        scores = [0.0] * len(self.LABELS)
+        for feature in self._features(query):
+            weights = self.weights.get(feature)
+            if weights:
+                for i, weight in enumerate(weights):
+                    scores[i] += weight
+        return self._softmax(scores)
+    
+    def train(self, examples: List[Dict[str, str]], epochs: int = 40, learning_rate: float = 0.3, l2: float = 1e-4):
+        """Fit the linear model with plain SGD on {"query", "intent"} examples"""
+        data = [(self._features(ex["query"]), self.LABELS.index(ex["intent"]))
+                for ex in examples if ex.get("intent") in self.LABELS]
+        self.weights = {}
+        rng = random.Random(0)
+        for _ in range(epochs):
+            rng.shuffle(data)
+            for features, label in data:
+                scores = [0.0] * len(self.LABELS)
+                for feature in features:
+                    weights = self.weights.setdefault(feature, [0.0] * len(self.LABELS))
+                    for i, weight in enumerate(weights):
+                        scores[i] += weight
+                probabilities = self._softmax(scores)
+                for feature in features:
+                    weights = self.weights[feature]
+                    for i in range(len(self.LABELS)):
+                        gradient = probabilities[i] - (1.0 if i == label else 0.0)
+                        weights[i] -= learning_rate * (gradient + l2 * weights[i])
+        self.logger.info(f"Trained intent classifier on {len(data)} examples ({len(self.weights)} features)")
+    
+    def load_examples(self) -> List[Dict[str, str]]:
+        """Seed examples plus any queries logged from the LLM fallback"""
+        examples = []
+        for path in (self.examples_path, self.log_path):
+            if path and os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    examples.extend(json.loads(line) for line in f if line.strip())
+        return examples
+    
+    def record(self, query: str, intent: str):
+        """Log an LLM-labelled query for the next retraining run"""
+        if not self.log_path or intent not in self.LABELS:
+            return
+        with self._log_lock:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"query": query, "intent": intent}) + "\n")
+    
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"labels": self.LABELS, "weights": self.weights}, f)
+    
+    def load(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            model = json.load(f)
+        if model["labels"] != self.LABELS:
+            raise ValueError(f"Model labels {model['labels']} do not match {self.LABELS}")
+        self.weights = model["weights"]
+    
+    def _features(self, query: str) -> List[str]:
+        query_lower = query.lower().strip()
+        words = re.findall(r"\w+", query_lower)
+        features = ["bias"]
+        features.extend(f"w:{word}" for word in words)
+        features.extend(f"b:{first}_{second}" for first, second in zip(words, words[1:]))
+        features.extend(f"re:{name}" for name, pattern in self.query_patterns.items() if pattern.search(query_lower))
+        if any(keyword in query_lower for keyword in self.table_keywords):
+            features.append("kw:table")
+        if any(keyword in query_lower for keyword in self.chat_keywords):
+            features.append("kw:chat")
+        if len(words) <= 3:
+            features.append("len:short")
+        return features
+    
+    def _softmax(self, scores: List[float]) -> List[float]:
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [value / total for value in exps]
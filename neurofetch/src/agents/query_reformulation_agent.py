@@ -1,11 +1,14 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from .base_agent import BaseAgent
+from .synonyms import SynonymEngine
+from utils.metrics import timed_stage
+import os
 import re
 
 class QueryReformulationAgent(BaseAgent):
     """Agent responsible for reformulating and expanding user queries"""
     
-    def __init__(self):
+    def __init__(self, synonyms_path: Optional[str] = None):
         super().__init__("query_reformulation", "query_reformulation")
         
         # Common query patterns and their expansions
@@ -27,7 +30,17 @@ class QueryReformulationAgent(BaseAgent):
             "process": ["procedure", "method", "approach", "technique"],
             "system": ["framework", "platform", "infrastructure", "architecture"]
         }
+        # Domain thesauri load on top of the built-in mappings; the trie is built once here
+        synonyms_path = synonyms_path or os.environ.get("NEUROFETCH_SYNONYMS_FILE")
+        if synonyms_path:
+            self.synonym_engine = SynonymEngine.from_file(synonyms_path, self.synonym_mappings)
+        else:
+            self.synonym_engine = SynonymEngine(self.synonym_mappings)
+        
+        # Most variants returned per query, the original included
+        self.max_variants = 5
     
+    @timed_stage("process")
     def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Process the user query and return reformulated queries"""
         self.log_activity("processing_query", {"original_query": input_data.get("query", "")})
@@ -45,6 +58,7 @@ class QueryReformulationAgent(BaseAgent):
             
             # Generate reformulated queries
             reformulated_queries = self._reformulate_query(original_query, intent)
+            reformulated_queries = reformulated_queries[:max(1, int(input_data.get("max_variants", self.max_variants)))]
             
             # Create response data
             response_data = {
@@ -80,6 +94,7 @@ class QueryReformulationAgent(BaseAgent):
         else:
             return "general"
     
+    @timed_stage("reformulate")
     def _reformulate_query(self, query: str, intent: str) -> List[str]:
         """Generate reformulated versions of the query"""
         reformulated = [query]  # Always include original query
@@ -127,13 +142,8 @@ class QueryReformulationAgent(BaseAgent):
         return unique_reformulated[:5]  # Limit to 5 reformulations
     
     def _expand_with_synonyms(self, query: str) -> str:
-        """Expand query with synonyms"""
-        expanded = query
-        for term, synonyms in self.synonym_mappings.items():
-            if term in query.lower():
-                # Replace with first synonym
-                expanded = re.sub(rf'\b{term}\b', synonyms[0], expanded, flags=re.IGNORECASE)
-        return expanded
+        """Expand query with synonyms, replacing each known term with its first synonym"""
+        return self.synonym_engine.expand(query)
     
     def _extract_keywords(self, query: str) -> List[str]:
         """Extract key terms from the query"""
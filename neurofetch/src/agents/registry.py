@@ -0,0 +1,60 @@
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, Tuple
+
+from utils.lazy import LazyProxy
+
+# Agent name -> (module, class); modules are only imported when the agent is first used
+AGENT_CLASSES: Dict[str, Tuple[str, str]] = {
+    "structured_data_extraction": ("agents.structured_data_agent", "StructuredDataExtractionAgent"),
+    "adaptive_retrieval": ("agents.retrieval_agent", "AdaptiveRetrievalAgent"),
+    "query_reformulation": ("agents.query_reformulation_agent", "QueryReformulationAgent"),
+}
+
+class AgentRegistry:
+    """Builds each agent, and imports its dependencies, on first use instead of at startup"""
+
+    def __init__(self, agent_classes: Dict[str, Tuple[str, str]] = AGENT_CLASSES):
+        self.agent_classes = agent_classes
+        self.load_times: Dict[str, float] = {}
+        self._agents: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger("agent_registry")
+
+    def get(self, name: str) -> Any:
+        agent = self._agents.get(name)
+        if agent is None:
+            with self._lock:
+                agent = self._agents.get(name)
+                if agent is None:
+                    started = time.perf_counter()
+                    module_name, class_name = self.agent_classes[name]
+                    agent = getattr(importlib.import_module(module_name), class_name)()
+                    self.load_times[name] = round(time.perf_counter() - started, 3)
+                    self.logger.info(f"Loaded agent {name} in {self.load_times[name]}s")
+                    self._agents[name] = agent
+        return agent
+
+    def proxy(self, name: str) -> LazyProxy:
+        """A stand-in for module-level names such as retrieval_agent that loads the agent when touched"""
+        return LazyProxy(lambda: self.get(name))
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._agents
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self.agent_classes:
+            raise KeyError(name)
+        return self.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.agent_classes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.agent_classes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: {"loaded": self.is_loaded(name), "load_time_s": self.load_times.get(name)}
+                for name in self.agent_classes}
@@ -1,4 +1,5 @@
 from typing import Dict, Any, List, Optional
+import threading
 from .base_agent import BaseAgent
 from langchain_community.vectorstores import FAISS
 from langchain_ollama import OllamaEmbeddings
@@ -6,6 +7,14 @@ from langchain.text_splitter import CharacterTextSplitter
 import os
 import numpy as np
 from difflib import SequenceMatcher
+from utils.embeddings import CoalescingEmbeddings
+from utils.metrics import REGISTRY, timed_stage
+from utils.speculation import BranchCancelled
+
+QUERIES_EXECUTED = REGISTRY.histogram("neurofetch_retrieval_queries_executed", "Query variants searched per retrieval call",
+                                      ("fan_out",), buckets=(1, 2, 3, 4, 5, 8))
+FAN_OUT_STOPS = REGISTRY.counter("neurofetch_retrieval_fan_out_stops_total", "Why adaptive fan-out stopped searching",
+                                 ("reason",))
 
 class AdaptiveRetrievalAgent(BaseAgent):
     """Agent responsible for intelligent document retrieval and re-ranking"""
@@ -13,36 +22,69 @@ class AdaptiveRetrievalAgent(BaseAgent):
     def __init__(self):
         super().__init__("adaptive_retrieval", "retrieval")
         self.vectorstore = None
-        self.embeddings = OllamaEmbeddings(model="nomic-embed-text")
+        self.embeddings = CoalescingEmbeddings(OllamaEmbeddings(model="nomic-embed-text"))
+        # Bumped whenever the index changes so caches built on top of it can be invalidated
+        self.index_version = 0
+        # Adaptive fan-out: most query variants searched per call, and how far the best match must
+        # stand out from the median of its results (1 - best/median distance) to skip the rest
+        self.max_fan_out = 3
+        self.fan_out_min_gap = 0.2
+        # Optional absolute bound on the best distance; depends on the embedding model, so off by default
+        self.fan_out_max_distance = None
         
+    @timed_stage("index")
     def chunk_and_embed_files(self, file_paths):
         all_chunks = []
         for path in file_paths:
-            ext = os.path.splitext(path)[1].lower()
-            if ext == ".pdf":
-                from PyPDF2 import PdfReader
-                reader = PdfReader(path)
-                text = "".join(page.extract_text() or "" for page in reader.pages)
-            elif ext in [".txt", ".md"]:
-                with open(path, "r", encoding="utf-8") as f:
-                    text = f.read()
-            elif ext == ".csv":
-                import pandas as pd
-                df = pd.read_csv(path)
-                text = df.to_csv(index=False)
-            else:
+            text = self._read_text(path)
+            if text is None:
                 continue
             splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
             chunks = splitter.split_text(text)
             all_chunks.extend(chunks)
         if all_chunks:
             self.vectorstore = FAISS.from_texts(all_chunks, self.embeddings)
+            self.index_version += 1
+    
+    @timed_stage("index")
+    def index_document(self, doc_id: str, path: Optional[str] = None, text: Optional[str] = None,
+                       source: Optional[str] = None) -> int:
+        """Add one document to the existing index, tagging its chunks with doc_id; returns the chunk count"""
+        if text is None:
+            text = self._read_text(path) if path else None
+        if not text:
+            return 0
+        splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        chunks = splitter.split_text(text)
+        metadatas = [{"doc_id": doc_id, "source": source or path or doc_id} for _ in chunks]
+        if self.vectorstore is None:
+            self.vectorstore = FAISS.from_texts(chunks, self.embeddings, metadatas=metadatas)
+        else:
+            self.vectorstore.add_texts(chunks, metadatas=metadatas)
+        self.index_version += 1
+        return len(chunks)
+    
+    def _read_text(self, path: str) -> Optional[str]:
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".pdf":
+            from PyPDF2 import PdfReader
+            reader = PdfReader(path)
+            return "".join(page.extract_text() or "" for page in reader.pages)
+        elif ext in [".txt", ".md"]:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        elif ext == ".csv":
+            import pandas as pd
+            df = pd.read_csv(path)
+            return df.to_csv(index=False)
+        return None
 
     def update_vectorstore_with_files(self, file_paths):
         self.chunk_and_embed_files(file_paths)
 
-    def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Process queries and return relevant documents"""
+    @timed_stage("process")
+    def process(self, input_data: Dict[str, Any], cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Process queries and return relevant documents; a set cancel_event stops between steps"""
         self.log_activity("processing_retrieval", {"queries": input_data.get("queries", [])})
         
         if not self.validate_input(input_data, ["queries"]):
@@ -54,15 +96,24 @@ class AdaptiveRetrievalAgent(BaseAgent):
         try:
             queries = input_data["queries"]
             original_query = input_data.get("original_query", queries[0] if queries else "")
+            doc_ids = input_data.get("doc_ids")
             
-            # Perform multi-query retrieval
-            all_documents = []
-            for query in queries:
-                docs = self._retrieve_documents(query)
-                all_documents.extend(docs)
+            # Perform multi-query retrieval, either every query or only as many as recall needs
+            fan_out_mode = input_data.get("fan_out", "all")
+            if fan_out_mode == "adaptive":
+                all_documents, fan_out = self._retrieve_adaptively(queries, int(input_data.get("max_queries", self.max_fan_out)),
+                                                                   cancel_event=cancel_event, doc_ids=doc_ids)
+            else:
+                all_documents = []
+                for query in queries:
+                    self._check_cancelled(cancel_event)
+                    docs = self._retrieve_documents(query, doc_ids=doc_ids)
+                    all_documents.extend(docs)
+                fan_out = {"mode": "all", "available": len(queries), "executed": len(queries)}
+            QUERIES_EXECUTED.observe(fan_out["executed"], fan_out=fan_out["mode"])
             
             # Remove duplicates and re-rank
-            unique_docs = self._remove_duplicates(all_documents)
+            unique_docs = self._remove_duplicates(all_documents, cancel_event)
             re_ranked_docs = self._re_rank_documents(unique_docs, original_query)
             
             # Select top documents
@@ -71,7 +122,8 @@ class AdaptiveRetrievalAgent(BaseAgent):
             response_data = {
                 "original_query": original_query,
                 "retrieved_documents": top_docs,
-                "total_queries_processed": len(queries),
+                "total_queries_processed": fan_out["executed"],
+                "fan_out": fan_out,
                 "total_documents_found": len(all_documents),
                 "unique_documents": len(unique_docs)
             }
@@ -79,15 +131,29 @@ class AdaptiveRetrievalAgent(BaseAgent):
             self.log_activity("retrieval_completed", response_data)
             return self.create_response(True, data=response_data)
             
+        except BranchCancelled:
+            self.log_activity("retrieval_cancelled", {"queries": input_data.get("queries", [])})
+            raise
         except Exception as e:
             self.log_activity("error", {"error": str(e)})
             return self.create_response(False, error=f"Error during retrieval: {str(e)}")
     
-    def _retrieve_documents(self, query: str, k: int = 15) -> List[Dict[str, Any]]:
-        """Retrieve documents for a single query"""
+    def _check_cancelled(self, cancel_event: Optional[threading.Event]):
+        if cancel_event is not None and cancel_event.is_set():
+            raise BranchCancelled()
+    
+    @timed_stage("faiss_search")
+    def _retrieve_documents(self, query: str, k: int = 15, doc_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Retrieve documents for a single query, only from chunks tagged with one of doc_ids if given"""
         try:
+            search_kwargs = {}
+            if doc_ids:
+                # Filter while searching, over every chunk in the index, so chunks of the requested
+                # documents that rank below the overall top k are still found
+                search_kwargs = {"filter": {"doc_id": {"$in": list(doc_ids)}},
+                                 "fetch_k": self.vectorstore.index.ntotal}
             # Vector similarity search
-            docs = self.vectorstore.similarity_search_with_score(query, k=k)
+            docs = self.vectorstore.similarity_search_with_score(query, k=k, **search_kwargs)
             
             # Convert to standardized format
             formatted_docs = []
@@ -106,12 +172,70 @@ class AdaptiveRetrievalAgent(BaseAgent):
             self.log_activity("retrieval_error", {"query": query, "error": str(e)})
             return []
     
-    def _remove_duplicates(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _retrieve_adaptively(self, queries: List[str], max_queries: int, k: int = 15,
+                             cancel_event: Optional[threading.Event] = None, doc_ids: Optional[List[str]] = None):
+        """Search the primary query first and further variants only while recall looks poor"""
+        all_documents, executed, seen = [], [], set()
+        stop_reason = "variants_exhausted"
+        for index, query in enumerate(queries):
+            if index >= max_queries:
+                stop_reason = "cap"
+                break
+            self._check_cancelled(cancel_event)
+            docs = self._retrieve_documents(query, k, doc_ids)
+            new_docs = sum(1 for doc in docs if doc["content"] not in seen)
+            seen.update(doc["content"] for doc in docs)
+            all_documents.extend(docs)
+            signal = self._recall_signal(docs, k)
+            executed.append({"query": query, "hits": len(docs), "new_documents": new_docs, **signal})
+            if signal["sufficient"]:
+                stop_reason = signal["reason"]
+                break
+            if index > 0 and new_docs == 0:
+                # The variant found nothing the earlier ones had not; more of the same will not help
+                stop_reason = "no_new_documents"
+                break
+        FAN_OUT_STOPS.inc(reason=stop_reason)
+        return all_documents, {
+            "mode": "adaptive",
+            "available": len(queries),
+            "executed": len(executed),
+            "cap": max_queries,
+            "stop_reason": stop_reason,
+            "queries": executed
+        }
+    
+    def _recall_signal(self, docs: List[Dict[str, Any]], k: int) -> Dict[str, Any]:
+        """Whether one query's results are good enough to skip the remaining variants.
+
+        Scores are FAISS distances (lower is better). A best match well below the median of the
+        results means the query landed on a distinct relevant region; a flat distribution means
+        it did not discriminate and other phrasings may recall more.
+        """
+        if not docs:
+            return {"sufficient": False, "reason": "no_results"}
+        distances = sorted(doc["similarity_score"] for doc in docs)
+        best, median = distances[0], distances[len(distances) // 2]
+        gap = 1.0 - best / median if median > 0 else 1.0
+        signal = {"best_distance": round(best, 4), "gap": round(gap, 4)}
+        if len(docs) < k:
+            # The whole index fits in one result page, so other variants can only reorder it
+            return {**signal, "sufficient": True, "reason": "index_exhausted"}
+        close_enough = self.fan_out_max_distance is None or best <= self.fan_out_max_distance
+        if gap >= self.fan_out_min_gap and close_enough:
+            return {**signal, "sufficient": True, "reason": "confident"}
+        return {**signal, "sufficient": False, "reason": "low_gap" if close_enough else "far_matches"}
+    
+    @timed_stage("remove_duplicates")
+    def _remove_duplicates(self, documents: List[Dict[str, Any]],
+                           cancel_event: Optional[threading.Event] = None) -> List[Dict[str, Any]]:
         """Remove duplicate or highly similar documents"""
         unique_docs = []
         seen_contents = set()
         
         for doc in documents:
+            # Pairwise comparison is the slow part of retrieval; stop it as soon as the result is unwanted
+            self._check_cancelled(cancel_event)
             content = doc["content"].strip().lower()
             
             # Check for exact duplicates
@@ -138,6 +262,7 @@ class AdaptiveRetrievalAgent(BaseAgent):
         
         return unique_docs
     
+    @timed_stage("rerank")
     def _re_rank_documents(self, documents: List[Dict[str, Any]], original_query: str) -> List[Dict[str, Any]]:
         """Re-rank documents based on multiple factors"""
         if not documents:
@@ -199,4 +324,5 @@ class AdaptiveRetrievalAgent(BaseAgent):
     def update_vectorstore(self, vectorstore: FAISS):
         """Update the vector store reference"""
         self.vectorstore = vectorstore
-        self.log_activity("vectorstore_updated", {"status": "success"}) 
\ No newline at end of file
+        self.index_version += 1
+        self.log_activity("vectorstore_updated", {"status": "success", "index_version": self.index_version}) 
\ No newline at end of file
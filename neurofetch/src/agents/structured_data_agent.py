@@ -1,5 +1,6 @@
 from typing import Dict, Any, List, Optional
 from .base_agent import BaseAgent
+from utils.metrics import timed_stage
 import camelot
 import pdfplumber
 from PyPDF2 import PdfReader
@@ -29,6 +30,10 @@ class StructuredDataExtractionAgent(BaseAgent):
             "performance", "results", "summary", "comparison", "analysis"
         ]
         
+        # Chat detection keywords
+        self.chat_keywords = ["chat", "conversation", "dialogue", "message", "speaker"]
+        
+    @timed_stage("process")
     def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Process PDF extraction requests for tables and chat data"""
         self.log_activity("processing_extraction", input_data)
@@ -92,6 +97,7 @@ class StructuredDataExtractionAgent(BaseAgent):
         result["message"] = "No tables found using available extraction methods."
         return result
     
+    @timed_stage("camelot")
     def _extract_with_camelot(self, pdf_path: str, pages: str) -> List[Dict[str, Any]]:
         """Extract tables using Camelot"""
         tables = []
@@ -133,6 +139,7 @@ class StructuredDataExtractionAgent(BaseAgent):
         
         return tables
     
+    @timed_stage("pdfplumber")
     def _extract_with_pdfplumber(self, pdf_path: str, pages: str) -> List[Dict[str, Any]]:
         """Extract tables using pdfplumber"""
         tables = []
@@ -164,6 +171,7 @@ class StructuredDataExtractionAgent(BaseAgent):
         
         return tables
     
+    @timed_stage("chat_extraction")
     def _extract_chat(self, pdf_path: str, pages: str = "all") -> Dict[str, Any]:
         """Extract chat/conversation data from PDF"""
         result = {
@@ -291,8 +299,7 @@ class StructuredDataExtractionAgent(BaseAgent):
             return "table"
         
         # Check for chat-related keywords
-        chat_keywords = ["chat", "conversation", "dialogue", "message", "speaker", "conversation"]
-        if any(keyword in query_lower for keyword in chat_keywords):
+        if any(keyword in query_lower for keyword in self.chat_keywords):
             return "chat"
         
         return "text"  # Default to regular text retrieval
@@ -0,0 +1,112 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import re
+
+WORD_RE = re.compile(r"\w+")
+# Key of a trie node that ends a term; words never match it because they are non-empty strings
+_TERM = ""
+
+class SynonymEngine:
+    """Word-level trie over a synonym dictionary, built once and matched in one pass per query.
+
+    Terms may span several words ("main city") and match case-insensitively on whole words only.
+    Where terms overlap, the longest one starting at the leftmost position wins, and text inserted
+    by a replacement is not matched again.
+    """
+
+    def __init__(self, mappings: Optional[Dict[str, List[str]]] = None):
+        self.root: Dict[str, dict] = {}
+        self.terms = 0
+        self.max_term_words = 0
+        self.logger = logging.getLogger("synonym_engine")
+        if mappings:
+            self.add_all(mappings.items())
+
+    def add(self, term: str, synonyms: List[str]):
+        words = WORD_RE.findall(term.lower())
+        synonyms = [synonym for synonym in synonyms if synonym.strip()]
+        if not words or not synonyms:
+            return
+        node = self.root
+        for word in words:
+            node = node.setdefault(word, {})
+        if _TERM not in node:
+            self.terms += 1
+        node[_TERM] = synonyms
+        self.max_term_words = max(self.max_term_words, len(words))
+
+    def add_all(self, entries: Iterable[Tuple[str, List[str]]]):
+        for term, synonyms in entries:
+            self.add(term, synonyms)
+
+    def find(self, text: str) -> List[Tuple[int, int, List[str]]]:
+        """(start, end, synonyms) for each term found in text, left to right, without overlaps"""
+        words = [(match.start(), match.end(), match.group().lower()) for match in WORD_RE.finditer(text)]
+        matches = []
+        i = 0
+        while i < len(words):
+            node = self.root
+            longest = None
+            j = i
+            # No term is longer than max_term_words, so stop looking ahead there
+            stop = min(len(words), i + self.max_term_words)
+            while j < stop:
+                node = node.get(words[j][2])
+                if node is None:
+                    break
+                j += 1
+                if _TERM in node:
+                    longest = (j, node[_TERM])
+            if longest is None:
+                i += 1
+                continue
+            end, synonyms = longest
+            matches.append((words[i][0], words[end - 1][1], synonyms))
+            i = end
+        return matches
+
+    def expand(self, text: str) -> str:
+        """Replace every term with its first synonym"""
+        parts = []
+        position = 0
+        for start, end, synonyms in self.find(text):
+            parts.append(text[position:start])
+            parts.append(synonyms[0])
+            position = end
+        if not parts:
+            return text
+        parts.append(text[position:])
+        return "".join(parts)
+
+    @classmethod
+    def from_file(cls, path: str, base: Optional[Dict[str, List[str]]] = None) -> "SynonymEngine":
+        """Load a dictionary file on top of the base mappings.
+
+        JSON files hold {"term": ["synonym", ...]}. Other files use the Solr synonyms format, one
+        entry per line: "term => synonym, synonym" maps the term, while "a, b, c" makes the words
+        synonyms of each other. Blank lines and lines starting with # are skipped.
+        """
+        engine = cls(base)
+        with open(path, "r", encoding="utf-8") as f:
+            if path.lower().endswith(".json"):
+                engine.add_all(json.load(f).items())
+            else:
+                engine.add_all(parse_solr_synonyms(f))
+        engine.logger.info(f"Loaded {engine.terms} synonym terms from {path}")
+        return engine
+
+def parse_solr_synonyms(lines: Iterable[str]) -> Iterable[Tuple[str, List[str]]]:
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "=>" in line:
+            terms, _, synonyms = line.partition("=>")
+            targets = [synonym.strip() for synonym in synonyms.split(",")]
+            for term in terms.split(","):
+                yield term.strip(), targets
+        else:
+            group = [term.strip() for term in line.split(",") if term.strip()]
+            for term in group:
+                yield term, [other for other in group if other != term]
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
 import tempfile
@@ -6,34 +6,63 @@ import pathlib
 import traceback
 import time
 import json
-import pandas as pd
-from PyPDF2 import PdfReader
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_ollama import OllamaLLM, OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationalRetrievalChain
+import threading
+from collections import deque
 import requests
 import logging
 
-# Import all agents
-from agents.structured_data_agent import StructuredDataExtractionAgent
-from agents.query_reformulation_agent import QueryReformulationAgent
-from agents.retrieval_agent import AdaptiveRetrievalAgent
+# Agents, pandas, PyPDF2 and LangChain are imported on first use so the app starts quickly
+from agents.registry import AgentRegistry
+from utils.answer_cache import SemanticAnswerCache
+from utils.lazy import LazyProxy
+from utils.warmup import WarmUp, steps_from_env, warm_embeddings, warm_table_extraction, warm_vector_index
+from utils.metrics import instrument_flask, timed
+from utils.tracing import bind, inject_headers, trace_flask
 
 app = Flask(__name__)
 CORS(app)
+# Request and per-stage latency histograms, served as Prometheus text on /metrics
+instrument_flask(app)
+# A span per request, continuing an incoming traceparent header; recent traces on /debug/traces
+trace_flask(app)
+
+# "chain" lets ConversationalRetrievalChain run its own retriever; "agent" answers from the
+# documents already ranked by the retrieval agent so each turn retrieves only once
+CHAT_PIPELINE = os.environ.get("NEUROFETCH_CHAT_PIPELINE", "chain")
+PIPELINE_CONTEXT_DOCS = 4
+# Which reformulated queries retrieval searches: "off" only the primary query, "all" every variant,
+# "adaptive" further variants only while the results so far look like poor recall
+QUERY_FANOUT = os.environ.get("NEUROFETCH_QUERY_FANOUT", "off")
+QUERY_FANOUT_CAP = int(os.environ.get("NEUROFETCH_QUERY_FANOUT_CAP", 3))
+# Prompt budget for the document context of each answer, in either pipeline
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("NEUROFETCH_CONTEXT_TOKENS", 800))
+
+# Bounds on what a long session keeps around
+MEMORY_TOKEN_BUDGET = int(os.environ.get("NEUROFETCH_MEMORY_TOKENS", 1500))
+MEMORY_MAX_MESSAGES = int(os.environ.get("NEUROFETCH_MEMORY_MESSAGES", 20))
+MAX_CHAT_HISTORY = int(os.environ.get("NEUROFETCH_CHAT_HISTORY_LIMIT", 200))
+# Skip the condense-question LLM call when a question does not refer back to earlier turns
+SKIP_CONDENSE = os.environ.get("NEUROFETCH_SKIP_CONDENSE", "0") == "1"
+# Answers are reused for questions whose embeddings are at least this similar on the same index
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("NEUROFETCH_ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_SIZE = int(os.environ.get("NEUROFETCH_ANSWER_CACHE_SIZE", 256))
 
 # Global variables to store conversation state
 conversation_chain = None
 vectorstore = None
 current_pdf_filename = None
-chat_history = []
+chat_history = deque(maxlen=MAX_CHAT_HISTORY)
 
-# Initialize all agents
-structured_agent = StructuredDataExtractionAgent()
-query_reformulation_agent = QueryReformulationAgent()
-retrieval_agent = AdaptiveRetrievalAgent()
+# Agents are constructed the first time a request touches them
+AGENTS = AgentRegistry()
+structured_agent = AGENTS.proxy("structured_data_extraction")
+query_reformulation_agent = AGENTS.proxy("query_reformulation")
+retrieval_agent = AGENTS.proxy("adaptive_retrieval")
+answer_cache = SemanticAnswerCache(
+    LazyProxy(lambda: retrieval_agent.embeddings),
+    threshold=ANSWER_CACHE_THRESHOLD,
+    max_entries=ANSWER_CACHE_SIZE
+)
 
 MCP_SERVER_URL = "http://localhost:8000/route_query"
 MCP_AGENTS_URL = "http://localhost:8000/agents"
@@ -48,6 +77,7 @@ def get_agent_display_name(agent_id):
         "structured_data_extraction": "📊 Structured Data Agent",
         "query_reformulation": "🔄 Query Reformulation Agent",
         "adaptive_retrieval": "🔍 Adaptive Retrieval Agent",
+        "answer_cache": "⚡ Answer Cache",
         "rag_system": "🤖 RAG System"
     }
     return agent_names.get(agent_id, f"Agent: {agent_id}")
@@ -70,6 +100,7 @@ def get_document_text_and_images(uploaded_files):
         loader = None
         try:
             if file_extension == ".pdf":
+                from PyPDF2 import PdfReader
                 pdf_reader = PdfReader(temp_file_path)
                 pdf_text = "".join(page.extract_text() or "" for page in pdf_reader.pages)
                 all_text += pdf_text + "\n"
@@ -102,6 +133,7 @@ def get_document_text_and_images(uploaded_files):
     return all_text, []
 
 def get_text_chunks(text):
+    from langchain.text_splitter import CharacterTextSplitter
     text_splitter = CharacterTextSplitter(
         separator="\n",
         chunk_size=1000,
@@ -112,23 +144,35 @@ def get_text_chunks(text):
 
 def get_vectorstore(text_chunks):
     try:
-        embeddings = OllamaEmbeddings(model="nomic-embed-text")
         if not text_chunks:
             print("No text chunks found to create vector store.")
             return None
-        return FAISS.from_texts(texts=text_chunks, embedding=embeddings)
+        from langchain_community.vectorstores import FAISS
+        # The shared client embeds repeated chunks once and joins identical in-flight calls
+        return FAISS.from_texts(texts=text_chunks, embedding=retrieval_agent.embeddings)
     except Exception as e:
         print(f"Error creating vector store: {e}")
         return None
 
 def get_conversation_chain(vectorstore):
     try:
+        from langchain_ollama import OllamaLLM
+        from langchain.chains import ConversationalRetrievalChain
+        from utils.chat_memory import TokenBudgetMemory
+        from utils.packed_retriever import PackedContextRetriever
         llm = OllamaLLM(model="llama3", temperature=0.5)
-        memory = ConversationBufferMemory(memory_key='chat_history', return_messages=True)
+        memory = TokenBudgetMemory(
+            memory_key='chat_history',
+            return_messages=True,
+            max_token_limit=MEMORY_TOKEN_BUDGET,
+            max_messages=MEMORY_MAX_MESSAGES
+        )
         if vectorstore:
             return ConversationalRetrievalChain.from_llm(
                 llm=llm,
-                retriever=vectorstore.as_retriever(),
+                # Chunks are packed before the chain stuffs them into its prompt
+                retriever=PackedContextRetriever(base_retriever=vectorstore.as_retriever(),
+                                                 token_budget=CONTEXT_TOKEN_BUDGET),
                 memory=memory
             )
         return None
@@ -136,6 +180,99 @@ def get_conversation_chain(vectorstore):
         print(f"Error creating conversation chain: {e}")
         return None
 
+def parse_flag(value, default=False):
+    """A boolean request field; strings count as true only for "1", "true" or "yes", so "false" and "0" are false"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    return bool(value)
+
+def format_answer(answer, agent_name, fetch_time):
+    generator = agent_name or "NeuroFetch"
+    return f"{answer}\n\n---\n*Response generated by {generator} in {fetch_time:.2f} seconds*"
+
+def chat_reply(payload, stream=False):
+    """Return a chat payload as JSON, or as a single final event in streaming mode"""
+    if stream:
+        from utils.streaming import format_sse
+        return Response(format_sse('done', payload), mimetype='text/event-stream')
+    return jsonify(payload)
+
+def answer_from_documents(final_query, packed_docs, config):
+    answer = conversation_chain.combine_docs_chain.invoke(
+        {'input_documents': packed_docs, 'question': final_query}, config=config
+    )['output_text']
+    # Keep the chain's memory in step so switching pipelines mid-conversation keeps the history
+    conversation_chain.memory.save_context({'question': final_query}, {'answer': answer})
+    return answer
+
+@timed("llm", "answer")
+def generate_answer(final_query, retrieved_documents=None, callbacks=None, skip_condense=False):
+    """Generate an answer with the conversation chain's own retriever, or from documents ranked by the retrieval agent"""
+    from utils.chat_memory import is_self_contained_question
+    from utils.packed_retriever import packed_documents
+    config = {'callbacks': callbacks} if callbacks else {}
+    if retrieved_documents is not None:
+        docs = packed_documents(retrieved_documents[:PIPELINE_CONTEXT_DOCS], final_query, CONTEXT_TOKEN_BUDGET)
+        return answer_from_documents(final_query, docs, config)
+    
+    if skip_condense and is_self_contained_question(final_query):
+        # Nothing to rewrite against the history, so go straight to retrieval; the retriever packs its results
+        docs = conversation_chain.retriever.invoke(final_query, config=config)
+        return answer_from_documents(final_query, docs, config)
+    
+    return conversation_chain.invoke({'question': final_query}, config=config)['answer']
+
+def stream_chat_answer(final_query, agent_id, agent_name, retrieved_documents=None, skip_condense=False, corpus_version=None):
+    """Run answer generation in a worker thread and yield its tokens as server-sent events"""
+    from utils.streaming import TokenStreamHandler, format_sse
+    handler = TokenStreamHandler(wait_for_retrieval=retrieved_documents is None)
+    result = {}
+
+    def run_chain():
+        try:
+            result['answer'] = generate_answer(final_query, retrieved_documents, callbacks=[handler], skip_condense=skip_condense)
+        except Exception as e:
+            traceback.print_exc()
+            result['error'] = str(e)
+        finally:
+            handler.finish()
+
+    start_time = time.time()
+    first_token_time = None
+    # The worker thread keeps the request's trace so the chain's spans nest under it
+    worker = threading.Thread(target=bind(run_chain), daemon=True)
+    worker.start()
+
+    for token in handler.tokens():
+        if first_token_time is None:
+            first_token_time = time.time() - start_time
+        yield format_sse('token', {'token': token})
+    worker.join()
+    fetch_time = time.time() - start_time
+
+    if 'error' in result:
+        yield format_sse('error', {'success': False, 'error': result['error']})
+        return
+
+    if corpus_version is not None:
+        answer_cache.store(final_query, corpus_version, result['answer'])
+    response_with_agent = format_answer(result['answer'], agent_name, fetch_time)
+    message = {'role': 'bot', 'content': response_with_agent}
+    payload = {'success': True, 'response': response_with_agent}
+    if agent_id and agent_name:
+        message.update({'agent_id': agent_id, 'agent_name': agent_name})
+        payload.update({'agent_id': agent_id, 'agent_name': agent_name})
+    chat_history.append(message)
+
+    payload['timings'] = {
+        # None when the LLM produced no incremental tokens
+        'time_to_first_token': round(first_token_time, 3) if first_token_time is not None else None,
+        'total': round(fetch_time, 3)
+    }
+    yield format_sse('done', payload)
+
 @app.route('/api/upload', methods=['POST'])
 def upload_files():
     global conversation_chain, vectorstore, current_pdf_filename, chat_history
@@ -171,7 +308,7 @@ def upload_files():
         retrieval_agent.update_vectorstore(vectorstore)
         
         # Reset chat history
-        chat_history = []
+        chat_history = deque(maxlen=MAX_CHAT_HISTORY)
         
         # Set current PDF filename if any PDF was uploaded
         for file in files:
@@ -200,6 +337,9 @@ def chat():
     try:
         data = request.get_json()
         user_question = data.get('message', '').strip()
+        stream = parse_flag(data.get('stream'))
+        pipeline = data.get('pipeline', CHAT_PIPELINE)
+        skip_condense = parse_flag(data.get('skip_condense'), SKIP_CONDENSE)
         
         if not user_question:
             return jsonify({'success': False, 'error': 'No message provided'}), 400
@@ -210,11 +350,11 @@ def chat():
         # Add user message to chat history
         chat_history.append({'role': 'user', 'content': user_question})
         
-        # Query reformulation
-        reformulated_query = query_reformulation_agent.process({
-            "query": user_question,
-            "context": "document_qa"
-        })
+        # Query reformulation; variants are only searched, and so only capped, when fan-out is on
+        reformulation_input = {"query": user_question, "context": "document_qa"}
+        if QUERY_FANOUT != "off":
+            reformulation_input["max_variants"] = QUERY_FANOUT_CAP
+        reformulated_query = query_reformulation_agent.process(reformulation_input)
         
         agent_id = None
         agent_name = None
@@ -247,6 +387,7 @@ def chat():
                 agent_name = get_agent_display_name(agent_id)
                 if result["success"]:
                     if data_type == "table" and result["data"].get("tables"):
+                        import pandas as pd
                         response_content = ""
                         for i, table in enumerate(result["data"]["tables"]):
                             df = pd.DataFrame(table["data"]) if isinstance(table, dict) and "data" in table else pd.DataFrame(table)
@@ -259,19 +400,42 @@ def chat():
                         response_content = f'No {data_type}s could be extracted from the PDF. (Agent: {agent_name})'
                         
                     chat_history.append({'role': 'bot', 'content': response_content, 'agent_id': agent_id, 'agent_name': agent_name})
-                    return jsonify({'success': True, 'response': response_content, 'agent_id': agent_id, 'agent_name': agent_name})
+                    return chat_reply({'success': True, 'response': response_content, 'agent_id': agent_id, 'agent_name': agent_name}, stream)
                 else:
                     response_content = f'Failed to extract {data_type}s.'
                     chat_history.append({'role': 'bot', 'content': response_content, 'agent_id': agent_id, 'agent_name': agent_name})
-                    return jsonify({'success': True, 'response': response_content, 'agent_id': agent_id, 'agent_name': agent_name})
+                    return chat_reply({'success': True, 'response': response_content, 'agent_id': agent_id, 'agent_name': agent_name}, stream)
+        
+        # Self-contained questions can be answered from the cache when the index has not changed
+        from utils.chat_memory import is_self_contained_question
+        corpus_version = None
+        if is_self_contained_question(final_query):
+            lookup_start = time.time()
+            corpus_version = retrieval_agent.index_version
+            cached_answer = answer_cache.lookup(final_query, corpus_version)
+            if cached_answer is not None:
+                conversation_chain.memory.save_context({'question': final_query}, {'answer': cached_answer})
+                agent_id = "answer_cache"
+                agent_name = get_agent_display_name(agent_id)
+                response_with_agent = format_answer(cached_answer, agent_name, time.time() - lookup_start)
+                chat_history.append({'role': 'bot', 'content': response_with_agent, 'agent_id': agent_id, 'agent_name': agent_name})
+                return chat_reply({'success': True, 'response': response_with_agent, 'agent_id': agent_id, 'agent_name': agent_name, 'cached': True}, stream)
         
         # Regular RAG processing
+        search_queries = [final_query]
+        if QUERY_FANOUT != "off" and reformulated_query["success"]:
+            search_queries = reformulated_query["data"]["reformulated_queries"] or search_queries
         retrieval_result = retrieval_agent.process({
-            "queries": [final_query],
-            "original_query": final_query
+            "queries": search_queries,
+            "original_query": final_query,
+            "fan_out": "adaptive" if QUERY_FANOUT == "adaptive" else "all",
+            "max_queries": QUERY_FANOUT_CAP
         })
         
+        retrieved_documents = None
         if retrieval_result["success"]:
+            if pipeline == "agent" and retrieval_result["data"]["retrieved_documents"]:
+                retrieved_documents = retrieval_result["data"]["retrieved_documents"]
             agent_id = retrieval_result.get("agent_id", "adaptive_retrieval")
             agent_name = get_agent_display_name(agent_id)
             chat_history.append({
@@ -284,19 +448,27 @@ def chat():
             agent_id = None
             agent_name = None
         
+        if stream:
+            return Response(
+                stream_with_context(stream_chat_answer(final_query, agent_id, agent_name, retrieved_documents, skip_condense, corpus_version)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        
         # Generate response
         start_time = time.time()
-        response = conversation_chain({'question': final_query})
+        response_content = generate_answer(final_query, retrieved_documents, skip_condense=skip_condense)
         end_time = time.time()
         fetch_time = end_time - start_time
+        if corpus_version is not None:
+            answer_cache.store(final_query, corpus_version, response_content)
         
-        response_content = response['answer']
         if agent_id and agent_name:
-            response_with_agent = f"{response_content}\n\n---\n*Response generated by {agent_name} in {fetch_time:.2f} seconds*"
+            response_with_agent = format_answer(response_content, agent_name, fetch_time)
             chat_history.append({'role': 'bot', 'content': response_with_agent, 'agent_id': agent_id, 'agent_name': agent_name})
             return jsonify({'success': True, 'response': response_with_agent, 'agent_id': agent_id, 'agent_name': agent_name})
         else:
-            response_with_agent = f"{response_content}\n\n---\n*Response generated by NeuroFetch in {fetch_time:.2f} seconds*"
+            response_with_agent = format_answer(response_content, None, fetch_time)
             chat_history.append({'role': 'bot', 'content': response_with_agent})
             return jsonify({'success': True, 'response': response_with_agent})
         
@@ -307,12 +479,20 @@ def chat():
 
 @app.route('/api/chat-history', methods=['GET'])
 def get_chat_history():
-    return jsonify({'success': True, 'history': chat_history})
+    return jsonify({'success': True, 'history': list(chat_history)})
+
+@app.route('/api/cache-stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({
+        'success': True,
+        'answer_cache': answer_cache.stats(),
+        'embedding_coalescing': retrieval_agent.embeddings.stats() if retrieval_agent.loaded else {}
+    })
 
 @app.route('/api/clear-chat', methods=['POST'])
 def clear_chat():
     global chat_history, conversation_chain, vectorstore, current_pdf_filename
-    chat_history = []
+    chat_history = deque(maxlen=MAX_CHAT_HISTORY)
     conversation_chain = None
     vectorstore = None
     current_pdf_filename = None
@@ -320,8 +500,52 @@ def clear_chat():
 
 @app.route('/agents', methods=['GET'])
 def agents():
-    resp = requests.get(MCP_AGENTS_URL)
-    return jsonify(resp.json())
+    # The MCP server answers from its cached probe results, so a short timeout is plenty
+    try:
+        resp = requests.get(MCP_AGENTS_URL, headers=inject_headers(), timeout=2)
+        return jsonify(resp.json())
+    except requests.RequestException as e:
+        return jsonify({'success': False, 'error': f'MCP server unavailable: {e}'}), 503
+
+# Warm-up pays for the model loads, FAISS and camelot before the first user request does
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+WARMUP_LLM_TIMEOUT = float(os.environ.get("NEUROFETCH_WARMUP_LLM_TIMEOUT", 300))
+
+def warm_agents():
+    for name in AGENTS:
+        AGENTS.get(name)
+    return {'load_times_s': dict(AGENTS.load_times)}
+
+def warm_llm():
+    # An empty prompt makes Ollama load the model without generating anything
+    resp = requests.post(f"{OLLAMA_URL}/api/generate", json={'model': 'llama3', 'prompt': '', 'stream': False},
+                         timeout=WARMUP_LLM_TIMEOUT)
+    resp.raise_for_status()
+    return {'model': 'llama3'}
+
+warmup = WarmUp(
+    steps_from_env({
+        'agents': warm_agents,
+        'llm': warm_llm,
+        'embeddings': lambda: warm_embeddings(retrieval_agent.embeddings),
+        'index': lambda: warm_vector_index(retrieval_agent.embeddings),
+        'table_extraction': lambda: warm_table_extraction(structured_agent)
+    }),
+    retry_interval=float(os.environ.get("NEUROFETCH_WARMUP_RETRY", 30))
+)
+
+# Liveness says the process is serving; readiness says it is warm enough to receive traffic
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    return jsonify({'status': 'ok'})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    warmup.start()
+    return jsonify(warmup.status()), 200 if warmup.ready else 503
 
 if __name__ == '__main__':
+    # Only the reloader's serving child warms up, in the background so the port binds immediately
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warmup.start()
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -0,0 +1,327 @@
+"""Microbenchmarks for the agents' hot helper functions, checked against a stored baseline.
+
+Each case runs one function on generated inputs at several sizes, calibrates how many calls fit
+in --min-time seconds and takes the median of --repeat runs as the time per call. Results are
+compared with the baseline file: a case whose median got slower than its baseline by more than the
+threshold (0.5 = 50% slower; --fast-threshold for cases under a millisecond, whose timings are
+noisier) is measured again, and fails the run with exit status 1 only if it regresses every time.
+Record a new baseline after an intended change with --update-baseline; it keeps the median of
+--baseline-rounds measurements of each case, so one lucky run does not set the bar.
+
+Right before each case a fixed calibration loop is timed too, and stored with the case in the
+baseline. Baseline times are always scaled by the ratio of the current calibration time to the
+recorded one, which absorbs a different machine as well as one that is throttled or busy for a
+while. The baseline also records the machine (CPU, core count, OS and Python version); a baseline
+without calibration times that was recorded on a different machine is only reported, never failed
+against.
+
+    python -m benchmarks.agent_microbench
+    python -m benchmarks.agent_microbench --only remove_duplicates --threshold 0.1
+    python -m benchmarks.agent_microbench --update-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Tuple
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "agent_microbench.json")
+
+WORDS = ["revenue", "capital", "financial", "report", "data", "process", "system", "latency", "inventory",
+         "churn", "quarter", "growth", "margin", "customer", "support", "pricing", "security", "the", "of",
+         "and", "for", "with", "team", "review", "forecast", "budget", "region", "policy", "metric", "audit"]
+SPEAKERS = ["User", "Admin", "Agent", "Alice Smith", "Bob", "Support"]
+SOURCES = ["report.pdf", "notes.txt", "readme.md", "sales.csv", "memo.docx", "unknown"]
+
+def words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+# Each builder takes the agents, a seeded rng and a size, and returns the call to time
+
+def reformulate_case(agents, rng: random.Random, size: int) -> Callable[[], Any]:
+    """size words per query, across the intents _reformulate_query branches on"""
+    agent = agents["query_reformulation"]
+    prefixes = ["what is", "how to", "compare", "explain", "find", "list", ""]
+    queries = []
+    for i in range(20):
+        query = f"{prefixes[i % len(prefixes)]} {words(rng, size)}".strip()
+        queries.append((query, agent._analyze_intent(query)))
+
+    def run():
+        for query, intent in queries:
+            agent._reformulate_query(query, intent)
+    return run
+
+def retrieved_documents(rng: random.Random, count: int) -> List[Dict[str, Any]]:
+    """Chunks as _retrieve_documents returns them: every third one repeats an earlier chunk with an
+    edit, the way results for several reformulated queries overlap"""
+    documents = []
+    for i in range(count):
+        if i % 3 == 2:
+            content = documents[rng.randrange(len(documents))]["content"]
+            cut = rng.randrange(len(content))
+            content = content[:cut] + words(rng, 8) + content[cut:]
+        else:
+            content = ". ".join(words(rng, 12) for _ in range(rng.randint(4, 12))) + "."
+        source = rng.choice(SOURCES)
+        documents.append({
+            "content": content,
+            "metadata": {"source": source},
+            "similarity_score": rng.uniform(0.2, 1.5),
+            "source": source,
+            "page": 0
+        })
+    return documents
+
+def remove_duplicates_case(agents, rng: random.Random, size: int) -> Callable[[], Any]:
+    agent = agents["adaptive_retrieval"]
+    documents = retrieved_documents(rng, size)
+    return lambda: agent._remove_duplicates(documents)
+
+def re_rank_case(agents, rng: random.Random, size: int) -> Callable[[], Any]:
+    agent = agents["adaptive_retrieval"]
+    documents = retrieved_documents(rng, size)
+    query = words(rng, 6)
+    return lambda: agent._re_rank_documents(documents, query)
+
+def chat_text(rng: random.Random, lines: int) -> str:
+    """A page of chat in the formats chat_patterns recognise, with wrapped continuation lines"""
+    out = []
+    for i in range(lines):
+        speaker = rng.choice(SPEAKERS)
+        kind = i % 6
+        if kind == 0:
+            out.append(f"{rng.randint(0, 23)}:{rng.randint(10, 59)} - {speaker}: {words(rng, 10)}")
+        elif kind == 1:
+            out.append(f"[{speaker}]: {words(rng, 10)}")
+        elif kind == 2:
+            out.append(f"{rng.randint(1, 28)}/{rng.randint(1, 12)}/2024 {rng.randint(0, 23)}:{rng.randint(10, 59)} {speaker}: {words(rng, 8)}")
+        elif kind == 3:
+            out.append(f"{speaker}: {words(rng, 12)}")
+        elif kind == 4:
+            out.append(words(rng, 14))
+        else:
+            out.append("")
+    return "\n".join(out)
+
+def chat_lines_case(agents, rng: random.Random, size: int) -> Callable[[], Any]:
+    agent = agents["structured_data_extraction"]
+    text = chat_text(rng, size)
+    return lambda: agent._extract_chat_lines(text, 1)
+
+def pages_case(agents, rng: random.Random, size: int) -> Callable[[], Any]:
+    """size pages in the document, asked for in each pages syntax the API accepts"""
+    agent = agents["structured_data_extraction"]
+    pdf = SimpleNamespace(pages=[None] * size)
+    requests = ["all", f"1-{size}", ",".join(str(p) for p in range(1, size + 1, 2)), str(size), "bad"]
+
+    def run():
+        for pages in requests:
+            agent._get_pages_to_process(pdf, pages)
+    return run
+
+def header_case(agents, rng: random.Random, size: int) -> Callable[[], Any]:
+    """100 table rows of size cells: short header-like labels, long text and empty cells"""
+    agent = agents["structured_data_extraction"]
+    rows = []
+    for _ in range(100):
+        rows.append([rng.choice(["", rng.choice(WORDS).title(), words(rng, 6), str(rng.randint(0, 10 ** 6))])
+                     for _ in range(size)])
+
+    def run():
+        for row in rows:
+            agent._looks_like_header(row)
+    return run
+
+# name -> (builder, sizes); names are stable because baselines are keyed on them
+CASES: Dict[str, Tuple[Callable, Tuple[int, ...]]] = {
+    "query_reformulation._reformulate_query": (reformulate_case, (5, 25, 100)),
+    "adaptive_retrieval._remove_duplicates": (remove_duplicates_case, (15, 45, 75)),
+    "adaptive_retrieval._re_rank_documents": (re_rank_case, (15, 75, 300)),
+    "structured_data_extraction._extract_chat_lines": (chat_lines_case, (50, 500, 5000)),
+    "structured_data_extraction._get_pages_to_process": (pages_case, (10, 100, 1000)),
+    "structured_data_extraction._looks_like_header": (header_case, (5, 20, 100)),
+}
+
+def calibration_loop():
+    """Fixed pure-Python work like the cases' (splitting, counting, sorting), timed next to each case
+    to scale its baseline to how fast the CPU runs at the moment"""
+    counts: Dict[str, int] = {}
+    for i in range(200):
+        for word in f"{WORDS[i % len(WORDS)]} {' '.join(WORDS[:12])} item {i}".lower().split():
+            counts[word] = counts.get(word, 0) + 1
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+def build_agents() -> Dict[str, Any]:
+    from agents.registry import AgentRegistry
+    registry = AgentRegistry()
+    return {name: registry.get(name) for name in ("query_reformulation", "adaptive_retrieval", "structured_data_extraction")}
+
+def measure(fn: Callable[[], Any], min_time: float, repeat: int) -> Dict[str, Any]:
+    """Seconds per call: calibrate a loop count that runs for at least min_time, keep the fastest repeat"""
+    fn()
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    runs = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - started) / number)
+    runs.sort()
+    return {"best_s": runs[0], "median_s": runs[len(runs) // 2], "loops": number}
+
+def run_cases(agents, only: List[str], min_time: float, repeat: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    """Measure every case whose key contains one of only (all cases when only is empty)"""
+    results = {}
+    for name, (builder, sizes) in CASES.items():
+        for size in sizes:
+            key = f"{name}[{size}]"
+            if only and not any(part in key for part in only):
+                continue
+            fn = builder(agents, random.Random(f"{seed}-{key}"), size)
+            calibration_s = calibrate(min_time, repeat)
+            results[key] = {**measure(fn, min_time, repeat), "calibration_s": calibration_s}
+            print(f"{key:60s} {1e6 * results[key]['median_s']:12.1f} us", file=sys.stderr)
+    return results
+
+def normalized(result: Dict[str, Any]) -> float:
+    """Median time per call in units of the calibration loop"""
+    return result["median_s"] / result["calibration_s"]
+
+def scale_for(result: Dict[str, Any], base: Dict[str, Any]) -> float:
+    """How much slower the CPU ran the calibration loop for this result than for its baseline"""
+    if not base.get("calibration_s"):
+        return 1.0
+    return result["calibration_s"] / base["calibration_s"]
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float,
+            fast_threshold: float, overrides: Dict[str, float]) -> List[Dict[str, Any]]:
+    """One row per case; a case regresses when its median exceeds the baseline median, scaled by the
+    calibration loop, by more than its threshold"""
+    rows = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        row = {"case": key, "median_us": round(1e6 * result["median_s"], 3)}
+        if base is None:
+            row["status"] = "new"
+        else:
+            expected = base["median_s"] * scale_for(result, base)
+            default = fast_threshold if expected < 1e-3 else threshold
+            limit = next((value for name, value in overrides.items() if name in key), default)
+            change = result["median_s"] / expected - 1
+            row.update(baseline_us=round(1e6 * expected, 3), change=round(change, 3), threshold=limit,
+                       status="regressed" if change > limit else "improved" if change < -limit else "ok")
+        rows.append(row)
+    return rows
+
+def calibrate(min_time: float, repeat: int) -> float:
+    return measure(calibration_loop, max(min_time, 0.2), repeat)["median_s"]
+
+def cpu_model() -> str:
+    """The CPU's model name; platform.processor() is empty or just the architecture on Linux"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.partition(":")[2].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+def machine() -> Dict[str, Any]:
+    return {"python": platform.python_version(), "machine": platform.machine(), "processor": platform.processor(),
+            "system": platform.system(), "platform": platform.platform(), "cpu": cpu_model(), "cpus": os.cpu_count()}
+
+def parse_override(value: str) -> Tuple[str, float]:
+    name, _, limit = value.rpartition("=")
+    if not name:
+        raise argparse.ArgumentTypeError(f"Expected NAME=THRESHOLD, got {value!r}")
+    return name, float(limit)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", default=[], help="Run cases whose name contains any of these")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("NEUROFETCH_BENCH_THRESHOLD", 0.5)),
+                        help="Allowed slowdown as a fraction of the baseline time")
+    parser.add_argument("--fast-threshold", type=float,
+                        default=float(os.environ.get("NEUROFETCH_BENCH_FAST_THRESHOLD", 1.0)),
+                        help="Allowed slowdown for cases whose baseline is under a millisecond")
+    parser.add_argument("--confirm", type=int, default=2,
+                        help="Times a regressed case is measured again; it fails only if it regresses every time")
+    parser.add_argument("--case-threshold", type=parse_override, action="append", default=[],
+                        metavar="NAME=THRESHOLD", help="Threshold for cases whose name contains NAME")
+    parser.add_argument("--baseline-rounds", type=int, default=3,
+                        help="Measurements of each case whose median --update-baseline stores")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    agents = build_agents()
+    results = run_cases(agents, args.only, args.min_time, args.repeat, args.seed)
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+
+    if args.update_baseline:
+        rounds = [results] + [run_cases(agents, args.only, args.min_time, args.repeat, args.seed)
+                              for _ in range(args.baseline_rounds - 1)]
+        for key in results:
+            samples = sorted((round_[key] for round_ in rounds), key=normalized)
+            results[key] = samples[len(samples) // 2]
+        # Keep baselines of cases that were not run this time
+        cases = {**stored.get("cases", {}), **results}
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": machine(), "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "cases": cases}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(json.dumps({"baseline": args.baseline, "cases": len(results)}, indent=2))
+        return
+
+    enforce = True
+    baseline = stored.get("cases", {})
+    report = {"machine": machine(), "baseline_machine": stored.get("machine")}
+    if stored and stored.get("machine") != machine():
+        if all(case.get("calibration_s") for case in baseline.values()):
+            report["warning"] = "Baseline was recorded on a different machine; its times are scaled by the calibration loop"
+        else:
+            enforce = False
+            report["warning"] = ("Baseline was recorded on a different machine without calibration times; "
+                                 "regressions are reported but do not fail the run")
+    overrides = dict(args.case_threshold)
+    rows = compare(results, baseline, args.threshold, args.fast_threshold, overrides)
+    for _ in range(args.confirm):
+        regressed = [row["case"] for row in rows if row["status"] == "regressed"]
+        if not regressed:
+            break
+        # Noise rarely hits the same case twice; measure the regressed ones again and keep the faster run
+        retry = run_cases(agents, regressed, args.min_time, args.repeat, args.seed)
+        retry = {key: min(results[key], retry[key], key=normalized) for key in regressed}
+        results.update(retry)
+        retried = {row["case"]: row for row in compare(retry, baseline, args.threshold, args.fast_threshold, overrides)}
+        rows = [retried.get(row["case"], row) for row in rows]
+    report["results"] = rows
+    print(json.dumps(report, indent=2))
+    regressed = [row["case"] for row in rows if row["status"] == "regressed"]
+    if regressed:
+        print(f"Regressed past threshold: {regressed}", file=sys.stderr)
+        if enforce:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Compare /api/chat latency between the "chain" and "agent" chat pipelines.
+
+Run from the src directory with Ollama available:
+
+    python -m benchmarks.chat_pipeline_latency --files report.pdf --questions "What is the revenue?"
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from langchain_core.embeddings import Embeddings
+
+import app as backend
+
+DEFAULT_QUESTIONS = [
+    "What is this document about?",
+    "Summarize the main findings",
+    "Which process is described in the document?",
+]
+
+class CountingEmbeddings(Embeddings):
+    """Wraps an embeddings client and counts query embeddings"""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+        self.query_calls = 0
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        return self.inner.embed_query(text)
+
+def upload(client, file_paths):
+    files = [(open(path, "rb"), os.path.basename(path)) for path in file_paths]
+    try:
+        response = client.post("/api/upload", data={"files": files}, content_type="multipart/form-data")
+    finally:
+        for handle, _ in files:
+            handle.close()
+    if not response.json.get("success"):
+        raise RuntimeError(f"Upload failed: {response.json}")
+
+def run_pipeline(client, pipeline, questions, rounds):
+    counter = CountingEmbeddings(backend.vectorstore.embedding_function)
+    backend.vectorstore.embedding_function = counter
+    backend.conversation_chain.memory.clear()
+    latencies = []
+    try:
+        for _ in range(rounds):
+            for question in questions:
+                start = time.perf_counter()
+                response = client.post("/api/chat", json={"message": question, "pipeline": pipeline})
+                latencies.append(time.perf_counter() - start)
+                if not response.json.get("success"):
+                    raise RuntimeError(f"Chat failed: {response.json}")
+    finally:
+        backend.vectorstore.embedding_function = counter.inner
+    return {
+        "pipeline": pipeline,
+        "turns": len(latencies),
+        "mean_s": round(statistics.mean(latencies), 3),
+        "median_s": round(statistics.median(latencies), 3),
+        "max_s": round(max(latencies), 3),
+        "query_embeddings_per_turn": round(counter.query_calls / len(latencies), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", nargs="+", required=True, help="Documents to upload before chatting")
+    parser.add_argument("--questions", nargs="+", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    client = backend.app.test_client()
+    upload(client, args.files)
+    results = [run_pipeline(client, pipeline, args.questions, args.rounds) for pipeline in ("chain", "agent")]
+    chain, agent = results
+    print(json.dumps({
+        "results": results,
+        "mean_speedup": round(chain["mean_s"] / agent["mean_s"], 2) if agent["mean_s"] else None,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
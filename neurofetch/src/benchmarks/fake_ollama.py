@@ -0,0 +1,174 @@
+"""Deterministic stand-in for the Ollama HTTP API, for benchmarks and offline runs.
+
+Implements /api/generate and /api/chat (streaming NDJSON over chunked encoding or a single
+JSON body), /api/embed, /api/embeddings and /api/tags with configurable latencies.
+
+    python -m benchmarks.fake_ollama --port 11435 --token-latency 0.02 --embed-latency 0.005
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+class FakeOllamaServer:
+    """Minimal HTTP/1.1 keep-alive server that answers like Ollama"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, first_token_latency: float = 0.05,
+                 token_latency: float = 0.01, embed_latency: float = 0.005, answer_tokens: int = 30,
+                 embedding_dim: int = 64):
+        self.host = host
+        self.port = port
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.embed_latency = embed_latency
+        self.answer_tokens = answer_tokens
+        self.embedding_dim = embedding_dim
+        self.requests: Dict[str, int] = {}
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    # Deterministic model behaviour
+
+    def answer_for(self, prompt: str) -> List[str]:
+        words = [word for word in prompt.split() if word.isalnum()][-8:] or ["nothing"]
+        tokens = ["Based", " on", " the", " context,"]
+        while len(tokens) < self.answer_tokens:
+            tokens.append(" " + words[len(tokens) % len(words)])
+        return tokens[:self.answer_tokens]
+
+    def embed_text(self, text: str) -> List[float]:
+        vector = [0.0] * self.embedding_dim
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode()).digest()
+            vector[int.from_bytes(digest[:4], "big") % self.embedding_dim] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    # HTTP handling
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                payload = json.loads(body) if body else {}
+                self.requests[path] = self.requests.get(path, 0) + 1
+                await self._route(method, path, payload, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, payload: Dict[str, Any], writer: asyncio.StreamWriter):
+        model = payload.get("model", "llama3")
+        if path == "/api/tags":
+            await self._send_json(writer, {"models": [{"name": "llama3:latest"}, {"name": "nomic-embed-text:latest"}]})
+        elif path in ("/api/generate", "/api/chat"):
+            if path == "/api/chat":
+                prompt = " ".join(message.get("content", "") for message in payload.get("messages", []))
+            else:
+                prompt = payload.get("prompt", "")
+            await self._generate(writer, path, model, prompt, payload.get("stream", True))
+        elif path == "/api/embed":
+            inputs = payload.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            await asyncio.sleep(self.embed_latency * max(1, len(inputs)))
+            await self._send_json(writer, {"model": model, "embeddings": [self.embed_text(text) for text in inputs]})
+        elif path == "/api/embeddings":
+            await asyncio.sleep(self.embed_latency)
+            await self._send_json(writer, {"embedding": self.embed_text(payload.get("prompt", ""))})
+        else:
+            await self._send_json(writer, {"error": f"unknown path {path}"}, status="404 Not Found")
+
+    async def _generate(self, writer, path, model, prompt, stream):
+        tokens = self.answer_for(prompt)
+        started = time.perf_counter()
+
+        def chunk(text, done):
+            body = {"model": model, "created_at": "2024-01-01T00:00:00Z", "done": done}
+            if path == "/api/chat":
+                body["message"] = {"role": "assistant", "content": text}
+            else:
+                body["response"] = text
+            if done:
+                body.update({"done_reason": "stop", "eval_count": len(tokens),
+                             "total_duration": int((time.perf_counter() - started) * 1e9)})
+            return body
+
+        await asyncio.sleep(self.first_token_latency)
+        if not stream:
+            await asyncio.sleep(self.token_latency * (len(tokens) - 1))
+            await self._send_json(writer, chunk("".join(tokens), True))
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            self._write_chunk(writer, json.dumps(chunk(token, False)).encode() + b"\n")
+            await writer.drain()
+        self._write_chunk(writer, json.dumps(chunk("", True)).encode() + b"\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def _write_chunk(self, writer, data: bytes):
+        writer.writelines((f"{len(data):x}\r\n".encode(), data, b"\r\n"))
+
+    async def _send_json(self, writer, payload, status="200 OK"):
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--embed-latency", type=float, default=0.005)
+    parser.add_argument("--answer-tokens", type=int, default=30)
+    parser.add_argument("--embedding-dim", type=int, default=64)
+    args = parser.parse_args()
+    server = FakeOllamaServer(args.host, args.port, args.first_token_latency, args.token_latency,
+                              args.embed_latency, args.answer_tokens, args.embedding_dim)
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}")
+    asyncio.run(server.serve_forever())
+
+if __name__ == "__main__":
+    main()
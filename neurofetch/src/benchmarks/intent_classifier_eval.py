@@ -0,0 +1,121 @@
+"""Evaluate the local intent classifier: cross-validated accuracy, LLM fallback rate and latency.
+
+Run from the src directory:
+
+    python -m benchmarks.intent_classifier_eval --folds 5 --threshold 0.8
+    python -m benchmarks.intent_classifier_eval --log intent_log.jsonl --save-model intent_model.json
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+
+from agents.intent_classifier import IntentClassifier, DEFAULT_EXAMPLES_PATH
+from agents.query_reformulation_agent import QueryReformulationAgent
+from agents.structured_data_agent import StructuredDataExtractionAgent
+
+# How the existing rule-based helpers map onto the routing labels
+RULE_LABELS = {"definition": "definition", "comparison": "comparison"}
+
+def rules_only(query, query_agent, structured_agent):
+    data_type = structured_agent.detect_data_type(query)
+    if data_type in ("table", "chat"):
+        return data_type
+    return RULE_LABELS.get(query_agent._analyze_intent(query), "retrieval")
+
+def stratified_folds(examples, folds):
+    by_label = defaultdict(list)
+    for example in examples:
+        by_label[example["intent"]].append(example)
+    rng = random.Random(0)
+    buckets = [[] for _ in range(folds)]
+    for items in by_label.values():
+        rng.shuffle(items)
+        for i, example in enumerate(items):
+            buckets[i % folds].append(example)
+    return buckets
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--examples", default=DEFAULT_EXAMPLES_PATH)
+    parser.add_argument("--log", help="Queries labelled by the LLM fallback, used as extra training data")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--latency-rounds", type=int, default=20)
+    parser.add_argument("--save-model", help="Train on all examples and write the model here")
+    args = parser.parse_args()
+
+    query_agent = QueryReformulationAgent()
+    structured_agent = StructuredDataExtractionAgent()
+
+    def build(examples_path=args.examples, log_path=args.log):
+        return IntentClassifier(
+            query_agent.query_patterns, structured_agent.table_keywords, structured_agent.chat_keywords,
+            examples_path=examples_path, log_path=log_path
+        )
+
+    classifier = build()
+    examples = classifier.load_examples()
+    buckets = stratified_folds(examples, args.folds)
+
+    correct = 0
+    confident = 0
+    confident_correct = 0
+    per_label = Counter()
+    per_label_correct = Counter()
+    for i, test in enumerate(buckets):
+        train = [example for j, bucket in enumerate(buckets) if j != i for example in bucket]
+        classifier.train(train)
+        for example in test:
+            label, confidence = classifier.predict(example["query"])
+            hit = label == example["intent"]
+            correct += hit
+            per_label[example["intent"]] += 1
+            per_label_correct[example["intent"]] += hit
+            if confidence >= args.threshold:
+                confident += 1
+                confident_correct += hit
+
+    rule_correct = sum(
+        rules_only(example["query"], query_agent, structured_agent) == example["intent"] for example in examples
+    )
+
+    classifier.train(examples)
+    latencies = []
+    for _ in range(args.latency_rounds):
+        for example in examples:
+            start = time.perf_counter()
+            classifier.predict(example["query"])
+            latencies.append((time.perf_counter() - start) * 1e6)
+
+    if args.save_model:
+        classifier.save(args.save_model)
+
+    total = len(examples)
+    print(json.dumps({
+        "examples": total,
+        "folds": args.folds,
+        "accuracy": round(correct / total, 4),
+        "rules_only_accuracy": round(rule_correct / total, 4),
+        "per_label_accuracy": {
+            label: round(per_label_correct[label] / per_label[label], 4) for label in sorted(per_label)
+        },
+        "threshold": args.threshold,
+        "local_coverage": round(confident / total, 4),
+        "local_accuracy_above_threshold": round(confident_correct / confident, 4) if confident else None,
+        "llm_fallback_rate": round(1 - confident / total, 4),
+        "latency_us": {
+            "p50": round(statistics.median(latencies), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "max": round(max(latencies), 1)
+        }
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
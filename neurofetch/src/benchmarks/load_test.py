@@ -0,0 +1,361 @@
+"""Open-loop load generator for /api/chat, /api/upload (app.py) and /route_query (mcp_server.py).
+
+Requests arrive on a schedule of stages, each a duration and a rate in requests/s that can ramp
+linearly, regardless of how fast the servers answer; at most --concurrency are in flight and the
+rest wait in the client queue. Latency is measured from each request's scheduled arrival, so time
+spent queued behind a saturated server counts instead of hiding it. The report gives throughput,
+error rate and latency percentiles per time window, per request kind and overall, as JSON.
+
+With --spawn the fake Ollama server, app.py and the MCP Flask app are started as subprocesses on
+free local ports, so the run is fully offline; otherwise point --app-url/--mcp-url at running servers.
+
+    python -m benchmarks.load_test --spawn --stages 20:2 40:2-20 20:20 --concurrency 16
+    python -m benchmarks.load_test --app-url http://localhost:5000 --mcp-url http://localhost:8000 \\
+        --mix chat=6,table=1,chat_extraction=1,route=4 --stages 60:5
+"""
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from utils.synthetic_pdf import write_pdf
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOPICS = ["revenue", "latency", "inventory", "churn", "compliance", "hiring", "pricing", "security"]
+SPEAKERS = ["Alice", "Bob", "Support", "Customer"]
+REQUEST_KINDS = ("chat", "table", "chat_extraction", "upload", "route")
+DEFAULT_MIX = "chat=6,table=1,chat_extraction=1,upload=1,route=4"
+
+# Entry points for --spawn; each serves on the port given as its first argument
+APP_MAIN = "import sys, app; app.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"
+MCP_MAIN = (
+    "import sys; import mcp.mcp_server as server; "
+    "server.run_on_mcp_loop(server.start_mcp_listener()).result(); "
+    "server.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"
+)
+
+def parse_stages(values: List[str]) -> List[Tuple[float, float, float]]:
+    """DURATION:RATE holds a rate, DURATION:START-END ramps it linearly; rates are requests/s"""
+    stages = []
+    for value in values:
+        duration, _, rates = value.partition(":")
+        start, _, end = rates.partition("-")
+        try:
+            stages.append((float(duration), float(start), float(end or start)))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Bad stage {value!r}; expected DURATION:RATE or DURATION:START-END")
+    return stages
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in REQUEST_KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown request kind {kind!r}; choose from {sorted(REQUEST_KINDS)}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+def arrival_times(stages: List[Tuple[float, float, float]], poisson: bool, rng: random.Random) -> List[float]:
+    """Offsets in seconds at which requests are due; the rate is re-evaluated at every arrival"""
+    times, offset = [], 0.0
+    for duration, start_rate, end_rate in stages:
+        t = 0.0
+        while True:
+            rate = start_rate + (end_rate - start_rate) * t / duration if duration else start_rate
+            if rate <= 0:
+                t += 0.1
+            else:
+                t += rng.expovariate(rate) if poisson else 1.0 / rate
+            if t >= duration:
+                break
+            if rate > 0:
+                times.append(offset + t)
+        offset += duration
+    return times
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))]
+
+def latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    def ms(value):
+        return round(1000 * value, 1) if value is not None else None
+    return {"p50_ms": ms(percentile(latencies, 50)), "p95_ms": ms(percentile(latencies, 95)),
+            "p99_ms": ms(percentile(latencies, 99)), "max_ms": ms(max(latencies) if latencies else None)}
+
+class Workload:
+    """Builds the requests of each kind: questions vary so answer caches do not serve them all"""
+
+    def __init__(self, app_url: str, mcp_url: str, directory: str, rng: random.Random):
+        self.app_url = app_url.rstrip("/")
+        self.mcp_url = mcp_url.rstrip("/")
+        self.rng = rng
+        self.pdf_path = os.path.join(directory, "load-report.pdf")
+        self.txt_path = os.path.join(directory, "load-notes.txt")
+        write_pdf(self.pdf_path, [{
+            "lines": [f"The {topic} review for item {i} found a change of {5 * i} percent."
+                      for i, topic in enumerate(TOPICS)] +
+                     [f"{SPEAKERS[i % len(SPEAKERS)]}: what happened to {topic} this quarter?" for i, topic in enumerate(TOPICS)],
+            "table": [["Topic", "Q1", "Q2"]] + [[topic, str(10 + i), str(12 + i)] for i, topic in enumerate(TOPICS)]
+        }])
+        with open(self.txt_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(f"Team {i} owns {topic} and reports it every quarter." for i, topic in enumerate(TOPICS)))
+        self._lock = threading.Lock()
+
+    def build(self, kind: str) -> Dict[str, Any]:
+        with self._lock:
+            topic, n, q = self.rng.choice(TOPICS), self.rng.randint(0, 99), self.rng.randint(1, 4)
+            variant = self.rng.randrange(3)
+        if kind == "upload":
+            return {"url": f"{self.app_url}/api/upload", "files": [self.pdf_path, self.txt_path]}
+        if kind == "chat":
+            return {"url": f"{self.app_url}/api/chat", "json": {"message": f"What changed for {topic} in item {n}?"}}
+        if kind == "table":
+            return {"url": f"{self.app_url}/api/chat", "json": {"message": f"Show the table of {topic} figures for quarter {q}"}}
+        if kind == "chat_extraction":
+            return {"url": f"{self.app_url}/api/chat",
+                    "json": {"message": f"Extract the conversation between the speakers about {topic}"}}
+        # Route questions: answered directly by the LLM, or, when its answer contains "unknown",
+        # sent on to retrieval or to table extraction on the generated PDF
+        if variant == 0:
+            payload = {"query": f"Give a short overview of {topic} for quarter {q} and item {n}"}
+        elif variant == 1:
+            payload = {"query": f"Which {topic} items for team {n} are still unknown"}
+        else:
+            payload = {"query": f"Show the table of {topic} figures for quarter {q} marked unknown",
+                       "context": {"pdf_path": self.pdf_path, "data_type": "table"}}
+        return {"url": f"{self.mcp_url}/route_query", "json": payload}
+
+class LoadRunner:
+    def __init__(self, workload: Workload, mix: Dict[str, float], concurrency: int, timeout: float):
+        self.workload = workload
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.results: List[Dict[str, Any]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def send(self, kind: str, scheduled: float, started_at: float):
+        sent = time.perf_counter() - started_at
+        result = {"kind": kind, "scheduled": scheduled, "sent": sent, "ok": False, "cached": False}
+        if sent - scheduled > self.timeout:
+            # Waited in the client queue for longer than the request timeout; the user gave up
+            result.update(finished=sent, error="timed out in client queue")
+        else:
+            spec = self.workload.build(kind)
+            try:
+                if "files" in spec:
+                    handles = [open(path, "rb") for path in spec["files"]]
+                    try:
+                        response = self._session().post(spec["url"], timeout=self.timeout, files=[
+                            ("files", (os.path.basename(handle.name), handle)) for handle in handles
+                        ])
+                    finally:
+                        for handle in handles:
+                            handle.close()
+                else:
+                    response = self._session().post(spec["url"], json=spec["json"], timeout=self.timeout)
+                body = response.json()
+                result["status"] = response.status_code
+                if response.status_code >= 400 or body.get("success") is False:
+                    result["error"] = f"HTTP {response.status_code}: {str(body.get('error', ''))[:120]}"
+                else:
+                    result["ok"] = True
+                    result["cached"] = bool(body.get("cached"))
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {str(e)[:120]}"
+            result["finished"] = time.perf_counter() - started_at
+        result["latency"] = result["finished"] - scheduled
+        with self._lock:
+            self.results.append(result)
+
+    def run(self, arrivals: List[float], rng: random.Random) -> float:
+        """Send every request at its arrival offset; returns the wall time until the last one finished"""
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="load") as pool:
+            for scheduled in arrivals:
+                delay = scheduled - (time.perf_counter() - started_at)
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send, rng.choices(self.kinds, self.weights)[0], scheduled, started_at)
+        return time.perf_counter() - started_at
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    ok = [result for result in results if result["ok"]]
+    errors = len(results) - len(ok)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": round(errors / len(results), 4) if results else None,
+        "cached": sum(result["cached"] for result in ok),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        **latency_summary([result["latency"] for result in ok]),
+        "queue_p95_ms": latency_summary([result["sent"] - result["scheduled"] for result in results])["p95_ms"]
+    }
+
+def windows(results: List[Dict[str, Any]], window: float, duration: float) -> List[Dict[str, Any]]:
+    """Per time window: offered load by scheduled arrival, throughput and latency by completion"""
+    rows = []
+    for index in range(max(1, math.ceil(duration / window))):
+        start, end = index * window, (index + 1) * window
+        offered = sum(1 for result in results if start <= result["scheduled"] < end)
+        done = [result for result in results if start <= result["finished"] < end]
+        ok = [result["latency"] for result in done if result["ok"]]
+        rows.append({
+            "start_s": round(start, 1),
+            "offered_rps": round(offered / window, 2),
+            "throughput_rps": round(len(ok) / window, 2),
+            "error_rate": round((len(done) - len(ok)) / len(done), 4) if done else None,
+            **latency_summary(ok)
+        })
+    return rows
+
+def report(results: List[Dict[str, Any]], elapsed: float, window: float) -> Dict[str, Any]:
+    error_counts: Dict[str, int] = {}
+    for result in results:
+        if not result["ok"]:
+            error_counts[result["error"]] = error_counts.get(result["error"], 0) + 1
+    return {
+        "overall": summarize(results, elapsed),
+        "by_kind": {kind: summarize([result for result in results if result["kind"] == kind], elapsed)
+                    for kind in sorted({result["kind"] for result in results})},
+        "windows": windows(results, window, elapsed),
+        "top_errors": dict(sorted(error_counts.items(), key=lambda item: item[1], reverse=True)[:10])
+    }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_live(url: str, process: subprocess.Popen, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode} before it was live")
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} was not live after {timeout}s")
+
+def spawn_servers(args, log_dir: str) -> Tuple[List[subprocess.Popen], str, str]:
+    """Fake Ollama, app.py and the MCP Flask app on free ports; their output goes to log_dir"""
+    ollama_port, app_port, mcp_port = free_port(), free_port(), free_port()
+    ollama_url = f"http://127.0.0.1:{ollama_port}"
+    env = dict(os.environ, OLLAMA_HOST=ollama_url, OLLAMA_URL=ollama_url,
+               NEUROFETCH_MCP_PORT=str(free_port()), PYTHONUNBUFFERED="1")
+    commands = {
+        "fake_ollama": [sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(ollama_port),
+                        "--first-token-latency", str(args.first_token_latency),
+                        "--token-latency", str(args.token_latency), "--embed-latency", str(args.embed_latency)],
+        "app": [sys.executable, "-c", APP_MAIN, str(app_port)],
+        "mcp_server": [sys.executable, "-c", MCP_MAIN, str(mcp_port)]
+    }
+    processes = []
+    for name, command in commands.items():
+        with open(os.path.join(log_dir, f"{name}.log"), "w") as log:
+            processes.append(subprocess.Popen(command, cwd=SRC_DIR, env=env, stdout=log, stderr=subprocess.STDOUT))
+    try:
+        wait_until_live(f"{ollama_url}/api/tags", processes[0], args.startup_timeout)
+        wait_until_live(f"http://127.0.0.1:{app_port}/health/live", processes[1], args.startup_timeout)
+        wait_until_live(f"http://127.0.0.1:{mcp_port}/health/live", processes[2], args.startup_timeout)
+    except Exception:
+        stop_servers(processes)
+        raise
+    return processes, f"http://127.0.0.1:{app_port}", f"http://127.0.0.1:{mcp_port}"
+
+def stop_servers(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spawn", action="store_true", help="Start fake Ollama, app.py and mcp_server locally")
+    parser.add_argument("--app-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--mcp-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--stages", nargs="+", default=["10:2", "20:2-10", "10:10"],
+                        help="DURATION:RATE or DURATION:START-END, in seconds and requests/s")
+    parser.add_argument("--arrivals", choices=["poisson", "uniform"], default="poisson")
+    parser.add_argument("--concurrency", type=int, default=16, help="Most requests in flight at once")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Request kind weights, e.g. {DEFAULT_MIX}")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout, client queueing included")
+    parser.add_argument("--window", type=float, default=5.0, help="Seconds per reporting window")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="Fake Ollama latency (--spawn)")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Fake Ollama latency (--spawn)")
+    parser.add_argument("--embed-latency", type=float, default=0.002, help="Fake Ollama latency (--spawn)")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    args.stages = parse_stages(args.stages)
+
+    rng = random.Random(args.seed)
+    processes = []
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            if args.spawn:
+                processes, args.app_url, args.mcp_url = spawn_servers(args, directory)
+            workload = Workload(args.app_url, args.mcp_url, directory, rng)
+            # Chat needs an indexed corpus; upload it once before the clock starts
+            upload = LoadRunner(workload, {"upload": 1}, 1, args.timeout)
+            upload.send("upload", 0.0, time.perf_counter())
+            if not upload.results[0]["ok"]:
+                raise RuntimeError(f"Initial upload failed: {upload.results[0]['error']}")
+
+            arrivals = arrival_times(args.stages, args.arrivals == "poisson", rng)
+            runner = LoadRunner(workload, args.mix, args.concurrency, args.timeout)
+            elapsed = runner.run(arrivals, rng)
+            result = {
+                "config": {**{key: value for key, value in vars(args).items() if key != "stages"},
+                           "stages": [{"duration_s": d, "start_rps": s, "end_rps": e} for d, s, e in args.stages],
+                           "scheduled_requests": len(arrivals)},
+                "elapsed_s": round(elapsed, 2),
+                **report(runner.results, elapsed, args.window)
+            }
+        except Exception:
+            if processes:
+                for name in sorted(os.listdir(directory)):
+                    if name.endswith(".log"):
+                        with open(os.path.join(directory, name)) as log:
+                            print(f"--- {name} (tail)\n{log.read()[-2000:]}", file=sys.stderr)
+            raise
+        finally:
+            stop_servers(processes)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Measure MCP request/response throughput with many concurrent in-flight LLM calls.
+
+Starts an MCPServer in-process on a free port with a stubbed LLM of fixed latency, connects
+several MCPClients with --pool-size connections each and keeps --in-flight calls outstanding per client.
+
+    python -m benchmarks.mcp_throughput --clients 4 --pool-size 2 --in-flight 32 --calls 2000 --llm-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+from mcp.mcp_server import MCPServer
+from mcp.mcp_client import MCPClient
+
+class StubLLMServer(MCPServer):
+    """MCP server whose LLM answers after a fixed delay"""
+
+    def __init__(self, llm_latency: float, **kwargs):
+        super().__init__(**kwargs)
+        self.llm_latency = llm_latency
+
+    async def _call_llm(self, llm_id, data, on_token=None):
+        await asyncio.sleep(self.llm_latency)
+        return {"response": f"stub answer to {data.get('prompt', '')[:20]}", "model": data.get("model")}
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def run(args):
+    server = StubLLMServer(args.llm_latency, host="127.0.0.1", port=0, num_workers=args.workers)
+    await server.register_llm_connection("default", "ollama", "stub")
+    listener = await server.listen()
+
+    clients = [MCPClient(f"bench_{i}", "127.0.0.1", server.port, pool_size=args.pool_size) for i in range(args.clients)]
+    for client in clients:
+        await client.connect()
+    # The client reports the default codec again once disconnected, so note what was negotiated now
+    codec = clients[0].codec.name
+
+    latencies = []
+    errors = 0
+    remaining = args.calls
+
+    async def caller(client):
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                await client.call_llm(f"prompt {remaining}", priority="interactive")
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller(client) for client in clients for _ in range(args.in_flight)))
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        await client.disconnect()
+    listener.close()
+    await listener.wait_closed()
+    # Let the server-side handlers see the disconnects before the loop shuts down
+    await asyncio.sleep(0.1)
+
+    return {
+        "calls": len(latencies),
+        "errors": errors,
+        "clients": args.clients,
+        "pool_size": args.pool_size,
+        "in_flight_per_client": args.in_flight,
+        "workers": args.workers,
+        "llm_latency_s": args.llm_latency,
+        "elapsed_s": round(elapsed, 3),
+        "calls_per_s": round(len(latencies) / elapsed, 1),
+        # With one call at a time per connection throughput would be clients / llm_latency
+        "serial_calls_per_s": round(args.clients / args.llm_latency, 1) if args.llm_latency else None,
+        "latency_ms": {
+            "p50": round(1000 * statistics.median(latencies), 2),
+            "p95": round(1000 * percentile(latencies, 95), 2),
+            "p99": round(1000 * percentile(latencies, 99), 2)
+        } if latencies else None,
+        "codec": codec
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--in-flight", type=int, default=32, help="Concurrent outstanding calls per client")
+    parser.add_argument("--pool-size", type=int, default=2, help="Connections per client")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if report["errors"]:
+        print(f"{report['errors']} of {args.calls} calls failed", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
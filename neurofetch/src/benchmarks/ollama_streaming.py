@@ -0,0 +1,129 @@
+"""Check the pooled async Ollama client and MCP token streaming against the fake Ollama server.
+
+Runs concurrent generate calls straight through AsyncOllamaClient to show connection reuse,
+then compares time to first token for streamed and non-streamed MCP calls, and checks the
+chat and embed paths end to end. Finally sends the same prompt at once through an MCP llm_call
+and the Flask side's generate_async, which must share one upstream Ollama call.
+
+    python -m benchmarks.ollama_streaming --requests 200 --concurrency 16 --token-latency 0.01
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from mcp import mcp_server as flask_side
+from mcp.mcp_server import MCPServer
+from mcp.mcp_client import MCPClient
+from mcp.ollama_client import AsyncOllamaClient
+
+async def direct_calls(base_url, requests, concurrency):
+    client = AsyncOllamaClient(base_url, max_connections=concurrency)
+    remaining = requests
+    latencies = []
+
+    async def caller():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await client.generate("llama3", f"question {remaining}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return {
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "latency_ms_p50": round(1000 * statistics.median(latencies), 2),
+        **client.stats
+    }
+
+async def mcp_calls(server, client, prompt, samples):
+    blocking, first_token, streamed_total = [], [], []
+    for _ in range(samples):
+        start = time.perf_counter()
+        answer = (await client.call_llm(prompt))["response"]
+        blocking.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        tokens = []
+        async for token in client.stream_llm(prompt):
+            if not tokens:
+                first_token.append(time.perf_counter() - start)
+            tokens.append(token)
+        streamed_total.append(time.perf_counter() - start)
+        assert "".join(tokens) == answer, "streamed tokens differ from the blocking answer"
+
+    chat = await client.chat([{"role": "user", "content": prompt}])
+    vectors = await client.embed(["first passage", "second passage"])
+    return {
+        "blocking_ms_p50": round(1000 * statistics.median(blocking), 2),
+        "stream_first_token_ms_p50": round(1000 * statistics.median(first_token), 2),
+        "stream_total_ms_p50": round(1000 * statistics.median(streamed_total), 2),
+        "tokens_per_answer": len(tokens),
+        "chat_ok": bool(chat["response"]),
+        "embed_ok": len(vectors) == 2 and len(vectors[0]) == server.embedding_dim
+    }
+
+async def cross_path_coalescing(server, client, fake, prompt):
+    """One MCP llm_call and one generate_async for the same prompt, started together"""
+    # generate_async reads the module's server and Ollama URL when called; point them at this run's
+    flask_side.mcp_server, flask_side.OLLAMA_URL = server, fake.base_url
+    before = fake.requests.get("/api/generate", 0)
+    via_mcp, via_flask = await asyncio.gather(
+        client.call_llm(prompt, model=flask_side.OLLAMA_MODEL, options=flask_side.LLM_OPTIONS),
+        flask_side.generate_async(prompt))
+    upstream = fake.requests.get("/api/generate", 0) - before
+    assert upstream == 1, f"expected one upstream generate for both paths, got {upstream}"
+    assert via_mcp["response"] == via_flask, "the two paths got different answers"
+    return {"upstream_calls": upstream, **server.llm_flights.stats()}
+
+async def run(args):
+    fake = FakeOllamaServer(first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+                            answer_tokens=args.answer_tokens)
+    await fake.start()
+
+    direct = await direct_calls(fake.base_url, args.requests, args.concurrency)
+
+    server = MCPServer(host="127.0.0.1", port=0, num_workers=args.concurrency)
+    await server.register_llm_connection("default", "ollama", fake.base_url)
+    listener = await server.listen()
+    client = MCPClient("bench_stream", "127.0.0.1", server.port)
+    await client.connect()
+    through_mcp = await mcp_calls(fake, client, "What does the quarterly report say about revenue?", args.samples)
+    coalescing = await cross_path_coalescing(server, client, fake, "Which region grew fastest last quarter?")
+
+    await client.disconnect()
+    listener.close()
+    await listener.wait_closed()
+    for ollama_client in server.ollama_clients.values():
+        await ollama_client.close()
+    await asyncio.sleep(0.1)
+    await fake.stop()
+
+    return {
+        "direct": direct,
+        "mcp": through_mcp,
+        "coalescing": coalescing,
+        "fake_ollama": {"connections": fake.connections, "requests": fake.requests}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--answer-tokens", type=int, default=30)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
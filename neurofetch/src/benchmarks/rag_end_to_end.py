@@ -0,0 +1,170 @@
+"""End-to-end RAG benchmark: ingest synthetic corpora through /api/upload, then time /api/chat.
+
+Generates PDF, CSV, TXT and MD corpora of configurable size, runs them through the Flask app in
+process against the deterministic fake Ollama server and prints ingestion throughput (pages/s,
+chunks/s, MB/s) per format and chat latency percentiles as JSON. No real Ollama is needed.
+
+    python -m benchmarks.rag_end_to_end --docs 5 --pages 10 --queries 50 --embed-latency 0.002
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from utils.synthetic_pdf import write_pdf
+
+TOPICS = ["revenue", "latency", "inventory", "churn", "compliance", "hiring", "pricing", "security"]
+FORMATS = ("pdf", "csv", "txt", "md")
+
+def sentence(rng: random.Random, topic: str, index: int) -> str:
+    other = rng.choice(TOPICS)
+    return (f"The {topic} review for item {index} found a change of {rng.randint(1, 90)} percent, "
+            f"with follow-up on {other} owned by team {rng.randint(1, 12)}.")
+
+def generate_corpus(directory: str, fmt: str, docs: int, pages: int, rows: int, rng: random.Random) -> Dict[str, Any]:
+    """Write docs files of one format; returns their paths and how many pages they hold"""
+    paths, total_pages = [], 0
+    for d in range(docs):
+        topic = TOPICS[d % len(TOPICS)]
+        path = os.path.join(directory, f"{fmt}-{d}.{fmt}")
+        if fmt == "pdf":
+            write_pdf(path, [
+                {"lines": [f"{topic.title()} report {d}, page {p + 1}"] +
+                          [sentence(rng, topic, p * 40 + i) for i in range(40)]}
+                for p in range(pages)
+            ])
+            total_pages += pages
+        elif fmt == "csv":
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["id", "topic", "quarter", "value", "note"])
+                for r in range(rows):
+                    writer.writerow([r, topic, f"Q{r % 4 + 1}", rng.randint(100, 9999), sentence(rng, topic, r)])
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                for p in range(pages):
+                    if fmt == "md":
+                        f.write(f"## {topic.title()} section {p + 1}\n\n")
+                    f.write("\n".join(sentence(rng, topic, p * 40 + i) for i in range(40)) + "\n\n")
+            total_pages += pages
+        paths.append(path)
+    return {"paths": paths, "pages": total_pages, "bytes": sum(os.path.getsize(path) for path in paths)}
+
+def upload(client, paths: List[str]):
+    files = [(open(path, "rb"), os.path.basename(path)) for path in paths]
+    try:
+        response = client.post("/api/upload", data={"files": files}, content_type="multipart/form-data")
+    finally:
+        for handle, _ in files:
+            handle.close()
+    if not response.json.get("success"):
+        raise RuntimeError(f"Upload failed: {response.json}")
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "mean_ms": round(1000 * statistics.mean(latencies), 2),
+        "p50_ms": round(1000 * percentile(latencies, 50), 2),
+        "p95_ms": round(1000 * percentile(latencies, 95), 2),
+        "p99_ms": round(1000 * percentile(latencies, 99), 2),
+        "max_ms": round(1000 * max(latencies), 2)
+    }
+
+def run(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    fake = FakeOllamaServer(first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+                            embed_latency=args.embed_latency, answer_tokens=args.answer_tokens)
+    asyncio.run_coroutine_threadsafe(fake.start(), loop).result()
+    # The Ollama clients read these when the app first builds its models, which happens lazily
+    os.environ["OLLAMA_HOST"] = fake.base_url
+    os.environ["OLLAMA_URL"] = fake.base_url
+    import app as backend
+
+    client = backend.app.test_client()
+    report: Dict[str, Any] = {"config": vars(args), "ingestion": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        corpora = {fmt: generate_corpus(directory, fmt, args.docs, args.pages, args.rows, rng) for fmt in args.formats}
+        # The first upload pays for lazy imports and model construction; keep that out of the throughput numbers
+        cold_path = os.path.join(directory, "cold-start.txt")
+        with open(cold_path, "w", encoding="utf-8") as f:
+            f.write(sentence(rng, TOPICS[0], 0))
+        start = time.perf_counter()
+        upload(client, [cold_path])
+        report["cold_start_upload_s"] = round(time.perf_counter() - start, 3)
+        for fmt, corpus in corpora.items():
+            embed_calls = fake.requests.get("/api/embed", 0)
+            start = time.perf_counter()
+            upload(client, corpus["paths"])
+            elapsed = time.perf_counter() - start
+            chunks = backend.vectorstore.index.ntotal
+            report["ingestion"][fmt] = {
+                "documents": len(corpus["paths"]),
+                "pages": corpus["pages"] or None,
+                "bytes": corpus["bytes"],
+                "chunks": chunks,
+                "elapsed_s": round(elapsed, 3),
+                "pages_per_s": round(corpus["pages"] / elapsed, 2) if corpus["pages"] else None,
+                "chunks_per_s": round(chunks / elapsed, 2),
+                "mb_per_s": round(corpus["bytes"] / 1e6 / elapsed, 3),
+                "embed_requests": fake.requests.get("/api/embed", 0) - embed_calls
+            }
+
+        # Chat over everything at once, as a user who uploaded a mixed set of documents would
+        start = time.perf_counter()
+        upload(client, [path for corpus in corpora.values() for path in corpus["paths"]])
+        report["ingestion"]["all"] = {"chunks": backend.vectorstore.index.ntotal,
+                                      "elapsed_s": round(time.perf_counter() - start, 3)}
+
+        latencies, failures = [], 0
+        for q in range(args.queries):
+            topic = TOPICS[q % len(TOPICS)]
+            question = f"What changed for {topic} in item {rng.randint(0, 40)}?"
+            start = time.perf_counter()
+            response = client.post("/api/chat", json={"message": question, "pipeline": args.pipeline})
+            latencies.append(time.perf_counter() - start)
+            failures += not response.json.get("success")
+        report["chat"] = {"pipeline": args.pipeline, "failures": failures, **latency_summary(latencies)}
+
+    report["fake_ollama_requests"] = dict(fake.requests)
+    asyncio.run_coroutine_threadsafe(fake.stop(), loop).result()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--docs", type=int, default=3, help="Documents per format")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per PDF, sections per TXT/MD document")
+    parser.add_argument("--rows", type=int, default=200, help="Rows per CSV document")
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--pipeline", choices=["chain", "agent"], default="agent")
+    parser.add_argument("--embed-latency", type=float, default=0.002)
+    parser.add_argument("--first-token-latency", type=float, default=0.02)
+    parser.add_argument("--token-latency", type=float, default=0.001)
+    parser.add_argument("--answer-tokens", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Scale retrieval out over worker node processes on localhost and check document-affinity routing.
+
+Starts the fake Ollama server and an in-process MCP server with a ShardBroker, launches --nodes
+worker node processes, indexes --documents synthetic documents and runs scatter/gather queries,
+both over every shard and over a few documents at a time. Targeted queries ask for documents on
+other topics, which rank low for the query, and every one of them must still come back. It also
+reports how many documents the hash ring would move if one more node joined.
+
+    python -m benchmarks.sharded_retrieval --nodes 3 --documents 60 --queries 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from mcp.broker import NODE_AGENT_TYPE, HashRing, ShardBroker
+from mcp.mcp_server import MCPServer
+
+TOPICS = ["revenue", "latency", "inventory", "churn", "compliance", "hiring", "pricing", "security"]
+
+def topic_of(doc_id: str) -> str:
+    return TOPICS[int(doc_id.rsplit("-", 1)[1]) % len(TOPICS)]
+
+def synthetic_document(index: int) -> str:
+    topic = TOPICS[index % len(TOPICS)]
+    return "\n\n".join(
+        f"Document {index} section {section} discusses {topic} figures for quarter {section % 4 + 1}. "
+        f"The {topic} team reported item {index * 7 + section} with notes on {random.choice(TOPICS)}."
+        for section in range(6)
+    )
+
+async def wait_for_nodes(server: MCPServer, count: int, timeout: float = 120.0):
+    deadline = time.time() + timeout
+    while len(server.replicas.live(NODE_AGENT_TYPE)) < count:
+        if time.time() > deadline:
+            raise TimeoutError(f"Only {len(server.replicas.live(NODE_AGENT_TYPE))}/{count} worker nodes registered")
+        await asyncio.sleep(0.2)
+
+async def run(args):
+    random.seed(0)
+    fake = FakeOllamaServer(embed_latency=0.001)
+    await fake.start()
+    server = MCPServer(host="127.0.0.1", port=0, num_workers=16)
+    listener = await server.listen()
+    broker = ShardBroker(server)
+
+    env = dict(os.environ, OLLAMA_HOST=fake.base_url)
+    launcher = subprocess.Popen(
+        [sys.executable, "-m", "mcp.worker_node", "--nodes", str(args.nodes), "--host", "127.0.0.1",
+         "--port", str(server.port), "--heartbeat-interval", "1"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        await wait_for_nodes(server, args.nodes)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            broker.index_document(f"doc-{i}", text=synthetic_document(i), source=f"doc-{i}.txt")
+            for i in range(args.documents)
+        ))
+        index_elapsed = time.perf_counter() - start
+
+        scatter, targeted, misplaced, missing = [], [], 0, 0
+        for q in range(args.queries):
+            topic = TOPICS[q % len(TOPICS)]
+            query = {"queries": [f"{topic} figures"], "original_query": f"What are the {topic} figures?"}
+            start = time.perf_counter()
+            result = await broker.retrieve(query)
+            scatter.append(time.perf_counter() - start)
+
+            # Off-topic documents rank below the cut on their shard unless the search itself is restricted
+            off_topic = [doc_id for doc_id in sorted(broker.placements) if topic_of(doc_id) != topic]
+            doc_ids = random.sample(off_topic, 3)
+            start = time.perf_counter()
+            result = await broker.retrieve({**query, "doc_ids": doc_ids})
+            targeted.append(time.perf_counter() - start)
+            found = {document["metadata"]["doc_id"] for document in result["data"]["retrieved_documents"]}
+            misplaced += len(found - set(doc_ids))
+            missing += len(set(doc_ids) - found)
+
+        ring = HashRing(broker.ring.nodes)
+        grown = HashRing(broker.ring.nodes + [f"node-{args.nodes}"])
+        moved = sum(ring.node_for(doc_id) != grown.node_for(doc_id) for doc_id in broker.placements)
+
+        assert misplaced == 0, f"{misplaced} results came from documents that were not requested"
+        assert missing == 0, f"{missing} requested documents were missing from targeted results"
+        return {
+            "nodes": args.nodes,
+            "documents": args.documents,
+            "index_elapsed_s": round(index_elapsed, 3),
+            "documents_per_node": broker.stats()["documents_per_node"],
+            "scatter_all_ms_p50": round(1000 * statistics.median(scatter), 2),
+            "targeted_3_docs_ms_p50": round(1000 * statistics.median(targeted), 2),
+            "shards_per_targeted_query": round(statistics.mean(
+                len({broker.placements[d] for d in random.sample(sorted(broker.placements), 3)}) for _ in range(100)
+            ), 2),
+            "results_outside_requested_docs": misplaced,
+            "requested_docs_missing": missing,
+            "documents_moved_if_node_added": f"{moved}/{args.documents}",
+            "broker": {key: value for key, value in broker.stats().items() if key != "documents_per_node"}
+        }
+    finally:
+        launcher.terminate()
+        launcher.wait()
+        listener.close()
+        await listener.wait_closed()
+        await asyncio.sleep(0.1)
+        await fake.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--documents", type=int, default=60)
+    parser.add_argument("--queries", type=int, default=40)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
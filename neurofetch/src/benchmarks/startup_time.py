@@ -0,0 +1,94 @@
+"""Report what importing the apps costs and fail when it exceeds a bound.
+
+Imports each module in a fresh interpreter under ``python -X importtime`` and prints the wall time,
+the slowest top-level imports by cumulative time and which agents were constructed. With
+--max-import-ms it exits non-zero when any module takes longer, so it can guard against a heavy
+dependency creeping back into import time.
+
+    python -m benchmarks.startup_time app mcp.mcp_server --top 10 --max-import-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+# Run in the child: import the module, then report wall time and what the lazy registry loaded
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+module = __import__(sys.argv[1], fromlist=["_"])
+elapsed = time.perf_counter() - started
+registry = getattr(module, "AGENTS", None)
+agents = registry.stats() if hasattr(registry, "stats") else None
+heavy = ["camelot", "pdfplumber", "PyPDF2", "pandas", "langchain", "langgraph", "faiss"]
+print(json.dumps({"wall_ms": round(1000 * elapsed, 1), "agents": agents,
+                  "heavy_modules_loaded": [name for name in heavy if name in sys.modules]}))
+"""
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Rows of `-X importtime` output as dicts; depth 0 is a module imported directly"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000
+        })
+    return rows
+
+def direct_imports(rows: List[Dict[str, Any]], module: str) -> List[Dict[str, Any]]:
+    """Modules first imported by the module itself; importtime lists children before their parent"""
+    for index, row in enumerate(rows):
+        if row["module"] == module:
+            children = []
+            for child in reversed(rows[:index]):
+                if child["depth"] <= row["depth"]:
+                    break
+                if child["depth"] == row["depth"] + 1:
+                    children.append(child)
+            return children
+    return []
+
+# Modules are imported the way the apps run, from the src directory
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(module: str, top: int = 10) -> Dict[str, Any]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE, module],
+        capture_output=True, text=True, timeout=300, cwd=SRC_DIR
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(completed.stderr)
+    result["modules_imported"] = len(rows)
+    result["slowest_imports"] = [
+        {"module": row["module"], "cumulative_ms": round(row["cumulative_ms"], 1)}
+        for row in sorted(direct_imports(rows, module), key=lambda row: row["cumulative_ms"], reverse=True)[:top]
+    ]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=["app", "mcp.mcp_server"])
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="Exit with status 1 when any module takes longer than this to import")
+    args = parser.parse_args()
+
+    report = {module: measure(module, args.top) for module in args.modules}
+    print(json.dumps(report, indent=2))
+    if args.max_import_ms is not None:
+        slow = {module: result["wall_ms"] for module, result in report.items() if result["wall_ms"] > args.max_import_ms}
+        if slow:
+            print(f"Import time above {args.max_import_ms} ms: {slow}", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark synonym expansion against dictionary size: the trie engine vs. the per-term regex scan.
+
+For each size, generates a dictionary of single- and multi-word terms, writes it in the Solr
+synonyms format and reports how long loading and building take, then times expanding a fixed set
+of queries with the SynonymEngine and with the original approach (a substring check and a fresh
+re.sub per term). Both must produce the same expansions for queries whose terms do not overlap.
+
+    python -m benchmarks.synonym_expansion --sizes 10 100 1000 10000 100000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+from agents.synonyms import SynonymEngine
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "zo", "pe", "qu", "da", "fi", "go", "hu", "ja"]
+COMMON = ["the", "report", "for", "quarter", "show", "data", "and", "of", "system", "what", "is", "team"]
+
+def make_word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+def make_dictionary(size: int, rng: random.Random) -> Dict[str, List[str]]:
+    """size distinct terms, about one in five of them two or three words long"""
+    mappings: Dict[str, List[str]] = {}
+    while len(mappings) < size:
+        words = [make_word(rng) for _ in range(1 if rng.random() < 0.8 else rng.randint(2, 3))]
+        mappings.setdefault(" ".join(words), [make_word(rng) for _ in range(rng.randint(1, 4))])
+    return mappings
+
+def make_queries(mappings: Dict[str, List[str]], count: int, rng: random.Random) -> List[str]:
+    """Queries of 6 to 20 words, most containing one to three dictionary terms"""
+    terms = list(mappings)
+    queries = []
+    for _ in range(count):
+        words = [rng.choice(COMMON) for _ in range(rng.randint(4, 16))]
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(terms))
+        queries.append(" ".join(words))
+    return queries
+
+def legacy_expand(mappings: Dict[str, List[str]], query: str) -> str:
+    """The original QueryReformulationAgent._expand_with_synonyms"""
+    expanded = query
+    for term, synonyms in mappings.items():
+        if term in query.lower():
+            expanded = re.sub(rf'\b{term}\b', synonyms[0], expanded, flags=re.IGNORECASE)
+    return expanded
+
+def boundary_matches(mappings: Dict[str, List[str]], query: str) -> int:
+    """Occurrences of terms in query as whole words, nested and overlapping ones included"""
+    lowered = query.lower()
+    return sum(len(re.findall(rf'\b{term}\b', lowered)) for term in mappings if term in lowered)
+
+def time_per_query(fn, queries: List[str], min_time: float) -> float:
+    """Seconds per query, repeating the whole set until min_time has passed"""
+    rounds, started = 0, time.perf_counter()
+    while True:
+        for query in queries:
+            fn(query)
+        rounds += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return elapsed / (rounds * len(queries))
+
+def write_solr(mappings: Dict[str, List[str]], path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for term, synonyms in mappings.items():
+            f.write(f"{term} => {', '.join(synonyms)}\n")
+
+def run_size(size: int, args, directory: str) -> Dict[str, object]:
+    rng = random.Random(f"{args.seed}-{size}")
+    mappings = make_dictionary(size, rng)
+    queries = make_queries(mappings, args.queries, rng)
+    path = os.path.join(directory, f"synonyms-{size}.txt")
+    write_solr(mappings, path)
+
+    started = time.perf_counter()
+    engine = SynonymEngine.from_file(path)
+    load_s = time.perf_counter() - started
+    # Build again under tracemalloc for the trie's size; tracing slows the build, so it is not timed
+    tracemalloc.start()
+    traced = SynonymEngine(mappings)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+
+    result = {
+        "terms": engine.terms,
+        "load_ms": round(1000 * load_s, 2),
+        "trie_mb": round(memory / 1e6, 2),
+        "matches_per_query": round(sum(len(engine.find(query)) for query in queries) / len(queries), 2),
+        "engine_us_per_query": round(1e6 * time_per_query(engine.expand, queries, args.min_time), 2)
+    }
+    if size <= args.legacy_max_size:
+        legacy = lambda query: legacy_expand(mappings, query)
+        result["legacy_us_per_query"] = round(1e6 * time_per_query(legacy, queries, args.min_time), 2)
+        result["speedup"] = round(result["legacy_us_per_query"] / result["engine_us_per_query"], 1)
+        # Where terms overlap ("gozo huja" and "huja") the old loop replaced them one after another
+        # while the engine takes the longest, so compare on queries without overlaps
+        simple = [query for query in queries if len(engine.find(query)) == boundary_matches(mappings, query)]
+        result["compared_queries"] = len(simple)
+        result["same_output"] = all(engine.expand(query) == legacy_expand(mappings, query) for query in simple)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds spent timing each implementation per size")
+    parser.add_argument("--legacy-max-size", type=int, default=100000,
+                        help="Skip the per-term regex scan above this many terms")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = {str(size): run_size(size, args, directory) for size in args.sizes}
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
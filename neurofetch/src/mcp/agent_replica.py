@@ -0,0 +1,48 @@
+"""Run agents as MCP replicas so CPU-heavy ones can be scaled out over several processes.
+
+Each replica registers under its agent type with its own agent id, reports its in-flight load in
+every heartbeat and answers the agent calls the server routes to it. Only stateless agents run as
+replicas; retrieval is scaled out with mcp.worker_node, whose nodes hold the index shards.
+
+    python -m mcp.agent_replica structured_data_extraction --replicas 4 --port 8001
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+from agents.registry import AgentRegistry
+
+from .launcher import run_processes
+from .mcp_client import MCPClient
+from .replicas import REPLICA_AGENT_TYPES
+
+def load_agent(agent_type: str):
+    return AgentRegistry().get(agent_type)
+
+async def serve_replica(agent_type: str, host: str, port: int, heartbeat_interval: float):
+    agent = load_agent(agent_type)
+    client = MCPClient(f"{agent_type}-{os.getpid()}", host, port, agent_type=agent_type,
+                       capabilities=["agent_call"])
+    client.serve(agent.process)
+    await client.connect()
+    await client.start_heartbeat(heartbeat_interval)
+
+def run_replica(agent_type: str, host: str, port: int, heartbeat_interval: float):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve_replica(agent_type, host, port, heartbeat_interval))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("agent_type", choices=sorted(REPLICA_AGENT_TYPES))
+    parser.add_argument("--replicas", type=int, default=1)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("NEUROFETCH_MCP_PORT", 8001)))
+    parser.add_argument("--heartbeat-interval", type=float, default=10.0)
+    args = parser.parse_args()
+
+    replica_args = (args.agent_type, args.host, args.port, args.heartbeat_interval)
+    run_processes(run_replica, [replica_args] * args.replicas)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from typing import Dict, Any, Iterable, List, Optional
+
+# Agent type under which worker nodes register; each node holds one shard of the corpus
+NODE_AGENT_TYPE = "worker_node"
+
+class HashRing:
+    """Consistent hash ring with virtual nodes, so adding a node moves only ~1/N of the documents"""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 64):
+        self.vnodes = vnodes
+        self.nodes: List[str] = []
+        self._hashes: List[int] = []
+        self._owners: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            point = self._hash(f"{node}#{i}")
+            index = bisect.bisect(self._hashes, point)
+            self._hashes.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(point, owner) for point, owner in zip(self._hashes, self._owners) if owner != node]
+        self._hashes = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+class ShardBroker:
+    """Places documents on worker nodes by consistent hashing and scatters queries to their shards"""
+
+    def __init__(self, server, vnodes: int = 64, timeout: float = 60.0, top_k: int = 10):
+        self.server = server
+        self.timeout = timeout
+        self.top_k = top_k
+        self.ring = HashRing(vnodes=vnodes)
+        # doc_id -> node holding its index shard and caches, and what is needed to re-index it elsewhere
+        self.placements: Dict[str, str] = {}
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        self.logger = logging.getLogger("shard_broker")
+        self.stats_counters = {"indexed": 0, "reindexed": 0, "queries": 0, "shard_calls": 0, "shard_failures": 0}
+
+    def has_documents(self) -> bool:
+        return bool(self.placements)
+
+    def _sync_ring(self):
+        """Keep ring membership equal to the live worker nodes"""
+        live = set(self.server.replicas.live(NODE_AGENT_TYPE))
+        for node in set(self.ring.nodes) - live:
+            self.ring.remove(node)
+        for node in sorted(live - set(self.ring.nodes)):
+            self.ring.add(node)
+
+    async def _call_node(self, node: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self.stats_counters["shard_calls"] += 1
+        return await self.server.call_agent(NODE_AGENT_TYPE, payload, self.timeout, target=node)
+
+    async def index_document(self, doc_id: str, path: Optional[str] = None, text: Optional[str] = None,
+                             source: Optional[str] = None) -> Dict[str, Any]:
+        """Index a document on the node that owns its id"""
+        self._sync_ring()
+        node = self.ring.node_for(doc_id)
+        if node is None:
+            raise RuntimeError("No worker nodes are registered")
+        request = {"doc_id": doc_id, "path": path, "text": text, "source": source}
+        result = await self._call_node(node, {"op": "index", **request})
+        self.placements[doc_id] = node
+        self.sources[doc_id] = request
+        self.stats_counters["indexed"] += 1
+        return {"doc_id": doc_id, "node": node, **result}
+
+    async def _ensure_placed(self, doc_ids: Iterable[str]):
+        """Re-index documents whose node has gone onto their new owner on the ring"""
+        self._sync_ring()
+        for doc_id in doc_ids:
+            if self.server.replicas.is_live(self.placements[doc_id]):
+                continue
+            self.logger.warning(f"Node {self.placements[doc_id]} for {doc_id} is gone; re-indexing")
+            await self.index_document(doc_id, **{k: v for k, v in self.sources[doc_id].items() if k != "doc_id"})
+            self.stats_counters["reindexed"] += 1
+
+    async def retrieve(self, agent_input: Dict[str, Any]) -> Dict[str, Any]:
+        """Scatter a retrieval to the shards holding the requested documents and merge the results"""
+        started = time.time()
+        self.stats_counters["queries"] += 1
+        doc_ids = [doc_id for doc_id in agent_input.get("doc_ids") or self.placements if doc_id in self.placements]
+        await self._ensure_placed(doc_ids)
+        by_node: Dict[str, List[str]] = {}
+        for doc_id in doc_ids:
+            by_node.setdefault(self.placements[doc_id], []).append(doc_id)
+
+        nodes = list(by_node)
+        payload = {key: value for key, value in agent_input.items() if key != "doc_ids"}
+        results = await asyncio.gather(
+            *(self._call_node(node, {"op": "retrieve", "input": payload, "doc_ids": by_node[node]}) for node in nodes),
+            return_exceptions=True
+        )
+
+        documents, shards = [], {}
+        for node, result in zip(nodes, results):
+            if isinstance(result, Exception) or not result.get("success"):
+                self.stats_counters["shard_failures"] += 1
+                error = str(result) if isinstance(result, Exception) else result.get("error")
+                shards[node] = {"documents": len(by_node[node]), "error": error}
+                continue
+            found = result["data"]["retrieved_documents"]
+            shards[node] = {"documents": len(by_node[node]), "results": len(found)}
+            documents.extend(found)
+
+        # Each shard already re-ranked its own hits; final_score is comparable across shards
+        seen, merged = set(), []
+        for document in sorted(documents, key=lambda doc: doc.get("final_score", 0), reverse=True):
+            key = document["content"].strip().lower()
+            if key not in seen:
+                seen.add(key)
+                merged.append(document)
+        merged = merged[:self.top_k]
+
+        response = {
+            "agent_id": "adaptive_retrieval",
+            "agent_type": "retrieval",
+            "timestamp": time.time(),
+            "success": bool(merged) or not any("error" in shard for shard in shards.values())
+        }
+        data = {
+            "original_query": agent_input.get("original_query", (agent_input.get("queries") or [""])[0]),
+            "retrieved_documents": merged,
+            "shards": shards,
+            "elapsed": round(time.time() - started, 3)
+        }
+        if response["success"]:
+            response["data"] = data
+        else:
+            response["error"] = "All shards failed"
+        return response
+
+    async def extract(self, agent_input: Dict[str, Any]) -> Dict[str, Any]:
+        """Run structured extraction on the node that holds the document and its table cache"""
+        doc_id = agent_input["doc_id"]
+        await self._ensure_placed([doc_id])
+        return await self._call_node(self.placements[doc_id], {"op": "extract", "input": agent_input})
+
+    def stats(self) -> Dict[str, Any]:
+        per_node: Dict[str, int] = {}
+        for node in self.placements.values():
+            per_node[node] = per_node.get(node, 0) + 1
+        return {"nodes": list(self.ring.nodes), "documents": len(self.placements),
+                "documents_per_node": per_node, **self.stats_counters}
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Dict, Any, List, Optional, Set
+from .protocol import MCPMessage, write_frame
+
+class ClientConnection:
+    """One client socket with its negotiated codec, a write lock and its in-flight request ids"""
+
+    def __init__(self, writer: asyncio.StreamWriter, codec):
+        self.writer = writer
+        self.codec = codec
+        self.peer = writer.get_extra_info('peername')
+        self.agent_ids: Set[str] = set()
+        self.in_flight: Set[str] = set()
+        self._write_lock = asyncio.Lock()
+
+    async def send(self, payload: Dict[str, Any]):
+        """Write one frame; the lock keeps frames from concurrent workers from interleaving"""
+        async with self._write_lock:
+            write_frame(self.writer, self.codec.encode(payload))
+            await self.writer.drain()
+
+class ConnectionRegistry:
+    """Maps agents and outstanding request ids to the connection that should receive the reply"""
+
+    def __init__(self):
+        # A pooled client registers the same agent on several connections
+        self.by_agent: Dict[str, List[ClientConnection]] = {}
+        self.by_request: Dict[str, ClientConnection] = {}
+
+    def add_agent(self, agent_id: str, connection: ClientConnection):
+        connection.agent_ids.add(agent_id)
+        connections = self.by_agent.setdefault(agent_id, [])
+        if connection not in connections:
+            connections.append(connection)
+
+    def for_agent(self, agent_id: str) -> Optional[ClientConnection]:
+        """The agent's connection with the fewest requests in flight"""
+        connections = self.by_agent.get(agent_id)
+        return min(connections, key=lambda connection: len(connection.in_flight)) if connections else None
+
+    def track(self, request_id: str, connection: ClientConnection):
+        """Remember which connection a request arrived on"""
+        connection.in_flight.add(request_id)
+        self.by_request[request_id] = connection
+
+    def resolve(self, message: MCPMessage, final: bool = True) -> Optional[ClientConnection]:
+        """Find the connection for a response or error, by correlation id first and agent second.
+        Partial (streamed) responses pass final=False so the request stays routed until its last message."""
+        if message.correlation_id and not final:
+            connection = self.by_request.get(message.correlation_id)
+        else:
+            connection = self.by_request.pop(message.correlation_id, None) if message.correlation_id else None
+        if connection is not None:
+            if final:
+                connection.in_flight.discard(message.correlation_id)
+            return connection
+        return self.for_agent(message.agent_id)
+
+    def remove(self, connection: ClientConnection) -> List[str]:
+        """Forget a closed connection and every request still waiting on it; returns agents left unreachable"""
+        for request_id in connection.in_flight:
+            self.by_request.pop(request_id, None)
+        connection.in_flight.clear()
+        unreachable = []
+        for agent_id in connection.agent_ids:
+            connections = self.by_agent.get(agent_id, [])
+            if connection in connections:
+                connections.remove(connection)
+            if not connections:
+                self.by_agent.pop(agent_id, None)
+                unreachable.append(agent_id)
+        return unreachable
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len({id(connection) for connections in self.by_agent.values() for connection in connections}),
+            "agents": len(self.by_agent),
+            "in_flight": len(self.by_request)
+        }
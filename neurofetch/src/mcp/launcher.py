@@ -0,0 +1,24 @@
+"""Start several MCP processes, such as agent replicas or worker nodes, from one command."""
+import multiprocessing
+import signal
+import sys
+from typing import Callable, Sequence
+
+def run_processes(target: Callable, args_list: Sequence[tuple]):
+    """Run target once per args tuple, each in its own process, until they all exit.
+
+    A single one runs in this process instead. Stopping the launcher stops its processes too.
+    """
+    if len(args_list) == 1:
+        target(*args_list[0])
+        return
+    processes = [multiprocessing.Process(target=target, args=args) for args in args_list]
+    for process in processes:
+        process.start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
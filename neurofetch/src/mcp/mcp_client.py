@@ -1,109 +1,108 @@
 import asyncio
 import json
 import logging
-from typing import Dict, Any, Optional, Callable
+import random
+from typing import Dict, Any, Optional, Callable, AsyncIterator, List, Union
 from datetime import datetime
 import uuid
-from .mcp_server import MCPMessage, MessageType
+from utils.tracing import REMOTE_SPANS_FIELD, TRACER, bind, current_traceparent, span
+from .protocol import (
+    MCPMessage, MessageType, DEFAULT_CODEC, PREFERRED_CODECS, CODECS, read_frame, write_frame
+)
 
-class MCPClient:
-    """MCP Client for agents to communicate with the MCP server"""
+class MCPConnection:
+    """One registered socket to the MCP server with the requests waiting on it"""
     
-    def __init__(self, agent_id: str, server_host: str = "localhost", server_port: int = 8000):
+    def __init__(self, agent_id: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 message_handlers: Dict[MessageType, Callable], logger: logging.Logger,
+                 agent_type: str = "general", capabilities: Optional[List[str]] = None):
         self.agent_id = agent_id
-        self.server_host = server_host
-        self.server_port = server_port
-        self.reader: Optional[asyncio.StreamReader] = None
-        self.writer: Optional[asyncio.StreamWriter] = None
-        self.connected = False
-        self.logger = logging.getLogger(f"mcp_client.{agent_id}")
+        self.agent_type = agent_type
+        self.capabilities = capabilities or ["llm_query", "data_processing"]
+        self.reader = reader
+        self.writer = writer
+        self.message_handlers = message_handlers
+        self.logger = logger
+        self.codec = DEFAULT_CODEC
+        self.connected = True
+        self.closed = asyncio.Event()
         self.pending_requests: Dict[str, asyncio.Future] = {}
-        self.message_handlers: Dict[MessageType, Callable] = {}
-        
-    async def connect(self):
-        """Connect to the MCP server"""
-        try:
-            self.reader, self.writer = await asyncio.open_connection(
-                self.server_host, self.server_port
-            )
-            self.connected = True
-            self.logger.info(f"Connected to MCP server at {self.server_host}:{self.server_port}")
-            
-            # Start message listener
-            asyncio.create_task(self._listen_for_messages())
-            
-            # Send registration message
-            await self._register_agent()
-            
-        except Exception as e:
-            self.logger.error(f"Failed to connect to MCP server: {e}")
-            self.connected = False
-            raise
+        # Tokens of streamed requests, keyed by request id, until the final response arrives
+        self.token_streams: Dict[str, asyncio.Queue] = {}
+        self._registration: Optional[asyncio.Future] = None
+        self._write_lock = asyncio.Lock()
+        self._listener = asyncio.create_task(self._listen_for_messages())
     
-    async def disconnect(self):
-        """Disconnect from the MCP server"""
-        if self.writer:
-            self.writer.close()
-            await self.writer.wait_closed()
-        self.connected = False
-        self.logger.info("Disconnected from MCP server")
-    
-    async def _register_agent(self):
-        """Register this agent with the MCP server"""
+    async def register(self, timeout: float = 10.0):
+        """Register the agent on this connection and wait for the codec to be agreed"""
         registration_message = MCPMessage(
             id=str(uuid.uuid4()),
             type=MessageType.REQUEST,
             agent_id=self.agent_id,
             data={
                 "action": "register",
-                "agent_type": "general",
-                "capabilities": ["llm_query", "data_processing"]
+                "agent_type": self.agent_type,
+                "capabilities": self.capabilities,
+                "codecs": PREFERRED_CODECS
             },
             timestamp=datetime.now()
         )
-        await self._send_message(registration_message)
+        self._registration = asyncio.get_running_loop().create_future()
+        await self.send(registration_message)
+        return await asyncio.wait_for(self._registration, timeout=timeout)
     
-    async def _send_message(self, message: MCPMessage):
-        """Send a message to the MCP server"""
+    async def send(self, message: MCPMessage):
         if not self.connected:
             raise ConnectionError("Not connected to MCP server")
         
-        message_data = {
-            "id": message.id,
-            "type": message.type.value,
-            "agent_id": message.agent_id,
-            "data": message.data,
-            "timestamp": message.timestamp.isoformat(),
-            "correlation_id": message.correlation_id
-        }
-        
-        self.writer.write(json.dumps(message_data).encode())
-        await self.writer.drain()
+        # Frames are written whole, so many requests can be pipelined on one connection
+        async with self._write_lock:
+            write_frame(self.writer, self.codec.encode(message.to_dict()))
+            await self.writer.drain()
+    
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self.closed.wait()
     
     async def _listen_for_messages(self):
         """Listen for messages from the MCP server"""
         try:
             while self.connected:
-                data = await self.reader.read(1024)
-                if not data:
+                frame = await read_frame(self.reader)
+                if frame is None:
                     break
                 
-                message_data = json.loads(data.decode())
-                message = MCPMessage(
-                    id=message_data["id"],
-                    type=MessageType(message_data["type"]),
-                    agent_id=message_data["agent_id"],
-                    data=message_data["data"],
-                    timestamp=datetime.fromisoformat(message_data["timestamp"]),
-                    correlation_id=message_data.get("correlation_id")
-                )
-                
-                await self._handle_message(message)
+                message_data = self.codec.decode(frame)
+                if "status" in message_data:
+                    self._handle_ack(message_data)
+                    continue
                 
+                await self._handle_message(MCPMessage.from_dict(message_data))
+        
         except Exception as e:
             self.logger.error(f"Error listening for messages: {e}")
         finally:
             self.connected = False
+            self._fail_pending(ConnectionError("Connection to MCP server lost"))
+            self.closed.set()
+    
+    def _fail_pending(self, error: Exception):
+        """Fail everything still waiting on this connection instead of leaving it to time out"""
+        for future in [self._registration, *self.pending_requests.values()]:
+            if future is not None and not future.done():
+                future.set_exception(error)
+        self.pending_requests.clear()
+    
+    def _handle_ack(self, ack: Dict[str, Any]):
+        """Handle server acknowledgments"""
+        if ack["status"] == "registered" and self._registration and not self._registration.done():
+            # Everything read after this ack is in the negotiated codec
+            self.codec = CODECS[ack["codec"]]
+            self._registration.set_result(ack["codec"])
     
     async def _handle_message(self, message: MCPMessage):
         """Handle incoming messages"""
@@ -119,16 +118,21 @@ class MCPClient:
                     await handler(message)
                 else:
                     self.logger.warning(f"No handler for message type: {message.type}")
-                    
+        
         except Exception as e:
             self.logger.error(f"Error handling message: {e}")
     
     async def _handle_response(self, message: MCPMessage):
         """Handle response messages"""
         correlation_id = message.correlation_id
+        if message.data.get("partial"):
+            if correlation_id in self.token_streams:
+                self.token_streams[correlation_id].put_nowait(message.data["token"])
+            return
         if correlation_id in self.pending_requests:
             future = self.pending_requests.pop(correlation_id)
-            future.set_result(message.data)
+            if not future.done():
+                future.set_result(message.data)
         else:
             self.logger.warning(f"Received response for unknown request: {correlation_id}")
     
@@ -137,75 +141,283 @@ class MCPClient:
         correlation_id = message.correlation_id
         if correlation_id in self.pending_requests:
             future = self.pending_requests.pop(correlation_id)
-            future.set_exception(Exception(message.data.get("error", "Unknown error")))
+            if not future.done():
+                future.set_exception(Exception(message.data.get("error", "Unknown error")))
         else:
             self.logger.error(f"Error from MCP server: {message.data}")
+
+class MCPClient:
+    """MCP Client for agents to communicate with the MCP server over a pool of connections"""
     
-    async def call_llm(self, prompt: str, model: str = "llama3", **kwargs) -> Dict[str, Any]:
-        """Call an LLM through the MCP server"""
-        if not self.connected:
+    def __init__(self, agent_id: str, server_host: str = "localhost", server_port: int = 8001,
+                 pool_size: int = 2, default_timeout: float = 30.0,
+                 reconnect_base: float = 0.5, reconnect_max: float = 30.0,
+                 agent_type: str = "general", capabilities: Optional[List[str]] = None):
+        self.agent_id = agent_id
+        # Replicas of one agent share an agent_type and each use their own agent_id
+        self.agent_type = agent_type
+        self.capabilities = capabilities
+        self.server_host = server_host
+        self.server_port = server_port
+        self.pool_size = pool_size
+        self.default_timeout = default_timeout
+        self.reconnect_base = reconnect_base
+        self.reconnect_max = reconnect_max
+        self.logger = logging.getLogger(f"mcp_client.{agent_id}")
+        self.message_handlers: Dict[MessageType, Callable] = {}
+        self.pool: List[Optional[MCPConnection]] = [None] * pool_size
+        self.stats = {"reconnects": 0, "disconnects": 0, "failed_connects": 0, "timeouts": 0}
+        self._closing = False
+        self._supervisors: List[asyncio.Task] = []
+        # Agent calls this replica is working on, reported as its load in every heartbeat
+        self.in_flight = 0
+        self._agent_handler: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+        self._executor = None
+    
+    @property
+    def connected(self) -> bool:
+        return any(connection is not None and connection.connected for connection in self.pool)
+    
+    @property
+    def codec(self):
+        live = self._live_connections()
+        return live[0].codec if live else DEFAULT_CODEC
+    
+    async def connect(self):
+        """Open the connection pool; slots that fail keep retrying in the background"""
+        self._closing = False
+        results = await asyncio.gather(*(self._open(slot) for slot in range(self.pool_size)), return_exceptions=True)
+        failures = [result for result in results if isinstance(result, Exception)]
+        if len(failures) == self.pool_size:
+            self.logger.error(f"Failed to connect to MCP server: {failures[0]}")
+            raise failures[0]
+        self.logger.info(
+            f"Connected to MCP server at {self.server_host}:{self.server_port} "
+            f"with {self.pool_size - len(failures)}/{self.pool_size} connections"
+        )
+        self._supervisors = [asyncio.create_task(self._maintain(slot)) for slot in range(self.pool_size)]
+    
+    async def disconnect(self):
+        """Disconnect from the MCP server"""
+        self._closing = True
+        for task in self._supervisors:
+            task.cancel()
+        self._supervisors = []
+        for slot, connection in enumerate(self.pool):
+            if connection is not None:
+                await connection.close()
+            self.pool[slot] = None
+        self.logger.info("Disconnected from MCP server")
+    
+    async def _open(self, slot: int) -> MCPConnection:
+        reader, writer = await asyncio.open_connection(self.server_host, self.server_port)
+        connection = MCPConnection(self.agent_id, reader, writer, self.message_handlers, self.logger,
+                                   self.agent_type, self.capabilities)
+        try:
+            codec_name = await connection.register()
+        except BaseException:
+            await connection.close()
+            raise
+        self.pool[slot] = connection
+        self.logger.info(f"Connection {slot} registered with MCP server using {codec_name} codec")
+        return connection
+    
+    async def _maintain(self, slot: int):
+        """Reconnect a pool slot after it drops, backing off exponentially with full jitter"""
+        attempt = 0
+        while not self._closing:
+            connection = self.pool[slot]
+            if connection is not None and connection.connected:
+                await connection.closed.wait()
+                if self._closing:
+                    return
+                self.stats["disconnects"] += 1
+                self.logger.warning(f"Connection {slot} to MCP server lost; reconnecting")
+                attempt = 0
+            # Random delays keep many clients from reconnecting in lockstep after a server restart
+            await asyncio.sleep(random.uniform(0, min(self.reconnect_max, self.reconnect_base * 2 ** attempt)))
+            try:
+                await self._open(slot)
+                self.stats["reconnects"] += 1
+            except Exception as e:
+                attempt += 1
+                self.stats["failed_connects"] += 1
+                self.logger.debug(f"Reconnect of connection {slot} failed: {e}")
+    
+    def _live_connections(self) -> List[MCPConnection]:
+        return [connection for connection in self.pool if connection is not None and connection.connected]
+    
+    def _pick_connection(self) -> MCPConnection:
+        """Least-loaded live connection"""
+        live = self._live_connections()
+        if not live:
             raise ConnectionError("Not connected to MCP server")
-        
+        return min(live, key=lambda connection: len(connection.pending_requests))
+    
+    async def call_llm(self, prompt: str, model: str = "llama3", timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        """Call an LLM through the MCP server"""
+        return await self._request({"action": "llm_call", "prompt": prompt, "model": model, **kwargs}, timeout)
+    
+    async def chat(self, messages: List[Dict[str, str]], model: str = "llama3", timeout: Optional[float] = None,
+                   **kwargs) -> Dict[str, Any]:
+        """Send a chat conversation through the MCP server"""
+        return await self._request({"action": "chat", "messages": messages, "model": model, **kwargs}, timeout)
+    
+    async def embed(self, input: Union[str, List[str]], model: str = "nomic-embed-text", timeout: Optional[float] = None,
+                    **kwargs) -> List[List[float]]:
+        """Embed one or more texts through the MCP server"""
+        response = await self._request({"action": "embed", "input": input, "model": model, **kwargs}, timeout)
+        return response["embeddings"]
+    
+    async def stream_llm(self, prompt: str, model: str = "llama3", timeout: Optional[float] = None,
+                         **kwargs) -> AsyncIterator[str]:
+        """Yield tokens as the LLM generates them; pass action="chat" and messages for chat models"""
+        timeout = timeout or self.default_timeout
+        data = {"action": "llm_call", "prompt": prompt, "model": model, **kwargs, "stream": True}
         request_id = str(uuid.uuid4())
-        future = asyncio.Future()
-        self.pending_requests[request_id] = future
+        connection = self._pick_connection()
+        tokens: asyncio.Queue = asyncio.Queue()
+        connection.token_streams[request_id] = tokens
+        try:
+            future = await self._send_request(connection, request_id, data, timeout)
+            deadline = asyncio.get_running_loop().time() + timeout
+            while True:
+                next_token = asyncio.ensure_future(tokens.get())
+                remaining = deadline - asyncio.get_running_loop().time()
+                done, _ = await asyncio.wait({next_token, future}, timeout=max(0, remaining),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if next_token in done:
+                    yield next_token.result()
+                    continue
+                next_token.cancel()
+                if future in done:
+                    # Tokens are delivered in order before the final response, so drain what is left
+                    while not tokens.empty():
+                        yield tokens.get_nowait()
+                    future.result()
+                    return
+                self.stats["timeouts"] += 1
+                raise TimeoutError("LLM stream timed out")
+        finally:
+            connection.token_streams.pop(request_id, None)
+            connection.pending_requests.pop(request_id, None)
+    
+    async def call_agent(self, agent_type: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Run a request on the least-loaded live replica of an agent type"""
+        return await self._request({"action": "agent_call", "agent_type": agent_type, "input": payload}, timeout)
+    
+    def serve(self, handler: Callable[[Dict[str, Any]], Dict[str, Any]], executor=None):
+        """Act as a replica: answer agent calls routed here by running handler(input) off the event loop"""
+        self._agent_handler = handler
+        self._executor = executor
+        self.message_handlers[MessageType.REQUEST] = self._handle_agent_call
+    
+    async def _handle_agent_call(self, message: MCPMessage):
+        # Run in the background so the listener keeps reading while the agent works
+        asyncio.create_task(self._run_agent_call(message))
+    
+    async def _run_agent_call(self, message: MCPMessage):
+        self.in_flight += 1
+        call_span = None
+        try:
+            # The request's correlation id carries the caller's trace context
+            with span(f"agent_call {message.data.get('agent_type')}", message.correlation_id,
+                      replica=self.agent_id) as call_span:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, bind(self._agent_handler), message.data.get("input", {})
+                )
+            # Agent results can hold numpy or pandas values that the codecs cannot encode
+            reply_type, reply_data = MessageType.RESPONSE, json.loads(json.dumps(result, default=str))
+        except Exception as e:
+            reply_type, reply_data = MessageType.ERROR, {"error": str(e)}
+        finally:
+            self.in_flight -= 1
+        if call_span is not None and isinstance(reply_data, dict):
+            # This process has no trace endpoint, so its spans travel back with the result
+            reply_data[REMOTE_SPANS_FIELD] = TRACER.take_spans(call_span.trace_id)
+        reply = MCPMessage(
+            id=str(uuid.uuid4()),
+            type=reply_type,
+            agent_id=self.agent_id,
+            data=reply_data,
+            timestamp=datetime.now(),
+            correlation_id=message.id
+        )
+        try:
+            await self._pick_connection().send(reply)
+        except ConnectionError as e:
+            self.logger.error(f"Could not return result of {message.id}: {e}")
+    
+    async def _request(self, data: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        timeout = timeout or self.default_timeout
+        request_id = str(uuid.uuid4())
+        connection = self._pick_connection()
+        future = await self._send_request(connection, request_id, data, timeout)
+        try:
+            response = await asyncio.wait_for(future, timeout=timeout)
+            return response
+        except asyncio.TimeoutError:
+            connection.pending_requests.pop(request_id, None)
+            self.stats["timeouts"] += 1
+            raise TimeoutError("LLM call timed out")
+    
+    async def _send_request(self, connection: MCPConnection, request_id: str, data: Dict[str, Any],
+                            timeout: float) -> asyncio.Future:
+        """Send a request to the default LLM and return the future its final response resolves"""
+        future = asyncio.get_running_loop().create_future()
+        connection.pending_requests[request_id] = future
         
         message = MCPMessage(
             id=request_id,
             type=MessageType.REQUEST,
             agent_id=self.agent_id,
-            data={
-                "action": "llm_call",
-                "llm_id": "default",
-                "prompt": prompt,
-                "model": model,
-                **kwargs
-            },
-            timestamp=datetime.now()
+            # The server bounds its own upstream call by the caller's deadline
+            data={"llm_id": "default", "timeout": timeout, **data},
+            timestamp=datetime.now(),
+            # Requests carry the caller's trace context; responses correlate to the request id
+            correlation_id=current_traceparent()
         )
         
-        await self._send_message(message)
-        
         try:
-            response = await asyncio.wait_for(future, timeout=30.0)
-            return response
-        except asyncio.TimeoutError:
-            self.pending_requests.pop(request_id, None)
-            raise TimeoutError("LLM call timed out")
+            await connection.send(message)
+        except BaseException:
+            connection.pending_requests.pop(request_id, None)
+            raise
+        return future
     
     async def send_heartbeat(self):
         """Send heartbeat to the MCP server"""
-        if not self.connected:
+        live = self._live_connections()
+        if not live:
             return
         
         message = MCPMessage(
             id=str(uuid.uuid4()),
             type=MessageType.HEARTBEAT,
             agent_id=self.agent_id,
-            data={"timestamp": datetime.now().isoformat()},
+            data={"timestamp": datetime.now().isoformat(), "load": self.in_flight},
             timestamp=datetime.now()
         )
         
-        await self._send_message(message)
+        await live[0].send(message)
     
     def register_message_handler(self, message_type: MessageType, handler: Callable):
         """Register a custom message handler"""
         self.message_handlers[message_type] = handler
     
     async def start_heartbeat(self, interval: float = 30.0):
-        """Start sending periodic heartbeats"""
-        while self.connected:
+        """Start sending periodic heartbeats; they resume by themselves after a reconnect"""
+        while not self._closing:
             try:
                 await self.send_heartbeat()
-                await asyncio.sleep(interval)
             except Exception as e:
                 self.logger.error(f"Error sending heartbeat: {e}")
-                break
+            await asyncio.sleep(interval)
 
 class MCPAgentMixin:
     """Mixin to add MCP client capabilities to agents"""
     
-    def __init__(self, agent_id: str, mcp_host: str = "localhost", mcp_port: int = 8000):
+    def __init__(self, agent_id: str, mcp_host: str = "localhost", mcp_port: int = 8001):
         self.mcp_client = MCPClient(agent_id, mcp_host, mcp_port)
         self.agent_id = agent_id
     
@@ -225,4 +437,4 @@ class MCPAgentMixin:
     
     def register_message_handler(self, message_type: MessageType, handler: Callable):
         """Register custom message handler"""
-        self.mcp_client.register_message_handler(message_type, handler) 
\ No newline at end of file
+        self.mcp_client.register_message_handler(message_type, handler)
@@ -1,68 +1,98 @@
 import asyncio
 import json
 import logging
+import contextlib
 from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
-from enum import Enum
 import uuid
+import os
+import threading
 from datetime import datetime
 from flask import Flask, request, jsonify
-from langgraph.graph import StateGraph, END
-from langchain_ollama import OllamaLLM
-from agents.structured_data_agent import StructuredDataExtractionAgent
-from agents.retrieval_agent import AdaptiveRetrievalAgent
-from agents.query_reformulation_agent import QueryReformulationAgent
+from agents.registry import AgentRegistry
+from agents.intent_classifier import IntentClassifier
+from utils.answer_cache import SemanticAnswerCache
+from utils.lazy import LazyProxy
+from utils.context_packer import pack_context
+from utils.tokens import estimate_tokens
+from utils.speculation import SpeculativeRun, BranchCancelled
+from utils.single_flight import AsyncSingleFlight, flight_key
+from utils.health import HealthProber
+from utils.metrics import instrument_flask, timed
+from utils.tracing import REMOTE_SPANS_FIELD, TRACER, current_traceparent, trace_flask, traced
+from utils.warmup import WarmUp, steps_from_env, warm_embeddings, warm_table_extraction, warm_vector_index
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from .scheduler import FairPriorityQueue
+from .connections import ClientConnection, ConnectionRegistry
+from .replicas import REPLICA_AGENT_TYPES, ReplicaRegistry
+from .broker import ShardBroker
+from .ollama_client import AsyncOllamaClient
+from .protocol import (
+    MCPMessage, MessageType, FrameError, DEFAULT_CODEC, negotiate_codec, read_frame
+)
 import time
 
-class MessageType(Enum):
-    REQUEST = "request"
-    RESPONSE = "response"
-    ERROR = "error"
-    HEARTBEAT = "heartbeat"
-
-@dataclass
-class MCPMessage:
-    id: str
-    type: MessageType
-    agent_id: str
-    data: Dict[str, Any]
-    timestamp: datetime
-    correlation_id: Optional[str] = None
+def llm_flight_key(endpoint: str, data: Dict[str, Any]) -> str:
+    """Single-flight key of an Ollama call, built from the fields _call_ollama sends with its defaults
+    filled in, so identical calls share a flight whichever path (MCP dispatch or Flask) they came by.
+    Fields that only affect how a caller is served (priority, timeout, stream) are left out."""
+    action = data.get("action", "llm_call")
+    request = {"model": data.get("model", "llama3")}
+    if action == "embed":
+        request["input"] = data.get("input", "")
+    elif action == "chat":
+        request.update(messages=data.get("messages", []), options=data.get("options"))
+    else:
+        action = "generate"
+        request.update(prompt=data.get("prompt", ""), options=data.get("options"))
+    return flight_key(endpoint.rstrip("/"), action, request)
 
 class MCPServer:
     """MCP Server for managing agent communication and LLM interactions"""
     
-    def __init__(self, host: str = "localhost", port: int = 8000):
+    def __init__(self, host: str = "localhost", port: int = 8001, num_workers: int = 4, max_queue_size: int = 1000,
+                 ollama_max_connections: int = 8, heartbeat_timeout: float = 90.0):
         self.host = host
         self.port = port
-        self.agents: Dict[str, Any] = {}
+        self.num_workers = num_workers
+        # Several replicas may register under one agent type; requests go to the least-loaded live one
+        self.replicas = ReplicaRegistry(heartbeat_timeout)
+        self.agents: Dict[str, Any] = self.replicas.agents
+        # Agent calls forwarded to a replica, and the ones made from inside this process
+        self.forwarded: Dict[str, MCPMessage] = {}
+        self.local_waiters: Dict[str, asyncio.Future] = {}
         self.llm_connections: Dict[str, Any] = {}
-        self.message_queue: asyncio.Queue = asyncio.Queue()
+        self.ollama_max_connections = ollama_max_connections
+        self.ollama_clients: Dict[str, AsyncOllamaClient] = {}
+        # Identical concurrent LLM and embedding requests share one upstream call
+        self.llm_flights = AsyncSingleFlight()
+        self.message_queue = FairPriorityQueue(maxsize=max_queue_size)
+        self.connections = ConnectionRegistry()
         self.logger = logging.getLogger("mcp_server")
         
     async def start(self):
         """Start the MCP server"""
-        self.logger.info(f"Starting MCP Server on {self.host}:{self.port}")
-        
-        # Start message processor
-        asyncio.create_task(self._process_messages())
+        server = await self.listen()
+        async with server:
+            await server.serve_forever()
+    
+    async def listen(self) -> asyncio.AbstractServer:
+        """Start the workers and accept connections without blocking; port 0 picks a free port"""
+        # Start message workers
+        for worker_id in range(self.num_workers):
+            asyncio.create_task(self._process_messages(worker_id))
+        asyncio.create_task(self._evict_stale_replicas())
         
         # Start server
         server = await asyncio.start_server(
             self._handle_client, self.host, self.port
         )
-        
-        async with server:
-            await server.serve_forever()
+        self.port = server.sockets[0].getsockname()[1]
+        self.logger.info(f"Started MCP Server on {self.host}:{self.port}")
+        return server
     
     async def register_agent(self, agent_id: str, agent_type: str, capabilities: List[str]):
         """Register an agent with the MCP server"""
-        self.agents[agent_id] = {
-            "type": agent_type,
-            "capabilities": capabilities,
-            "status": "active",
-            "registered_at": datetime.now()
-        }
+        self.replicas.register(agent_id, agent_type, capabilities)
         self.logger.info(f"Agent {agent_id} ({agent_type}) registered")
     
     async def register_llm_connection(self, llm_id: str, llm_type: str, endpoint: str):
@@ -76,17 +106,139 @@ class MCPServer:
         self.logger.info(f"LLM {llm_id} ({llm_type}) registered at {endpoint}")
     
     async def send_message(self, message: MCPMessage):
-        """Send a message to the queue for processing"""
-        await self.message_queue.put(message)
+        """Send a message to the queue for processing, waiting while the queue is full"""
+        if message.type == MessageType.REQUEST:
+            # Clients pick a class with data["priority"]: "interactive", "normal" or "bulk"
+            await self.message_queue.put(message, message.agent_id, message.data.get("priority", "normal"))
+        else:
+            await self.message_queue.put(message, message.agent_id, "control", bounded=False)
+    
+    def queue_stats(self) -> Dict[str, Any]:
+        """Queue depth and wait-time statistics per priority class"""
+        return {
+            "workers": self.num_workers,
+            "connections": self.connections.stats(),
+            "coalescing": self.llm_flights.stats(),
+            "replicas": self.replicas.stats(),
+            **self.message_queue.stats()
+        }
+    
+    def ollama_client(self, endpoint: str) -> AsyncOllamaClient:
+        """Pooled client for an Ollama endpoint, shared by every request on this server's loop"""
+        if endpoint not in self.ollama_clients:
+            self.ollama_clients[endpoint] = AsyncOllamaClient(endpoint, max_connections=self.ollama_max_connections)
+        return self.ollama_clients[endpoint]
     
-    async def _process_messages(self):
+    async def deliver(self, message: MCPMessage, final: bool = True):
+        """Send a response or error straight to the connection that is waiting for it"""
+        connection = self.connections.resolve(message, final)
+        if connection is None:
+            if not final:
+                return
+            # Nobody is connected to receive it (e.g. a locally injected request); just process it here
+            await self.send_message(message)
+            return
+        try:
+            await connection.send(message.to_dict())
+        except Exception as e:
+            self.logger.error(f"Could not deliver {message.type.value} to {connection.peer}: {e}")
+    
+    async def call_agent(self, agent_type: str, payload: Dict[str, Any], timeout: float = 60.0,
+                         target: Optional[str] = None) -> Dict[str, Any]:
+        """Run an agent request from inside this process on the least-loaded live replica, or on target"""
+        message = MCPMessage(
+            id=str(uuid.uuid4()),
+            type=MessageType.REQUEST,
+            agent_id="mcp_server",
+            data={"action": "agent_call", "agent_type": agent_type, "input": payload, "target": target},
+            timestamp=datetime.now(),
+            correlation_id=current_traceparent()
+        )
+        future = asyncio.get_running_loop().create_future()
+        self.local_waiters[message.id] = future
+        try:
+            await self._dispatch_to_replica(message)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.local_waiters.pop(message.id, None)
+    
+    async def _dispatch_to_replica(self, message: MCPMessage, exclude: Optional[str] = None):
+        """Forward an agent call to the least-loaded live replica of the requested type,
+        or to data["target"] when the call needs state that only one replica holds"""
+        agent_type = message.data.get("agent_type")
+        target = message.data.get("target")
+        while True:
+            if target:
+                replica_id = target if self.replicas.is_live(target) and target != exclude else None
+            else:
+                replica_id = self.replicas.pick(agent_type, exclude)
+            if replica_id is None:
+                reason = f"Replica {target} is not available" if target else f"No live replica for agent type {agent_type}"
+                await self._send_error_response(message, reason)
+                return
+            connection = self.connections.for_agent(replica_id)
+            if connection is not None:
+                break
+            # Registered but no longer connected
+            self.replicas.remove(replica_id)
+        
+        # The replica's span becomes a child of the span dispatching to it, when there is one
+        message.correlation_id = current_traceparent() or message.correlation_id
+        self.replicas.dispatched(message.id, replica_id)
+        self.forwarded[message.id] = message
+        try:
+            await connection.send(message.to_dict())
+        except Exception as e:
+            self.replicas.completed(message.id)
+            self.forwarded.pop(message.id, None)
+            await self._send_error_response(message, f"Could not reach replica {replica_id}: {e}")
+    
+    async def _complete_agent_call(self, message: MCPMessage) -> bool:
+        """Pass a replica's response or error to whoever made the call; False if it was not an agent call"""
+        request_id = message.correlation_id
+        if (request_id not in self.forwarded and request_id not in self.local_waiters
+                and request_id not in self.replicas.outstanding):
+            return False
+        remote_spans = message.data.pop(REMOTE_SPANS_FIELD, None) if isinstance(message.data, dict) else None
+        if remote_spans:
+            TRACER.record_remote(remote_spans)
+        self.replicas.completed(request_id)
+        self.forwarded.pop(request_id, None)
+        waiter = self.local_waiters.pop(request_id, None)
+        if waiter is not None:
+            if not waiter.done():
+                if message.type == MessageType.ERROR:
+                    waiter.set_exception(RuntimeError(message.data.get("error", "Unknown error")))
+                else:
+                    waiter.set_result(message.data)
+        elif request_id in self.connections.by_request:
+            await self.deliver(message)
+        return True
+    
+    async def _reroute(self, agent_id: str):
+        """Send calls stranded on a lost replica to another replica, or fail them if there is none"""
+        for request_id in self.replicas.requests_on(agent_id):
+            self.replicas.completed(request_id)
+            message = self.forwarded.pop(request_id, None)
+            if message is not None:
+                await self._dispatch_to_replica(message, exclude=agent_id)
+    
+    async def _evict_stale_replicas(self):
+        """Periodically stop routing to replicas that have missed their heartbeats"""
+        while True:
+            await asyncio.sleep(self.replicas.heartbeat_timeout / 3)
+            for agent_id in self.replicas.evict_stale():
+                self.logger.warning(f"Replica {agent_id} missed heartbeats; no longer routing to it")
+                await self._reroute(agent_id)
+    
+    async def _process_messages(self, worker_id: int):
         """Process messages from the queue"""
         while True:
             try:
                 message = await self.message_queue.get()
                 await self._handle_message(message)
             except Exception as e:
-                self.logger.error(f"Error processing message: {e}")
+                self.logger.error(f"Worker {worker_id} error processing message: {e}")
     
     async def _handle_message(self, message: MCPMessage):
         """Handle individual messages"""
@@ -103,7 +255,12 @@ class MCPServer:
             self.logger.error(f"Error handling message {message.id}: {e}")
     
     async def _handle_request(self, message: MCPMessage):
-        """Handle agent requests"""
+        """Handle agent requests, continuing the caller's trace carried in the request's correlation id"""
+        with TRACER.span(f"mcp {message.data.get('action', 'llm_call')}", message.correlation_id,
+                          agent=message.agent_id):
+            await self._process_request(message)
+    
+    async def _process_request(self, message: MCPMessage):
         agent_id = message.agent_id
         data = message.data
         
@@ -111,15 +268,37 @@ class MCPServer:
             await self._send_error_response(message, f"Agent {agent_id} not registered")
             return
         
+        if data.get("action") == "agent_call":
+            await self._dispatch_to_replica(message)
+            return
+        
         # Route request to appropriate LLM
         llm_id = data.get("llm_id", "default")
         if llm_id not in self.llm_connections:
             await self._send_error_response(message, f"LLM {llm_id} not available")
             return
         
+        on_token = None
+        if data.get("stream"):
+            async def on_token(token: str):
+                # Partial responses share the request's correlation id and keep its route open
+                partial = MCPMessage(
+                    id=str(uuid.uuid4()),
+                    type=MessageType.RESPONSE,
+                    agent_id=agent_id,
+                    data={"token": token, "partial": True},
+                    timestamp=datetime.now(),
+                    correlation_id=message.id
+                )
+                await self.deliver(partial, final=False)
+        
         # Process with LLM
         try:
-            llm_response = await self._call_llm(llm_id, data)
+            if on_token is None:
+                llm_response = await self.call_llm_coalesced(llm_id, data)
+            else:
+                # Streamed requests each get their own token stream, so they are never coalesced
+                llm_response = await self._call_llm(llm_id, data, on_token)
             response_message = MCPMessage(
                 id=str(uuid.uuid4()),
                 type=MessageType.RESPONSE,
@@ -128,50 +307,92 @@ class MCPServer:
                 timestamp=datetime.now(),
                 correlation_id=message.id
             )
-            await self.send_message(response_message)
+            await self.deliver(response_message)
         except Exception as e:
             await self._send_error_response(message, str(e))
     
     async def _handle_response(self, message: MCPMessage):
-        """Handle responses from LLMs"""
+        """Handle replica responses and responses that could not be delivered to a connected client"""
+        if await self._complete_agent_call(message):
+            return
         self.logger.info(f"Response received for agent {message.agent_id}")
-        # Notify waiting agents
-        # This would typically involve notifying the specific agent waiting for this response
     
     async def _handle_error(self, message: MCPMessage):
         """Handle error messages"""
+        if await self._complete_agent_call(message):
+            return
         self.logger.error(f"Error from agent {message.agent_id}: {message.data}")
     
     async def _handle_heartbeat(self, message: MCPMessage):
-        """Handle heartbeat messages"""
-        agent_id = message.agent_id
-        if agent_id in self.agents:
-            self.agents[agent_id]["last_heartbeat"] = datetime.now()
+        """Handle heartbeat messages, which carry the replica's current in-flight load"""
+        self.replicas.heartbeat(message.agent_id, message.data.get("load"))
+    
+    async def call_llm_coalesced(self, llm_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Call the LLM, joining an identical call already in flight instead of starting another"""
+        key = llm_flight_key(self.llm_connections[llm_id]["endpoint"], data)
+        return await self.llm_flights.do(key, lambda: self._call_llm(llm_id, data))
     
-    async def _call_llm(self, llm_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Call the specified LLM with the given data"""
+    async def _call_llm(self, llm_id: str, data: Dict[str, Any], on_token=None) -> Dict[str, Any]:
+        """Call the specified LLM with the given data, passing generated tokens to on_token if given"""
         llm_info = self.llm_connections[llm_id]
         
-        # This is a simplified LLM call - in practice, you'd have proper LLM client connections
         if llm_info["type"] == "ollama":
-            return await self._call_ollama(llm_info["endpoint"], data)
+            return await self._call_ollama(llm_info["endpoint"], data, on_token)
         else:
             raise ValueError(f"Unsupported LLM type: {llm_info['type']}")
     
-    async def _call_ollama(self, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Call Ollama LLM"""
-        # Simplified Ollama call - you'd implement proper async HTTP calls here
-        prompt = data.get("prompt", "")
+    async def _call_ollama(self, endpoint: str, data: Dict[str, Any], on_token=None) -> Dict[str, Any]:
+        """Call Ollama's generate, chat or embed endpoint over the pooled client"""
+        client = self.ollama_client(endpoint)
+        action = data.get("action", "llm_call")
         model = data.get("model", "llama3")
+        options = data.get("options")
+        timeout = data.get("timeout")
+        
+        if action == "embed":
+            result = await client.embed(model, data.get("input", ""), timeout=timeout)
+            return {"embeddings": result.get("embeddings", []), "model": model, "timestamp": datetime.now().isoformat()}
+        
+        if action == "chat":
+            messages = data.get("messages", [])
+            if on_token is None:
+                final = await client.chat(model, messages, options, timeout)
+                text = final.get("message", {}).get("content", "")
+            else:
+                text, final = await self._stream_tokens(client.stream_chat(model, messages, options, timeout),
+                                                        lambda chunk: chunk.get("message", {}).get("content", ""),
+                                                        on_token)
+        else:
+            prompt = data.get("prompt", "")
+            if on_token is None:
+                final = await client.generate(model, prompt, options, timeout)
+                text = final.get("response", "")
+            else:
+                text, final = await self._stream_tokens(client.stream_generate(model, prompt, options, timeout),
+                                                        lambda chunk: chunk.get("response", ""), on_token)
         
-        # This would be an actual HTTP call to Ollama
-        # For now, return a mock response
         return {
-            "response": f"Mock response from Ollama ({model}): {prompt[:50]}...",
+            "response": text,
             "model": model,
+            "done_reason": final.get("done_reason"),
+            "eval_count": final.get("eval_count"),
             "timestamp": datetime.now().isoformat()
         }
     
+    async def _stream_tokens(self, stream, token_of, on_token):
+        """Forward each streamed token and return the full text with the final chunk"""
+        parts = []
+        final: Dict[str, Any] = {}
+        async with contextlib.aclosing(stream):
+            async for chunk in stream:
+                token = token_of(chunk)
+                if token:
+                    parts.append(token)
+                    await on_token(token)
+                if chunk.get("done"):
+                    final = chunk
+        return "".join(parts), final
+    
     async def _send_error_response(self, original_message: MCPMessage, error: str):
         """Send error response"""
         error_message = MCPMessage(
@@ -182,94 +403,245 @@ class MCPServer:
             timestamp=datetime.now(),
             correlation_id=original_message.id
         )
-        await self.send_message(error_message)
+        await self.deliver(error_message)
     
     async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         """Handle client connections"""
         addr = writer.get_extra_info('peername')
         self.logger.info(f"Client connected from {addr}")
+        # Every connection starts in JSON and may switch codec when the client registers
+        connection = ClientConnection(writer, DEFAULT_CODEC)
         
         try:
             while True:
-                data = await reader.read(1024)
-                if not data:
+                frame = await read_frame(reader)
+                if frame is None:
                     break
                 
-                # Parse message
-                message_data = json.loads(data.decode())
-                message = MCPMessage(
-                    id=message_data["id"],
-                    type=MessageType(message_data["type"]),
-                    agent_id=message_data["agent_id"],
-                    data=message_data["data"],
-                    timestamp=datetime.fromisoformat(message_data["timestamp"]),
-                    correlation_id=message_data.get("correlation_id")
-                )
+                message = MCPMessage.from_dict(connection.codec.decode(frame))
+                
+                if message.type == MessageType.REQUEST and message.data.get("action") == "register":
+                    await self.register_agent(
+                        message.agent_id,
+                        message.data.get("agent_type", "general"),
+                        message.data.get("capabilities", [])
+                    )
+                    self.connections.add_agent(message.agent_id, connection)
+                    negotiated = negotiate_codec(message.data.get("codecs", []))
+                    # The acknowledgment still goes out in the old codec; the client switches once it reads it
+                    await connection.send({"status": "registered", "message_id": message.id, "codec": negotiated.name})
+                    connection.codec = negotiated
+                    continue
                 
+                if message.type == MessageType.REQUEST:
+                    self.connections.track(message.id, connection)
                 await self.send_message(message)
                 
                 # Send acknowledgment
-                response = {"status": "received", "message_id": message.id}
-                writer.write(json.dumps(response).encode())
-                await writer.drain()
+                await connection.send({"status": "received", "message_id": message.id})
                 
+        except (FrameError, ValueError, KeyError) as e:
+            self.logger.error(f"Protocol error from client {addr}: {e}")
         except Exception as e:
             self.logger.error(f"Error handling client {addr}: {e}")
         finally:
+            for agent_id in self.connections.remove(connection):
+                await self._reroute(agent_id)
+                self.replicas.remove(agent_id)
             writer.close()
             await writer.wait_closed()
             self.logger.info(f"Client {addr} disconnected")
 
 # Global MCP server instance
-mcp_server = MCPServer()
+mcp_server = MCPServer(
+    port=int(os.environ.get("NEUROFETCH_MCP_PORT", 8001)),
+    num_workers=int(os.environ.get("NEUROFETCH_MCP_WORKERS", 4)),
+    max_queue_size=int(os.environ.get("NEUROFETCH_MCP_QUEUE_SIZE", 1000)),
+    ollama_max_connections=int(os.environ.get("NEUROFETCH_OLLAMA_CONNECTIONS", 8))
+)
 
 app = Flask(__name__)
+# Request and per-stage latency histograms, served as Prometheus text on /metrics
+instrument_flask(app)
+# A span per request, continuing an incoming traceparent header; recent traces on /debug/traces
+trace_flask(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("MCPServer")
 
-llm = OllamaLLM(model="llama3", temperature=0.5)
-structured_agent = StructuredDataExtractionAgent()
-retrieval_agent = AdaptiveRetrievalAgent()
-query_reformulation_agent = QueryReformulationAgent()
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("NEUROFETCH_OLLAMA_MODEL", "llama3")
+LLM_OPTIONS = {"temperature": 0.5}
+# One event loop thread owns the pooled Ollama client and the MCP listener; Flask threads submit work to it
+mcp_loop = asyncio.new_event_loop()
+mcp_loop_lock = threading.Lock()
+mcp_loop_thread = None
 
-AGENTS = {
-    "structured_data_extraction": structured_agent,
-    "adaptive_retrieval": retrieval_agent,
-    "query_reformulation": query_reformulation_agent,
-}
+def run_on_mcp_loop(coroutine):
+    """Submit a coroutine to the MCP loop, starting the loop's thread on first use rather than at import"""
+    global mcp_loop_thread
+    with mcp_loop_lock:
+        if mcp_loop_thread is None:
+            mcp_loop_thread = threading.Thread(target=mcp_loop.run_forever, name="mcp-loop", daemon=True)
+            mcp_loop_thread.start()
+    return asyncio.run_coroutine_threadsafe(coroutine, mcp_loop)
 
-# Health check endpoints for each agent
-@app.route("/health/structured_data_extraction")
-def health_structured():
-    try:
-        result = structured_agent.process({"query": "health check"})
-        return jsonify({"status": "ok", "result": result})
-    except Exception as e:
-        return jsonify({"status": "error", "error": str(e)})
+ollama_client = mcp_server.ollama_client(OLLAMA_URL)
+# Agents and their PDF, pandas, LangChain and FAISS imports load on first use, not at import
+AGENTS = AgentRegistry()
+structured_agent = AGENTS.proxy("structured_data_extraction")
+retrieval_agent = AGENTS.proxy("adaptive_retrieval")
+query_reformulation_agent = AGENTS.proxy("query_reformulation")
 
-@app.route("/health/adaptive_retrieval")
-def health_retrieval():
-    try:
-        result = retrieval_agent.process({"queries": ["health check"]})
-        return jsonify({"status": "ok", "result": result})
-    except Exception as e:
-        return jsonify({"status": "error", "error": str(e)})
+AGENT_CALL_TIMEOUT = float(os.environ.get("NEUROFETCH_AGENT_CALL_TIMEOUT", 60))
+# Documents indexed through /shards/index live on remote worker nodes, one shard per node
+broker = ShardBroker(mcp_server, timeout=AGENT_CALL_TIMEOUT)
 
-@app.route("/health/query_reformulation")
-def health_query_reformulation():
-    try:
-        result = query_reformulation_agent.process({"query": "health check"})
-        return jsonify({"status": "ok", "result": result})
-    except Exception as e:
-        return jsonify({"status": "error", "error": str(e)})
+def on_mcp_loop(fn, *args):
+    """Run a plain function on the MCP loop thread, the only thread that touches the server's state"""
+    async def call():
+        return fn(*args)
+    return run_on_mcp_loop(call()).result()
 
-@app.route("/health/llm")
-def health_llm():
-    try:
-        result = llm("health check")
-        return jsonify({"status": "ok", "result": result})
-    except Exception as e:
-        return jsonify({"status": "error", "error": str(e)})
+async def call_replica(agent_name, agent_input):
+    if broker.has_documents():
+        if agent_name == "adaptive_retrieval":
+            return await broker.retrieve(agent_input)
+        if agent_name == "structured_data_extraction" and agent_input.get("doc_id") in broker.placements:
+            return await broker.extract(agent_input)
+    # A replica of any other agent, e.g. retrieval without an index, could not serve the call
+    if agent_name not in REPLICA_AGENT_TYPES or not mcp_server.replicas.has_live(agent_name):
+        return None
+    return await mcp_server.call_agent(agent_name, agent_input, AGENT_CALL_TIMEOUT)
+
+def wait_unless_cancelled(future, cancel_event=None, poll_interval=0.02):
+    """Result of a future running on the MCP loop; once cancel_event is set the future is cancelled,
+    which stops waiting on the replica or shards, and BranchCancelled is raised"""
+    if cancel_event is None:
+        return future.result()
+    while not wait_futures([future], timeout=poll_interval).done:
+        if cancel_event.is_set():
+            future.cancel()
+            raise BranchCancelled()
+    return future.result()
+
+def run_agent(agent_name, agent_input, cancel_event=None):
+    """Run an agent on its least-loaded MCP replica when any are registered, otherwise in this process.
+    A set cancel_event stops the call early, e.g. when a speculative branch loses"""
+    with TRACER.span(f"run_agent {agent_name}") as agent_span:
+        future = run_on_mcp_loop(traced(call_replica(agent_name, agent_input)))
+        result = wait_unless_cancelled(future, cancel_event)
+        if agent_span is not None:
+            agent_span.attributes["where"] = "local" if result is None else "remote"
+        if result is None:
+            if cancel_event is not None and agent_name == "adaptive_retrieval":
+                # Retrieval checks for cancellation between searches and before de-duplicating
+                result = AGENTS[agent_name].process(agent_input, cancel_event=cancel_event)
+            else:
+                result = AGENTS[agent_name].process(agent_input)
+    return result
+
+# Below this confidence the local intent classifier defers to the LLM
+INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get("NEUROFETCH_INTENT_CONFIDENCE", 0.8))
+intent_classifier = LazyProxy(lambda: IntentClassifier(
+    query_reformulation_agent.query_patterns,
+    structured_agent.table_keywords,
+    structured_agent.chat_keywords,
+    model_path=os.environ.get("NEUROFETCH_INTENT_MODEL"),
+    log_path=os.environ.get("NEUROFETCH_INTENT_LOG")
+))
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("NEUROFETCH_CONTEXT_TOKENS", 600))
+# Run the direct answer, intent detection and retrieval concurrently instead of one after another
+SPECULATIVE_ROUTING = os.environ.get("NEUROFETCH_SPECULATIVE_ROUTING", "0") == "1"
+speculation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculation")
+
+answer_cache = SemanticAnswerCache(
+    LazyProxy(lambda: retrieval_agent.embeddings),
+    threshold=float(os.environ.get("NEUROFETCH_ANSWER_CACHE_THRESHOLD", 0.95)),
+    max_entries=int(os.environ.get("NEUROFETCH_ANSWER_CACHE_SIZE", 256))
+)
+
+# Liveness probes: each one is cheap and never runs a generation or a retrieval, nor loads an agent
+def probe_structured():
+    if not AGENTS.is_loaded("structured_data_extraction"):
+        return {"loaded": False}
+    return {"loaded": True, "table_keywords": len(structured_agent.table_keywords)}
+
+def probe_retrieval():
+    if not AGENTS.is_loaded("adaptive_retrieval"):
+        return {"loaded": False, "shard_nodes": len(broker.ring.nodes)}
+    return {
+        "loaded": True,
+        "index_loaded": retrieval_agent.vectorstore is not None,
+        "index_version": retrieval_agent.index_version,
+        "shard_nodes": len(broker.ring.nodes)
+    }
+
+def probe_query_reformulation():
+    if not AGENTS.is_loaded("query_reformulation"):
+        return {"loaded": False}
+    return {"loaded": True, "query_patterns": len(query_reformulation_agent.query_patterns)}
+
+def probe_llm():
+    """Ping Ollama's model list and check that the chat model is pulled"""
+    models = run_on_mcp_loop(ollama_client.list_models(timeout=2.0)).result()
+    names = [model.get("name", "") for model in models.get("models", [])]
+    if not any(name.split(":")[0] == OLLAMA_MODEL for name in names):
+        raise RuntimeError(f"Model {OLLAMA_MODEL} is not available in Ollama")
+    return {"model": OLLAMA_MODEL}
+
+health_prober = HealthProber(
+    {
+        "structured_data_extraction": probe_structured,
+        "adaptive_retrieval": probe_retrieval,
+        "query_reformulation": probe_query_reformulation,
+        "llm": probe_llm
+    },
+    interval=float(os.environ.get("NEUROFETCH_HEALTH_INTERVAL", 10)),
+    ttl=float(os.environ.get("NEUROFETCH_HEALTH_TTL", 30))
+)
+
+# Warm-up steps pay the first-request costs (model loads, FAISS, camelot) before traffic arrives
+WARMUP_LLM_TIMEOUT = float(os.environ.get("NEUROFETCH_WARMUP_LLM_TIMEOUT", 300))
+
+def warm_agents():
+    for name in AGENTS:
+        AGENTS.get(name)
+    intent_classifier.predict("warm-up")
+    return {"load_times_s": dict(AGENTS.load_times)}
+
+def warm_llm():
+    """Ask Ollama to load the chat model; an empty prompt loads it without generating"""
+    run_on_mcp_loop(ollama_client.generate(OLLAMA_MODEL, "", timeout=WARMUP_LLM_TIMEOUT)).result()
+    return {"model": OLLAMA_MODEL}
+
+warmup = WarmUp(
+    steps_from_env({
+        "agents": warm_agents,
+        "llm": warm_llm,
+        "embeddings": lambda: warm_embeddings(retrieval_agent.embeddings),
+        "index": lambda: warm_vector_index(retrieval_agent.embeddings),
+        "table_extraction": lambda: warm_table_extraction(structured_agent)
+    }),
+    retry_interval=float(os.environ.get("NEUROFETCH_WARMUP_RETRY", 30))
+)
+
+# Liveness: the process is up and serving. Readiness: warm-up has finished, so route traffic here
+@app.route("/health/live")
+def liveness():
+    return jsonify({"status": "ok"})
+
+@app.route("/health/ready")
+def readiness():
+    warmup.start()
+    return jsonify(warmup.status()), 200 if warmup.ready else 503
+
+# Health check endpoints for each agent; these probe now, /agents serves the cached results
+@app.route("/health/<name>")
+def health(name):
+    if name not in health_prober.probes:
+        return jsonify({"status": "error", "error": f"Unknown component {name}"}), 404
+    return jsonify(health_prober.check(name))
 
 # Main orchestration endpoint
 @app.route("/route_query", methods=["POST"])
@@ -279,55 +651,139 @@ def route_query():
     context = data.get("context", {})
     logger.info(f"Received query: {query}")
     start_time = time.time()
+    # Answers depend on the local and sharded indexes and on any extra context (e.g. which PDF)
+    corpus_version = (retrieval_agent.index_version, broker.stats_counters["indexed"])
+    cache_scope = json.dumps(context, sort_keys=True, default=str)
+    cached_response = answer_cache.lookup(query, corpus_version, cache_scope)
+    if cached_response is not None:
+        response = dict(cached_response, cached=True)
+        response["elapsed"] = round(time.time() - start_time, 2)
+        logger.info(f"Answer cache hit for query: {query}")
+        return jsonify(response)
+    if data.get("speculative", SPECULATIVE_ROUTING):
+        response = route_speculatively(query, context)
+    else:
+        response = route_serially(query, context)
+    if "error" not in response["trace"]:
+        answer_cache.store(query, corpus_version, dict(response), cache_scope)
+    response["elapsed"] = round(time.time() - start_time, 2)
+    logger.info(f"Final response: {response}")
+    return jsonify(response)
+
+def route_serially(query, context):
+    """Answer with the LLM first and only then detect intent and run an agent"""
     # 1. LLM tries to answer first
-    llm_response = llm(query)
+    llm_response = generate(query)
+    logger.info(f"LLM initial response: {llm_response}")
+    if is_llm_confident(llm_response):
+        return {"agent": "llm", "response": llm_response, "trace": ["llm"]}
+
+    # 2. LLM not confident, detect intent
+    intent = detect_intent(query)
+    logger.info(f"LLM not confident. Detected intent: {intent}")
+    agent_name, agent_input = select_agent(intent, query, context)
+    try:
+        agent_result = run_agent(agent_name, agent_input)
+        return build_agent_response(agent_name, agent_result, query)
+    except Exception as e:
+        return build_agent_error(agent_name, e)
+
+def route_speculatively(query, context):
+    """Start the direct answer, intent detection and retrieval together and cancel whatever loses"""
+    run = SpeculativeRun(speculation_pool)
+    run.launch("llm", lambda cancel_event: generate(query, cancel_event))
+    run.launch("intent", lambda cancel_event: detect_intent(query, cancel_event))
+    run.launch("retrieval", lambda cancel_event: run_agent(
+        "adaptive_retrieval", {"queries": [query], "original_query": query, **context}, cancel_event
+    ))
+
+    llm_response = run.result("llm")
     logger.info(f"LLM initial response: {llm_response}")
-    if not is_llm_confident(llm_response):
-        # 2. LLM not confident, detect intent
-        intent = detect_intent(query)
+    if is_llm_confident(llm_response):
+        run.cancel("intent")
+        run.cancel("retrieval")
+        response = {"agent": "llm", "response": llm_response, "trace": ["llm"]}
+    else:
+        intent = run.result("intent")
         logger.info(f"LLM not confident. Detected intent: {intent}")
-        if intent in ["table", "chat"]:
-            agent = structured_agent
-            agent_name = "structured_data_extraction"
-            agent_input = {"query": query, **context}
-        else:
-            agent = retrieval_agent
-            agent_name = "adaptive_retrieval"
-            agent_input = {"queries": [query], "original_query": query, **context}
+        agent_name, agent_input = select_agent(intent, query, context)
         try:
-            agent_result = agent.process(agent_input)
-            logger.info(f"Agent {agent_name} result: {agent_result}")
-            if not agent_result.get("success"):
-                # 3. Fallback to LLM-with-tools (simulate by re-asking LLM with agent data)
-                llm_tool_response = llm(f"Given this data: {agent_result}, answer the query: {query}")
-                logger.info(f"LLM-with-tools response: {llm_tool_response}")
-                response = {
-                    "agent": "llm_with_tools",
-                    "response": llm_tool_response,
-                    "trace": ["llm", agent_name, "llm_with_tools"]
-                }
+            if agent_name == "adaptive_retrieval":
+                agent_result = run.result("retrieval")
             else:
-                response = {
-                    "agent": agent_name,
-                    "response": agent_result,
-                    "trace": ["llm", agent_name]
-                }
+                run.cancel("retrieval")
+                agent_result = run_agent(agent_name, agent_input)
+            response = build_agent_response(agent_name, agent_result, query)
         except Exception as e:
-            logger.error(f"Error in agent {agent_name}: {e}")
-            response = {
+            response = build_agent_error(agent_name, e)
+
+    response["speculation"] = run.report()
+    return response
+
+def select_agent(intent, query, context):
+    if intent in ["table", "chat"]:
+        return "structured_data_extraction", {"query": query, **context}
+    return "adaptive_retrieval", {"queries": [query], "original_query": query, **context}
+
+def build_agent_response(agent_name, agent_result, query):
+    logger.info(f"Agent {agent_name} result: {agent_result}")
+    if agent_result.get("success"):
+        documents = agent_documents(agent_result)
+        if not documents:
+            return {
                 "agent": agent_name,
-                "response": f"Agent error: {str(e)}",
-                "trace": ["llm", agent_name, "error"]
+                "response": agent_result,
+                "trace": ["llm", agent_name]
             }
-    else:
-        response = {
-            "agent": "llm",
-            "response": llm_response,
-            "trace": ["llm"]
+        # Answer from the agent's data, packed to the query-relevant sentences within the token budget
+        context_prompt, context_stats = build_context_prompt(documents, agent_result, query)
+        llm_context_response = generate(context_prompt)
+        logger.info(f"LLM-with-context response: {llm_context_response}")
+        return {
+            "agent": agent_name,
+            "response": llm_context_response,
+            "data": agent_result.get("data"),
+            "context": context_stats,
+            "trace": ["llm", agent_name, "llm_with_context"]
         }
-    response["elapsed"] = round(time.time() - start_time, 2)
-    logger.info(f"Final response: {response}")
-    return jsonify(response)
+    # 3. Fallback to LLM-with-tools (simulate by re-asking LLM with agent data)
+    tool_prompt, context_stats = build_tool_prompt(agent_result, query)
+    llm_tool_response = generate(tool_prompt)
+    logger.info(f"LLM-with-tools response: {llm_tool_response}")
+    return {
+        "agent": "llm_with_tools",
+        "response": llm_tool_response,
+        "context": context_stats,
+        "trace": ["llm", agent_name, "llm_with_tools"]
+    }
+
+def build_agent_error(agent_name, error):
+    logger.error(f"Error in agent {agent_name}: {error}")
+    return {
+        "agent": agent_name,
+        "response": f"Agent error: {str(error)}",
+        "trace": ["llm", agent_name, "error"]
+    }
+
+def generate(prompt, cancel_event=None):
+    """Run the LLM on the shared Ollama client, streaming when a cancel event is given so a losing branch stops early"""
+    return run_on_mcp_loop(traced(generate_async(prompt, cancel_event))).result()
+
+async def generate_async(prompt, cancel_event=None):
+    if cancel_event is None:
+        # Same call and key as an MCP llm_call, so an identical prompt from either side makes one request
+        await register_default_llm()
+        result = await mcp_server.call_llm_coalesced(
+            "default", {"prompt": prompt, "model": OLLAMA_MODEL, "options": LLM_OPTIONS})
+        return result.get("response", "")
+    chunks = []
+    async with contextlib.aclosing(ollama_client.stream_generate(OLLAMA_MODEL, prompt, LLM_OPTIONS)) as stream:
+        async for chunk in stream:
+            if cancel_event.is_set():
+                # Closing the stream drops the HTTP response, which stops generation in Ollama
+                raise BranchCancelled()
+            chunks.append(chunk.get("response", ""))
+    return "".join(chunks)
 
 def is_llm_confident(llm_response):
     # Simple heuristic: if LLM says "I don't know" or similar, it's not confident
@@ -335,25 +791,106 @@ def is_llm_confident(llm_response):
     resp = str(llm_response).strip().lower()
     return not any(phrase in resp for phrase in low_conf_phrases)
 
-def detect_intent(query):
+def agent_documents(agent_result):
+    """Retrieved documents, table rows and chat segments of a successful agent result as packable documents"""
+    data = agent_result.get("data") or {}
+    documents = list(data.get("retrieved_documents", []))
+    for table in data.get("tables", []):
+        rows = table.get("data", []) if isinstance(table, dict) else table
+        documents.append({"content": "\n".join(" | ".join(str(value) for value in row.values()) for row in rows)})
+    for segment in data.get("chat_segments", []):
+        documents.append({"content": f"{segment.get('speaker')}: {segment.get('message')}"})
+    return documents
+
+def build_context_prompt(documents, agent_result, query):
+    """Build a compact prompt from an agent's documents instead of dumping the result's full repr"""
+    packed = pack_context(documents, query, CONTEXT_TOKEN_BUDGET)
+    prompt = f"Given this data:\n{packed.text}\n\nanswer the query: {query}"
+    return prompt, prompt_stats(prompt, agent_result, "Context prompt packed")
+
+def build_tool_prompt(agent_result, query):
+    """Build the fallback prompt for an agent that failed; failed results carry an error, not data"""
+    error = agent_result.get("error", "no data returned")
+    prompt = f"The {agent_result.get('agent_id', 'agent')} could not provide data ({error}). Answer the query: {query}"
+    return prompt, prompt_stats(prompt, agent_result, "Tool prompt built")
+
+def prompt_stats(prompt, agent_result, label):
+    prompt_tokens = estimate_tokens(prompt)
+    context_stats = {
+        "prompt_tokens": prompt_tokens,
+        "tokens_saved": max(0, estimate_tokens(str(agent_result)) - prompt_tokens)
+    }
+    logger.info(f"{label}: {context_stats}")
+    return context_stats
+
+def detect_intent(query, cancel_event=None):
+    with timed("intent_classifier", "predict"):
+        intent, confidence = intent_classifier.predict(query)
+    if confidence >= INTENT_CONFIDENCE_THRESHOLD:
+        logger.info(f"Local intent classifier: {intent} ({confidence:.2f})")
+        return intent
     prompt = (
         f"Classify the intent of this query: '{query}'. "
         "Respond with one of: 'table', 'chat', 'retrieval', 'definition', 'comparison', 'other'."
     )
-    intent = llm(prompt).strip().lower()
+    intent = generate(prompt, cancel_event).strip().lower().strip("'\".")
+    intent_classifier.record(query, intent)
     return intent
 
+@app.route("/mcp_stats", methods=["GET"])
+def mcp_stats():
+    return jsonify({**on_mcp_loop(mcp_server.queue_stats), "shards": on_mcp_loop(broker.stats)})
+
+@app.route("/shards/index", methods=["POST"])
+def index_shard_document():
+    data = request.json
+    try:
+        result = run_on_mcp_loop(traced(
+            broker.index_document(data["doc_id"], data.get("path"), data.get("text"), data.get("source"))
+        )).result()
+        return jsonify({"status": "ok", **result})
+    except Exception as e:
+        return jsonify({"status": "error", "error": str(e)}), 503
+
+@app.route("/shards/query", methods=["POST"])
+def query_shards():
+    data = request.json
+    agent_input = {"queries": data.get("queries") or [data["query"]], "original_query": data["query"],
+                   "doc_ids": data.get("doc_ids")}
+    return jsonify(run_on_mcp_loop(traced(broker.retrieve(agent_input))).result())
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "answer_cache": answer_cache.stats(),
+        "embedding_coalescing": retrieval_agent.embeddings.stats() if retrieval_agent.loaded else {},
+        "llm_coalescing": on_mcp_loop(mcp_server.llm_flights.stats)
+    })
+
+@app.route("/startup_stats", methods=["GET"])
+def startup_stats():
+    return jsonify({"agents": AGENTS.stats(), "intent_classifier_loaded": intent_classifier.loaded})
+
 @app.route("/agents", methods=["GET"])
 def list_agents():
-    # Return available agents and their health
-    agent_status = {}
-    for name, agent in AGENTS.items():
-        try:
-            health = app.test_client().get(f"/health/{name}").json
-        except Exception as e:
-            health = {"status": "error", "error": str(e)}
-        agent_status[name] = health
-    return jsonify(agent_status)
+    # Return available agents and their last probed health; probing starts with the server, or
+    # here on first use, never at import
+    health_prober.start()
+    snapshot = health_prober.snapshot()
+    return jsonify({name: snapshot[name] for name in AGENTS})
+
+async def register_default_llm():
+    if "default" not in mcp_server.llm_connections:
+        await mcp_server.register_llm_connection("default", "ollama", OLLAMA_URL)
+
+async def start_mcp_listener():
+    await register_default_llm()
+    await mcp_server.listen()
 
 if __name__ == "__main__":
+    # MCP clients connect over TCP on NEUROFETCH_MCP_PORT while Flask keeps port 8000
+    run_on_mcp_loop(start_mcp_listener()).result()
+    # Warm up in the background so the port binds immediately; /health/ready reports 503 until done
+    warmup.start()
+    health_prober.start()
     app.run(port=8000) 
\ No newline at end of file
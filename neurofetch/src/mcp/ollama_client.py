@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+from utils.metrics import STAGE_SECONDS, timed
+
+class OllamaError(Exception):
+    """Raised when Ollama returns an error or an unreadable response"""
+
+class AsyncOllamaClient:
+    """Asyncio HTTP/1.1 client for Ollama with a pool of keep-alive connections"""
+
+    def __init__(self, base_url: str = "http://localhost:11434", max_connections: int = 8,
+                 timeout: float = 120.0, connect_timeout: float = 5.0):
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 11434
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.logger = logging.getLogger("ollama_client")
+        self._idle: deque = deque()
+        # Bounds concurrent requests (and therefore open connections) to this Ollama instance
+        self._slots = asyncio.Semaphore(max_connections)
+        self.stats = {"requests": 0, "connections_opened": 0, "connections_reused": 0, "errors": 0}
+
+    async def generate(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                       timeout: Optional[float] = None, **extra) -> Dict[str, Any]:
+        """Complete a prompt with /api/generate and return the final JSON body"""
+        payload = {"model": model, "prompt": prompt, "stream": False, **extra}
+        if options:
+            payload["options"] = options
+        return await self._request_json("POST", "/api/generate", payload, timeout)
+
+    async def stream_generate(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                              timeout: Optional[float] = None, **extra) -> AsyncIterator[Dict[str, Any]]:
+        """Yield /api/generate chunks as Ollama produces them; the last one has done=True"""
+        payload = {"model": model, "prompt": prompt, "stream": True, **extra}
+        if options:
+            payload["options"] = options
+        async for chunk in self._stream_json("/api/generate", payload, timeout):
+            yield chunk
+
+    async def chat(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[float] = None, **extra) -> Dict[str, Any]:
+        payload = {"model": model, "messages": messages, "stream": False, **extra}
+        if options:
+            payload["options"] = options
+        return await self._request_json("POST", "/api/chat", payload, timeout)
+
+    async def stream_chat(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None,
+                          timeout: Optional[float] = None, **extra) -> AsyncIterator[Dict[str, Any]]:
+        payload = {"model": model, "messages": messages, "stream": True, **extra}
+        if options:
+            payload["options"] = options
+        async for chunk in self._stream_json("/api/chat", payload, timeout):
+            yield chunk
+
+    async def embed(self, model: str, input: Union[str, List[str]], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Embed one or more texts with /api/embed"""
+        return await self._request_json("POST", "/api/embed", {"model": model, "input": input}, timeout)
+
+    async def list_models(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        return await self._request_json("GET", "/api/tags", None, timeout)
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.popleft()
+            writer.close()
+
+    async def _request_json(self, method: str, path: str, payload: Optional[Dict[str, Any]],
+                            timeout: Optional[float]) -> Dict[str, Any]:
+        deadline = asyncio.get_running_loop().time() + (timeout or self.timeout)
+        async with self._slots:
+            with timed("ollama", path.rsplit("/", 1)[-1]):
+                status, body = await self._roundtrip(method, path, payload, deadline)
+        result = json.loads(body) if body else {}
+        if status >= 400:
+            self.stats["errors"] += 1
+            raise OllamaError(f"Ollama {path} returned {status}: {result.get('error', body[:200])}")
+        return result
+
+    async def _stream_json(self, path: str, payload: Dict[str, Any], timeout: Optional[float]) -> AsyncIterator[Dict[str, Any]]:
+        deadline = asyncio.get_running_loop().time() + (timeout or self.timeout)
+        async with self._slots:
+            connection = await self._send_request("POST", path, payload, deadline)
+            reader, writer = connection
+            finished = False
+            started = time.perf_counter()
+            first_token = True
+            try:
+                status, headers = await self._read_head(reader, deadline)
+                if status >= 400:
+                    body = b"".join([part async for part in self._read_body(reader, headers, deadline)])
+                    finished = True
+                    self.stats["errors"] += 1
+                    raise OllamaError(f"Ollama {path} returned {status}: {body[:200]!r}")
+                buffer = b""
+                async for part in self._read_body(reader, headers, deadline):
+                    buffer += part
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        if line.strip():
+                            chunk = json.loads(line)
+                            if "error" in chunk:
+                                raise OllamaError(chunk["error"])
+                            if first_token:
+                                first_token = False
+                                STAGE_SECONDS.observe(time.perf_counter() - started, component="ollama",
+                                                      stage=f"{path.rsplit('/', 1)[-1]}_first_token")
+                            yield chunk
+                finished = True
+                if buffer.strip():
+                    yield json.loads(buffer)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, component="ollama", stage=f"{path.rsplit('/', 1)[-1]}_stream")
+                # A stream abandoned part-way is closed, which also makes Ollama stop generating
+                self._release(connection, finished and self._keep_alive(headers if finished else {}))
+
+    async def _roundtrip(self, method: str, path: str, payload: Optional[Dict[str, Any]],
+                         deadline: float) -> Tuple[int, bytes]:
+        for attempt in range(2):
+            reused = bool(self._idle)
+            connection = await self._send_request(method, path, payload, deadline)
+            reader, _ = connection
+            try:
+                status, headers = await self._read_head(reader, deadline)
+                body = b"".join([part async for part in self._read_body(reader, headers, deadline)])
+            except (ConnectionError, asyncio.IncompleteReadError, OllamaError):
+                self._release(connection, False)
+                # Ollama may have closed an idle keep-alive connection; retry once on a fresh one
+                if reused and attempt == 0:
+                    continue
+                self.stats["errors"] += 1
+                raise
+            except BaseException:
+                self._release(connection, False)
+                raise
+            self._release(connection, self._keep_alive(headers))
+            return status, body
+        raise OllamaError("unreachable")
+
+    async def _send_request(self, method: str, path: str, payload: Optional[Dict[str, Any]], deadline: float):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Connection: keep-alive\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode()
+        connection = await self._acquire(deadline)
+        self.stats["requests"] += 1
+        try:
+            connection[1].writelines((head, body))
+            await self._before(deadline, connection[1].drain())
+        except BaseException:
+            self._release(connection, False)
+            raise
+        return connection
+
+    async def _acquire(self, deadline: float):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                self.stats["connections_reused"] += 1
+                return reader, writer
+            writer.close()
+        self.stats["connections_opened"] += 1
+        remaining = min(self.connect_timeout, deadline - asyncio.get_running_loop().time())
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port), remaining)
+
+    def _release(self, connection, reusable: bool):
+        if reusable and len(self._idle) < self.max_connections:
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+
+    async def _read_head(self, reader: asyncio.StreamReader, deadline: float) -> Tuple[int, Dict[str, str]]:
+        status_line = await self._before(deadline, reader.readline())
+        if not status_line:
+            raise ConnectionError("Ollama closed the connection")
+        parts = status_line.decode("latin-1").split(" ", 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise OllamaError(f"Malformed status line: {status_line!r}")
+        headers = {}
+        while True:
+            line = await self._before(deadline, reader.readline())
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return int(parts[1]), headers
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers: Dict[str, str], deadline: float) -> AsyncIterator[bytes]:
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await self._before(deadline, reader.readline())
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # Skip optional trailers up to the final blank line
+                    while (await self._before(deadline, reader.readline())) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                data = await self._before(deadline, reader.readexactly(size))
+                await self._before(deadline, reader.readexactly(2))
+                yield data
+        elif "content-length" in headers:
+            yield await self._before(deadline, reader.readexactly(int(headers["content-length"])))
+        else:
+            yield await self._before(deadline, reader.read())
+
+    def _keep_alive(self, headers: Dict[str, str]) -> bool:
+        if headers.get("connection", "").lower() == "close":
+            return False
+        return "content-length" in headers or headers.get("transfer-encoding", "").lower() == "chunked"
+
+    async def _before(self, deadline: float, awaitable):
+        # Past the deadline wait_for still takes ownership of the awaitable and cancels it, instead of
+        # leaving a coroutine that is never awaited
+        remaining = deadline - asyncio.get_running_loop().time()
+        return await asyncio.wait_for(awaitable, max(remaining, 0))
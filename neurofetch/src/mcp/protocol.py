@@ -0,0 +1,105 @@
+import asyncio
+import json
+import struct
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+from typing import Dict, Any, List, Optional
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; JSON is always available
+    msgpack = None
+
+# Every frame is a 4-byte big-endian payload length followed by the encoded payload
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+class MessageType(Enum):
+    REQUEST = "request"
+    RESPONSE = "response"
+    ERROR = "error"
+    HEARTBEAT = "heartbeat"
+
+@dataclass
+class MCPMessage:
+    id: str
+    type: MessageType
+    agent_id: str
+    data: Dict[str, Any]
+    timestamp: datetime
+    correlation_id: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": self.type.value,
+            "agent_id": self.agent_id,
+            "data": self.data,
+            "timestamp": self.timestamp.isoformat(),
+            "correlation_id": self.correlation_id
+        }
+
+    @classmethod
+    def from_dict(cls, message_data: Dict[str, Any]) -> "MCPMessage":
+        return cls(
+            id=message_data["id"],
+            type=MessageType(message_data["type"]),
+            agent_id=message_data["agent_id"],
+            data=message_data["data"],
+            timestamp=datetime.fromisoformat(message_data["timestamp"]),
+            correlation_id=message_data.get("correlation_id")
+        )
+
+class FrameError(Exception):
+    """Raised when a peer sends a frame that cannot be accepted"""
+
+class JSONCodec:
+    name = "json"
+
+    def encode(self, payload: Dict[str, Any]) -> bytes:
+        return json.dumps(payload, separators=(",", ":")).encode()
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        return json.loads(data)
+
+class MsgpackCodec:
+    name = "msgpack"
+
+    def encode(self, payload: Dict[str, Any]) -> bytes:
+        return msgpack.packb(payload, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        return msgpack.unpackb(data, raw=False)
+
+CODECS = {"json": JSONCodec()}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+
+# Codecs offered at registration, most preferred first
+PREFERRED_CODECS: List[str] = [name for name in ("msgpack", "json") if name in CODECS]
+DEFAULT_CODEC = CODECS["json"]
+
+def negotiate_codec(offered: List[str]):
+    """Pick the first codec offered by the peer that this side supports"""
+    for name in offered or []:
+        if name in CODECS:
+            return CODECS[name]
+    return DEFAULT_CODEC
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Read one complete frame, or return None on a clean end of stream"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise FrameError("Connection closed inside a frame header")
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {length} bytes exceeds limit of {MAX_FRAME_SIZE}")
+    return await reader.readexactly(length)
+
+def write_frame(writer: asyncio.StreamWriter, payload: bytes):
+    """Queue one frame on the transport without concatenating header and payload"""
+    writer.writelines((FRAME_HEADER.pack(len(payload)), memoryview(payload)))
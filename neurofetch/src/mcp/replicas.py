@@ -0,0 +1,106 @@
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+# Agents that keep no per-process state, so any replica can serve any call. Retrieval needs the
+# index it searches, so it scales out as worker nodes holding shards (mcp.worker_node) instead
+REPLICA_AGENT_TYPES = ("structured_data_extraction", "query_reformulation")
+
+class ReplicaRegistry:
+    """Registered agents grouped by type, with the load each replica reports in its heartbeats"""
+
+    def __init__(self, heartbeat_timeout: float = 90.0):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.agents: Dict[str, Dict[str, Any]] = {}
+        # Request id -> replica currently working on it
+        self.outstanding: Dict[str, str] = {}
+        self.evictions = 0
+
+    def register(self, agent_id: str, agent_type: str, capabilities: List[str]):
+        now = datetime.now()
+        self.agents[agent_id] = {
+            "type": agent_type,
+            "capabilities": capabilities,
+            "status": "active",
+            "registered_at": now,
+            "last_heartbeat": now,
+            "load": 0,
+            "in_flight": 0,
+            "dispatched": 0
+        }
+
+    def heartbeat(self, agent_id: str, load: Optional[int] = None) -> bool:
+        """Record a heartbeat; a replica evicted for missing heartbeats becomes routable again"""
+        info = self.agents.get(agent_id)
+        if info is None:
+            return False
+        info["last_heartbeat"] = datetime.now()
+        info["status"] = "active"
+        if load is not None:
+            info["load"] = load
+        return True
+
+    def pick(self, agent_type: str, exclude: Optional[str] = None) -> Optional[str]:
+        """Least-loaded live replica of a type, spreading ties by how much each has been sent"""
+        candidates = [
+            # Reported load lags by up to one heartbeat, so requests sent since then count too
+            (max(info["load"], info["in_flight"]), info["dispatched"], agent_id)
+            for agent_id, info in self.agents.items()
+            if info["type"] == agent_type and info["status"] == "active" and agent_id != exclude
+        ]
+        return min(candidates)[2] if candidates else None
+
+    def has_live(self, agent_type: str) -> bool:
+        return bool(self.live(agent_type))
+
+    def live(self, agent_type: str) -> List[str]:
+        return [agent_id for agent_id, info in self.agents.items()
+                if info["type"] == agent_type and info["status"] == "active"]
+
+    def is_live(self, agent_id: str) -> bool:
+        return self.agents.get(agent_id, {}).get("status") == "active"
+
+    def dispatched(self, request_id: str, agent_id: str):
+        self.outstanding[request_id] = agent_id
+        info = self.agents[agent_id]
+        info["in_flight"] += 1
+        info["dispatched"] += 1
+
+    def completed(self, request_id: str) -> Optional[str]:
+        agent_id = self.outstanding.pop(request_id, None)
+        if agent_id in self.agents:
+            self.agents[agent_id]["in_flight"] = max(0, self.agents[agent_id]["in_flight"] - 1)
+        return agent_id
+
+    def requests_on(self, agent_id: str) -> List[str]:
+        return [request_id for request_id, replica_id in self.outstanding.items() if replica_id == agent_id]
+
+    def evict_stale(self) -> List[str]:
+        """Stop routing to replicas whose last heartbeat is older than the timeout"""
+        now = datetime.now()
+        stale = [
+            agent_id for agent_id, info in self.agents.items()
+            if info["status"] == "active"
+            and (now - info["last_heartbeat"]).total_seconds() > self.heartbeat_timeout
+        ]
+        for agent_id in stale:
+            self.agents[agent_id]["status"] = "evicted"
+        self.evictions += len(stale)
+        return stale
+
+    def remove(self, agent_id: str):
+        self.agents.pop(agent_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        by_type: Dict[str, Dict[str, Any]] = {}
+        for agent_id, info in self.agents.items():
+            entry = by_type.setdefault(info["type"], {"live": 0, "evicted": 0, "replicas": {}})
+            entry["live" if info["status"] == "active" else "evicted"] += 1
+            entry["replicas"][agent_id] = {
+                "status": info["status"],
+                "load": info["load"],
+                "in_flight": info["in_flight"],
+                "dispatched": info["dispatched"],
+                "heartbeat_age_s": round((datetime.now() - info["last_heartbeat"]).total_seconds(), 1)
+            }
+        return {"heartbeat_timeout_s": self.heartbeat_timeout, "evictions": self.evictions,
+                "outstanding": len(self.outstanding), "types": by_type}
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List
+
+# Served strictly in this order: control traffic (responses, errors, heartbeats) first,
+# then interactive chat requests, then normal and finally bulk/background work
+PRIORITY_CLASSES: List[str] = ["control", "interactive", "normal", "bulk"]
+
+class FairPriorityQueue:
+    """Bounded message queue with priority classes and round-robin fairness between agents"""
+
+    def __init__(self, maxsize: int = 1000, wait_window: int = 1000):
+        self.maxsize = maxsize
+        self._classes: Dict[str, "OrderedDict[str, deque]"] = {name: OrderedDict() for name in PRIORITY_CLASSES}
+        self._size = 0
+        self._bounded_size = 0
+        lock = asyncio.Lock()
+        self._not_empty = asyncio.Condition(lock)
+        self._not_full = asyncio.Condition(lock)
+        self.blocked_puts = 0
+        self._waits = {name: deque(maxlen=wait_window) for name in PRIORITY_CLASSES}
+        self._counts = {name: {"enqueued": 0, "dequeued": 0} for name in PRIORITY_CLASSES}
+
+    def qsize(self) -> int:
+        return self._size
+
+    async def put(self, item: Any, agent_id: str, priority: str = "normal", bounded: bool = True):
+        """Enqueue an item, waiting for room when the queue is full.
+
+        Unbounded puts are for server-generated control messages, which must never block a
+        worker that is itself holding a slot.
+        """
+        if priority not in self._classes:
+            priority = "normal"
+        async with self._not_full:
+            if bounded and self._bounded_size >= self.maxsize:
+                self.blocked_puts += 1
+                await self._not_full.wait_for(lambda: self._bounded_size < self.maxsize)
+            if bounded:
+                self._bounded_size += 1
+            self._classes[priority].setdefault(agent_id, deque()).append((time.perf_counter(), bounded, item))
+            self._size += 1
+            self._counts[priority]["enqueued"] += 1
+            self._not_empty.notify()
+
+    async def get(self) -> Any:
+        """Dequeue from the highest non-empty priority class, rotating between agents within it"""
+        async with self._not_empty:
+            await self._not_empty.wait_for(lambda: self._size > 0)
+            for priority in PRIORITY_CLASSES:
+                agents = self._classes[priority]
+                if agents:
+                    break
+            agent_id, items = next(iter(agents.items()))
+            enqueued_at, bounded, item = items.popleft()
+            if items:
+                agents.move_to_end(agent_id)
+            else:
+                del agents[agent_id]
+            self._size -= 1
+            if bounded:
+                self._bounded_size -= 1
+                self._not_full.notify()
+            self._counts[priority]["dequeued"] += 1
+            self._waits[priority].append(time.perf_counter() - enqueued_at)
+            return item
+
+    def stats(self) -> Dict[str, Any]:
+        classes = {}
+        for priority in PRIORITY_CLASSES:
+            waits = sorted(self._waits[priority])
+            classes[priority] = {
+                "depth": sum(len(items) for items in self._classes[priority].values()),
+                "agents_waiting": len(self._classes[priority]),
+                **self._counts[priority],
+                "wait_ms": {
+                    "mean": round(1000 * sum(waits) / len(waits), 3) if waits else 0.0,
+                    "p95": round(1000 * waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+                    "max": round(1000 * waits[-1], 3) if waits else 0.0
+                }
+            }
+        return {
+            "depth": self._size,
+            "bounded_depth": self._bounded_size,
+            "maxsize": self.maxsize,
+            "blocked_puts": self.blocked_puts,
+            "classes": classes
+        }
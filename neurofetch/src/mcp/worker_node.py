@@ -0,0 +1,98 @@
+"""Run worker nodes that each hold one shard of the corpus for the MCP shard broker.
+
+A node registers as a "worker_node" replica and keeps its own retrieval index and
+structured-extraction cache for the documents the broker places on it.
+
+    python -m mcp.worker_node --nodes 3 --port 8001
+"""
+import argparse
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, Any
+
+from .broker import NODE_AGENT_TYPE
+from .launcher import run_processes
+from .mcp_client import MCPClient
+
+class WorkerNode:
+    """One shard: a retrieval index over the documents placed here and their extracted tables"""
+
+    def __init__(self):
+        from agents.retrieval_agent import AdaptiveRetrievalAgent
+        from agents.structured_data_agent import StructuredDataExtractionAgent
+        self.retrieval_agent = AdaptiveRetrievalAgent()
+        self.structured_agent = StructuredDataExtractionAgent()
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.extraction_cache: Dict[tuple, Dict[str, Any]] = {}
+        # FAISS is not safe to search while chunks are being added
+        self.index_lock = threading.Lock()
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "index":
+            return self._index(request)
+        if op == "retrieve":
+            return self._retrieve(request)
+        if op == "extract":
+            return self._extract(request["input"])
+        if op == "stats":
+            return {"documents": len(self.documents), "cached_extractions": len(self.extraction_cache)}
+        raise ValueError(f"Unknown worker node operation: {op}")
+
+    def _index(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        doc_id = request["doc_id"]
+        with self.index_lock:
+            chunks = self.retrieval_agent.index_document(doc_id, request.get("path"), request.get("text"),
+                                                         request.get("source"))
+        self.documents[doc_id] = {"path": request.get("path"), "chunks": chunks}
+        return {"chunks": chunks}
+
+    def _retrieve(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        agent_input = dict(request["input"])
+        wanted = set(request.get("doc_ids") or [])
+        # Restrict the search itself, so the top k are taken among the requested documents only;
+        # a query over everything this node holds needs no filter
+        if wanted and not wanted.issuperset(self.documents):
+            agent_input["doc_ids"] = sorted(wanted)
+        with self.index_lock:
+            return self.retrieval_agent.process(agent_input)
+
+    def _extract(self, agent_input: Dict[str, Any]) -> Dict[str, Any]:
+        doc_id = agent_input["doc_id"]
+        key = (doc_id, agent_input.get("data_type"), agent_input.get("pages", "all"))
+        if key not in self.extraction_cache:
+            pdf_path = agent_input.get("pdf_path") or self.documents.get(doc_id, {}).get("path")
+            result = self.structured_agent.process({**agent_input, "pdf_path": pdf_path})
+            if not result.get("success"):
+                return result
+            self.extraction_cache[key] = result
+        return self.extraction_cache[key]
+
+async def serve_node(node_id: str, host: str, port: int, heartbeat_interval: float):
+    node = WorkerNode()
+    client = MCPClient(node_id, host, port, agent_type=NODE_AGENT_TYPE, capabilities=["retrieve", "extract"])
+    client.serve(node.handle)
+    await client.connect()
+    await client.start_heartbeat(heartbeat_interval)
+
+def run_node(node_id: str, host: str, port: int, heartbeat_interval: float):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve_node(node_id, host, port, heartbeat_interval))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=1)
+    parser.add_argument("--first-node", type=int, default=0, help="Index of the first node id (node-<index>)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("NEUROFETCH_MCP_PORT", 8001)))
+    parser.add_argument("--heartbeat-interval", type=float, default=10.0)
+    args = parser.parse_args()
+
+    # Node ids are stable across restarts so the hash ring places documents on the same nodes
+    node_ids = [f"node-{args.first_node + i}" for i in range(args.nodes)]
+    run_processes(run_node, [(node_id, args.host, args.port, args.heartbeat_interval) for node_id in node_ids])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The apps import from src ("from agents...", "from mcp..."); put it first, ahead of the PyPI mcp package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+"""Concurrent in-flight LLM calls over an in-process MCP server and a pooled client"""
+import asyncio
+from collections import defaultdict
+
+from benchmarks.mcp_throughput import StubLLMServer
+from mcp.mcp_client import MCPClient
+
+CLIENTS = 3
+POOL_SIZE = 2
+IN_FLIGHT = 16
+CALLS_PER_CLIENT = 120
+
+def track_connections(client, sent, received):
+    """Record the request ids sent on, and the responses delivered to, each pooled connection"""
+    send_request = client._send_request
+
+    async def recording_send(connection, request_id, data, timeout):
+        sent[id(connection)].add(request_id)
+        return await send_request(connection, request_id, data, timeout)
+    client._send_request = recording_send
+
+    for connection in client.pool:
+        handle_response = connection._handle_response
+
+        async def recording_handle(message, connection=connection, handle_response=handle_response):
+            received[id(connection)].add(message.correlation_id)
+            await handle_response(message)
+        connection._handle_response = recording_handle
+
+async def run_calls():
+    server = StubLLMServer(0.01, host="127.0.0.1", port=0, num_workers=32)
+    await server.register_llm_connection("default", "ollama", "stub")
+    listener = await server.listen()
+    clients = [MCPClient(f"test_{i}", "127.0.0.1", server.port, pool_size=POOL_SIZE) for i in range(CLIENTS)]
+    sent, received = defaultdict(set), defaultdict(set)
+    try:
+        for client in clients:
+            await client.connect()
+            track_connections(client, sent, received)
+
+        async def caller(client, prompts):
+            answers = []
+            for prompt in prompts:
+                answers.append((prompt, (await client.call_llm(prompt, timeout=10))["response"]))
+            return answers
+
+        # Prompts are unique, so each answer can be matched to the call that asked for it
+        calls = []
+        for c, client in enumerate(clients):
+            prompts = [f"c{c} p{i}" for i in range(CALLS_PER_CLIENT)]
+            calls.extend(caller(client, prompts[slot::IN_FLIGHT]) for slot in range(IN_FLIGHT))
+        answers = [answer for answers in await asyncio.gather(*calls) for answer in answers]
+        pending = sum(len(connection.pending_requests) for client in clients for connection in client.pool)
+        return answers, sent, received, pending
+    finally:
+        for client in clients:
+            await client.disconnect()
+        listener.close()
+        await listener.wait_closed()
+
+def test_every_concurrent_call_completes_on_its_own_connection():
+    answers, sent, received, pending = asyncio.run(run_calls())
+
+    assert len(answers) == CLIENTS * CALLS_PER_CLIENT
+    assert all(answer == f"stub answer to {prompt}" for prompt, answer in answers)
+    assert pending == 0
+    # Every connection carried requests, and got back exactly the responses to what it sent
+    assert len(sent) == CLIENTS * POOL_SIZE
+    assert dict(received) == dict(sent)
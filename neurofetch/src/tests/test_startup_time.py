@@ -0,0 +1,17 @@
+"""Importing the apps must stay cheap: agents and their heavy dependencies load on first use"""
+import os
+
+import pytest
+
+from benchmarks.startup_time import measure
+
+# Generous for CI machines; a heavy dependency imported eagerly costs several seconds
+MAX_IMPORT_MS = float(os.environ.get("NEUROFETCH_MAX_IMPORT_MS", 1500))
+
+@pytest.mark.parametrize("module", ["app", "mcp.mcp_server"])
+def test_import_time_is_bounded(module):
+    result = measure(module)
+
+    assert result["wall_ms"] <= MAX_IMPORT_MS, result["slowest_imports"]
+    assert result["heavy_modules_loaded"] == []
+    assert not any(agent["loaded"] for agent in result["agents"].values())
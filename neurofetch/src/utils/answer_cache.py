@@ -0,0 +1,134 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import numpy as np
+
+logger = logging.getLogger("answer_cache")
+
+class SemanticAnswerCache:
+    """LRU cache of generated answers, matched by cosine similarity of question embeddings"""
+
+    def __init__(self, embeddings, threshold: float = 0.95, max_entries: int = 256):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.corpus_version = None
+        self.entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.exact_keys: Dict[tuple, int] = {}
+        self.vector_memo: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.next_key = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, question: str, corpus_version: Any, scope: str = "") -> Optional[Any]:
+        """Return a cached answer for this question (or a close paraphrase) on the same corpus"""
+        normalized = self._normalize(question)
+        with self.lock:
+            self._check_version(corpus_version)
+            key = self.exact_keys.get((scope, normalized))
+            if key is not None:
+                return self._hit(key)
+            if not self.entries:
+                self.misses += 1
+                return None
+
+        vector = self._embed(normalized, question)
+        with self.lock:
+            if vector is None or self.corpus_version != corpus_version:
+                self.misses += 1
+                return None
+            candidates = [(key, entry) for key, entry in self.entries.items() if entry["scope"] == scope]
+            if candidates:
+                similarities = np.vstack([entry["vector"] for _, entry in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    return self._hit(candidates[best][0])
+            self.misses += 1
+            return None
+
+    def store(self, question: str, corpus_version: Any, answer: Any, scope: str = ""):
+        """Cache an answer generated for this question on the given corpus version"""
+        normalized = self._normalize(question)
+        vector = self._embed(normalized, question)
+        if vector is None:
+            return
+        with self.lock:
+            self._check_version(corpus_version)
+            existing = self.exact_keys.pop((scope, normalized), None)
+            if existing is not None:
+                self.entries.pop(existing, None)
+            key = self.next_key
+            self.next_key += 1
+            self.entries[key] = {"scope": scope, "question": normalized, "vector": vector, "answer": answer}
+            self.exact_keys[(scope, normalized)] = key
+            while len(self.entries) > self.max_entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.exact_keys.pop((evicted["scope"], evicted["question"]), None)
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop every cached answer"""
+        with self.lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "corpus_version": self.corpus_version
+            }
+
+    def _hit(self, key: int) -> Any:
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return self.entries[key]["answer"]
+
+    def _check_version(self, corpus_version: Any):
+        # Answers generated against an older index are stale as soon as the index changes
+        if corpus_version != self.corpus_version:
+            if self.entries:
+                self.invalidations += 1
+            self._clear()
+            self.corpus_version = corpus_version
+
+    def _clear(self):
+        self.entries.clear()
+        self.exact_keys.clear()
+
+    def _normalize(self, question: str) -> str:
+        return " ".join(re.findall(r"\w+", question.lower()))
+
+    def _embed(self, normalized: str, question: str) -> Optional[np.ndarray]:
+        """Vector for a question, memoized by its normalized form. The question is embedded as asked,
+        which is the text retrieval searches with, so a memoizing embeddings client serves both"""
+        with self.lock:
+            vector = self.vector_memo.get(normalized)
+            if vector is not None:
+                self.vector_memo.move_to_end(normalized)
+                return vector
+        try:
+            vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Could not embed question for answer cache: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        with self.lock:
+            self.vector_memo[normalized] = vector
+            while len(self.vector_memo) > self.max_entries:
+                self.vector_memo.popitem(last=False)
+        return vector
@@ -0,0 +1,45 @@
+import re
+from typing import Any, Dict
+from langchain.memory import ConversationBufferMemory
+from .tokens import estimate_tokens
+
+# Pronouns and openers that usually point back at an earlier turn
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|they|them|their|this|that|these|those|he|she|him|her|his|there|"
+    r"former|latter|above|previous|earlier|same|else|more|also|again)\b"
+    r"|^\s*(and|but|so|or|what about|how about)\b",
+    re.IGNORECASE
+)
+
+class TokenBudgetMemory(ConversationBufferMemory):
+    """Conversation memory that keeps only the most recent turns within a token budget"""
+
+    max_token_limit: int = 1500
+    max_messages: int = 20
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        self.prune()
+
+    def prune(self):
+        """Drop the oldest question/answer pairs until the history fits both limits"""
+        messages = list(self.chat_memory.messages)
+        total_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+
+        drop = 0
+        while len(messages) - drop > 2 and (
+            len(messages) - drop > self.max_messages or total_tokens > self.max_token_limit
+        ):
+            for message in messages[drop:drop + 2]:
+                total_tokens -= estimate_tokens(str(message.content))
+            drop += 2
+
+        if drop:
+            self.chat_memory.messages = messages[drop:]
+
+def is_self_contained_question(question: str, min_words: int = 4) -> bool:
+    """Guess whether a question can be answered without rewriting it against the chat history"""
+    words = re.findall(r"\b\w+\b", question)
+    if len(words) < min_words:
+        return False
+    return not FOLLOW_UP_PATTERN.search(question)
@@ -0,0 +1,80 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Set
+from .tokens import estimate_tokens
+
+STOP_WORDS = {
+    "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by",
+    "is", "are", "was", "were", "be", "been", "have", "has", "had", "do", "does", "did",
+    "what", "which", "who", "how", "why", "when", "where", "this", "that", "it", "me", "about"
+}
+
+@dataclass
+class PackedContext:
+    """Compact prompt context built from ranked documents"""
+    text: str
+    passages: List[str]
+    original_tokens: int
+    packed_tokens: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - self.packed_tokens)
+
+def pack_context(documents: List[Any], query: str, token_budget: int = 800) -> PackedContext:
+    """Keep the query-relevant, non-repeated sentences of ranked documents within a token budget.
+
+    Documents may be retrieval agent results (dicts with "content") or langchain Documents.
+    Metadata, scores and timestamps are dropped; only text reaches the prompt.
+    """
+    contents = [_document_text(doc) for doc in documents]
+    original_tokens = sum(estimate_tokens(content) for content in contents)
+    query_terms = _terms(query)
+
+    # Chunks overlap, so the same sentence often shows up in neighbouring chunks
+    seen: List[str] = []
+    candidates = []
+    for doc_index, content in enumerate(contents):
+        for sentence_index, sentence in enumerate(_split_sentences(content)):
+            key = " ".join(re.findall(r"\w+", sentence.lower()))
+            if not key or any(key in existing for existing in seen):
+                continue
+            seen.append(key)
+            score = len(query_terms & _terms(sentence))
+            candidates.append((score, doc_index, sentence_index, sentence))
+
+    relevant = [candidate for candidate in candidates if candidate[0] > 0] or candidates
+    # Most relevant sentences first; earlier-ranked documents win ties
+    relevant.sort(key=lambda candidate: (-candidate[0], candidate[1], candidate[2]))
+
+    selected = []
+    used_tokens = 0
+    for candidate in relevant:
+        cost = estimate_tokens(candidate[3])
+        if used_tokens + cost > token_budget:
+            continue
+        selected.append(candidate)
+        used_tokens += cost
+
+    # Restore reading order within and across documents
+    selected.sort(key=lambda candidate: (candidate[1], candidate[2]))
+    grouped: Dict[int, List[str]] = {}
+    for _, doc_index, _, sentence in selected:
+        grouped.setdefault(doc_index, []).append(sentence)
+    passages = [" ".join(sentences) for sentences in grouped.values()]
+
+    text = "\n".join(f"[{i}] {passage}" for i, passage in enumerate(passages, 1))
+    return PackedContext(text=text, passages=passages, original_tokens=original_tokens, packed_tokens=estimate_tokens(text))
+
+def _document_text(doc: Any) -> str:
+    if isinstance(doc, dict):
+        return str(doc.get("content", ""))
+    return str(getattr(doc, "page_content", doc))
+
+def _split_sentences(text: str) -> List[str]:
+    parts = re.split(r"(?<=[.!?])\s+|\n+", text)
+    return [" ".join(part.split()) for part in parts if part.strip()]
+
+def _terms(text: str) -> Set[str]:
+    words = re.findall(r"\w+", text.lower())
+    return {word.rstrip("s") if len(word) > 3 else word for word in words if word not in STOP_WORDS}
@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from .metrics import timed
+from .single_flight import SingleFlight, flight_key
+
+class CoalescingEmbeddings(Embeddings):
+    """Embeddings wrapper that shares identical in-flight calls and embeds duplicate texts in a batch once.
+
+    Recent query vectors are also kept by text, so a question embedded for the answer cache is not
+    embedded again by the vector search that follows it.
+    """
+
+    def __init__(self, embeddings: Embeddings, query_memo_size: int = 256):
+        self.embeddings = embeddings
+        self.query_memo_size = query_memo_size
+        self.query_memo: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.query_memo_hits = 0
+        self._memo_lock = threading.Lock()
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.flights = SingleFlight()
+        self.duplicate_texts = 0
+        # Only upstream calls are timed; callers that joined a flight are not counted again
+        self._timed_query = timed("embeddings", "embed_query")(embeddings.embed_query)
+        self._timed_documents = timed("embeddings", "embed_documents")(embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._memo_lock:
+            vector = self.query_memo.get(text)
+            if vector is not None:
+                self.query_memo.move_to_end(text)
+                self.query_memo_hits += 1
+                return vector
+        vector = self.flights.do(flight_key("query", self.model, text), lambda: self._timed_query(text))
+        with self._memo_lock:
+            self.query_memo[text] = vector
+            while len(self.query_memo) > self.query_memo_size:
+                self.query_memo.popitem(last=False)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        unique = list(dict.fromkeys(texts))
+        self.duplicate_texts += len(texts) - len(unique)
+        vectors = self.flights.do(flight_key("documents", self.model, unique),
+                                  lambda: self._timed_documents(unique))
+        by_text = dict(zip(unique, vectors))
+        return [by_text[text] for text in texts]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.flights.stats(), "duplicate_texts": self.duplicate_texts, "query_memo_hits": self.query_memo_hits}
@@ -0,0 +1,75 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict
+
+class HealthProber:
+    """Runs cheap liveness probes in the background and serves their last results from memory.
+
+    A probe returns a dict of details and raises when the component is unhealthy. Readers never
+    wait on a probe: entries older than ttl are returned marked stale and a refresh is requested.
+    """
+
+    def __init__(self, probes: Dict[str, Callable[[], Dict[str, Any]]], interval: float = 10.0,
+                 ttl: float = 30.0, timeout: float = 5.0):
+        self.probes = probes
+        self.interval = interval
+        self.ttl = ttl
+        self.timeout = timeout
+        self.logger = logging.getLogger("health_prober")
+        self.results: Dict[str, Dict[str, Any]] = {
+            name: {"status": "unknown", "checked_at": None} for name in probes
+        }
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(probes)), thread_name_prefix="health")
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start probing in the background; safe to call from every request"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+                self._thread.start()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Latest result per probe, without running anything"""
+        now = time.time()
+        snapshot = {}
+        for name, result in self.results.items():
+            checked_at = result.get("checked_at")
+            stale = checked_at is None or now - checked_at > self.ttl
+            if stale:
+                self._wake.set()
+            snapshot[name] = dict(result, stale=stale)
+        return snapshot
+
+    def check(self, name: str) -> Dict[str, Any]:
+        """Run one probe now and cache its result"""
+        started = time.perf_counter()
+        future = self._executor.submit(self.probes[name])
+        try:
+            result = {"status": "ok", **(future.result(timeout=self.timeout) or {})}
+        except FutureTimeout:
+            result = {"status": "error", "error": f"probe timed out after {self.timeout}s"}
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+        result["latency_ms"] = round(1000 * (time.perf_counter() - started), 2)
+        result["checked_at"] = time.time()
+        # Replaced whole so readers always see a consistent entry
+        self.results[name] = result
+        return result
+
+    def check_all(self):
+        for name in self.probes:
+            self.check(name)
+
+    def _run(self):
+        while True:
+            try:
+                self.check_all()
+            except Exception as e:
+                self.logger.error(f"Health probe round failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
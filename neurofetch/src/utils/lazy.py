@@ -0,0 +1,26 @@
+import threading
+from typing import Any, Callable
+
+class LazyProxy:
+    """Stands in for an object that is only built, once, on first attribute access"""
+
+    __slots__ = ("_factory", "_instance", "_lock")
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def resolve(self) -> Any:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.resolve(), name)
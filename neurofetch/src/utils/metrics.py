@@ -0,0 +1,197 @@
+import bisect
+import functools
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .tracing import TRACER, activate, current_span, deactivate
+
+# Seconds; spans a cache hit through a slow local LLM generation
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Fixed-bucket histogram; an observation is a bisect and three additions under a lock"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+# One registry per process; each app serves it on /metrics
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("neurofetch_stage_seconds", "Time spent in each pipeline stage",
+                                   ("component", "stage"))
+STAGE_ERRORS = REGISTRY.counter("neurofetch_stage_errors_total", "Pipeline stages that raised",
+                                ("component", "stage"))
+HTTP_SECONDS = REGISTRY.histogram("neurofetch_http_request_seconds", "Flask request handling time until the response is returned",
+                                  ("method", "route", "status"))
+
+class timed:
+    """Time a pipeline stage into neurofetch_stage_seconds, as a context manager or a decorator.
+    Inside a traced request the stage is also recorded as a span named component.stage.
+
+        with timed("adaptive_retrieval", "faiss_search"): ...
+
+        @timed("embeddings", "embed_query")
+        def embed_query(...): ...
+    """
+
+    __slots__ = ("component", "stage", "_started", "_span", "_token")
+
+    def __init__(self, component: str, stage: str):
+        self.component = component
+        self.stage = stage
+        self._started = 0.0
+        self._span = None
+
+    def __enter__(self):
+        # Untraced calls skip span creation entirely
+        if current_span() is not None:
+            self._span = TRACER.start_span(f"{self.component}.{self.stage}")
+            self._token = activate(self._span)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self._started, component=self.component, stage=self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(component=self.component, stage=self.stage)
+        if self._span is not None:
+            deactivate(self._token)
+            TRACER.finish(self._span, exc)
+            self._span = None
+        return False
+
+    def __call__(self, fn):
+        component, stage = self.component, self.stage
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(component, stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+def timed_stage(stage: str):
+    """Decorator for agent methods; labels the stage with the agent's own id"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with timed(self.agent_id, stage):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+def instrument_flask(app, registry: MetricsRegistry = REGISTRY, path: str = "/metrics"):
+    """Time every request by route template and serve the registry as Prometheus text on path"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        started = getattr(g, "metrics_started", None)
+        if started is not None:
+            # The rule template keeps cardinality bounded (/health/<name>, not one series per name)
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route,
+                                 status=response.status_code)
+        return response
+
+    @app.route(path, methods=["GET"])
+    def metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    return app
@@ -0,0 +1,24 @@
+import logging
+from typing import Any, List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from .context_packer import pack_context
+
+logger = logging.getLogger("context_packer")
+
+def packed_documents(documents: List[Any], query: str, token_budget: int = 800) -> List[Document]:
+    """Ranked documents packed to their query-relevant, non-repeated sentences, one Document per passage"""
+    packed = pack_context(documents, query, token_budget)
+    logger.info(f"Packed {len(documents)} documents into {packed.packed_tokens} prompt tokens ({packed.tokens_saved} saved)")
+    return [Document(page_content=passage) for passage in packed.passages]
+
+class PackedContextRetriever(BaseRetriever):
+    """Retriever whose results are packed within a token budget before a chain stuffs them into its prompt"""
+
+    base_retriever: BaseRetriever
+    token_budget: int = 800
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return packed_documents(documents, query, self.token_budget)
@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+def flight_key(*parts: Any) -> str:
+    """Stable key for a request; dicts compare equal regardless of key order"""
+    encoded = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+class AsyncSingleFlight:
+    """Collapse identical concurrent coroutine calls into one, fanning its result out to every caller"""
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller timing out or being cancelled does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "upstream": self.calls - self.coalesced,
+                "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Thread-safe single-flight for blocking calls: followers wait for the leader's result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls": self.calls, "upstream": self.calls - self.coalesced,
+                    "coalesced": self.coalesced, "in_flight": len(self._flights)}
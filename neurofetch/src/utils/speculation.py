@@ -0,0 +1,74 @@
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict
+
+from .tracing import bind
+
+class BranchCancelled(Exception):
+    """Raised inside a branch that noticed it is no longer needed"""
+
+class SpeculativeRun:
+    """Start several branches at once, use the ones the routing decision needs and cancel the rest"""
+
+    def __init__(self, executor: Executor):
+        self.executor = executor
+        self.started_at = time.perf_counter()
+        self.branches: Dict[str, Dict[str, Any]] = {}
+
+    def launch(self, name: str, fn: Callable[[threading.Event], Any]):
+        """Start a branch; fn receives an Event that is set once the branch is cancelled"""
+        branch = {"cancel_event": threading.Event(), "started": None, "finished": None, "needed_at": None, "status": "running"}
+
+        def run():
+            branch["started"] = time.perf_counter()
+            try:
+                return fn(branch["cancel_event"])
+            finally:
+                branch["finished"] = time.perf_counter()
+
+        # Branches run under the caller's trace, so their spans nest under the request
+        branch["future"] = self.executor.submit(bind(run))
+        self.branches[name] = branch
+
+    def result(self, name: str) -> Any:
+        """Wait for a branch the routing decision depends on and return its result"""
+        branch = self.branches[name]
+        branch["needed_at"] = time.perf_counter()
+        branch["status"] = "used"
+        return branch["future"].result()
+
+    def cancel(self, name: str):
+        """Signal a branch that lost; queued branches never start and running ones stop at their next check"""
+        branch = self.branches[name]
+        branch["cancel_event"].set()
+        branch["status"] = "cancelled"
+        branch["future"].cancel()
+        branch["future"].add_done_callback(_consume_exception)
+
+    def report(self) -> Dict[str, Any]:
+        """Per-branch durations and how much of each used branch overlapped with the critical path"""
+        branches = {}
+        total_saved = 0.0
+        for name, branch in self.branches.items():
+            started, finished, needed_at = branch["started"], branch["finished"], branch["needed_at"]
+            duration = (finished or time.perf_counter()) - started if started is not None else 0.0
+            time_saved = 0.0
+            if branch["status"] == "used" and started is not None:
+                # Serially this branch would only have started when it was needed
+                time_saved = max(0.0, min(duration, needed_at - started))
+            total_saved += time_saved
+            branches[name] = {
+                "status": branch["status"],
+                "duration": round(duration, 3),
+                "time_saved": round(time_saved, 3)
+            }
+        return {
+            "branches": branches,
+            "time_saved": round(total_saved, 3),
+            "elapsed": round(time.perf_counter() - self.started_at, 3)
+        }
+
+def _consume_exception(future: Future):
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,38 @@
+import json
+import queue
+from typing import Any, Dict, Iterator
+from langchain_core.callbacks import BaseCallbackHandler
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """Callback handler that hands answer tokens from a running chain to a streaming response"""
+
+    _DONE = object()
+
+    def __init__(self, wait_for_retrieval: bool = True):
+        self.queue: "queue.Queue[Any]" = queue.Queue()
+        # ConversationalRetrievalChain may call the LLM to condense the question before
+        # retrieving; only tokens generated after retrieval belong to the answer.
+        self.answering = not wait_for_retrieval
+
+    def on_retriever_end(self, documents, **kwargs: Any) -> None:
+        self.answering = True
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if self.answering:
+            self.queue.put(token)
+
+    def finish(self):
+        """Signal that generation is over so the token iterator can stop"""
+        self.queue.put(self._DONE)
+
+    def tokens(self) -> Iterator[str]:
+        """Yield answer tokens as they arrive until finish() is called"""
+        while True:
+            token = self.queue.get()
+            if token is self._DONE:
+                return
+            yield token
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,68 @@
+from typing import Dict, List, Optional, Sequence
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN = 72
+LINE_HEIGHT = 14
+ROW_HEIGHT = 20
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _page_content(lines: Sequence[str], table: Optional[Sequence[Sequence[str]]]) -> bytes:
+    ops = []
+    y = PAGE_HEIGHT - MARGIN
+    for line in lines:
+        ops.append(f"BT /F1 10 Tf {MARGIN} {y} Td ({_escape(line)}) Tj ET")
+        y -= LINE_HEIGHT
+    if table:
+        columns = max(len(row) for row in table)
+        column_width = (PAGE_WIDTH - 2 * MARGIN) / columns
+        top = y - LINE_HEIGHT
+        bottom = top - ROW_HEIGHT * len(table)
+        # Ruled grid so lattice extraction finds the cells
+        for r in range(len(table) + 1):
+            ops.append(f"{MARGIN} {top - r * ROW_HEIGHT} m {PAGE_WIDTH - MARGIN} {top - r * ROW_HEIGHT} l S")
+        for c in range(columns + 1):
+            x = MARGIN + c * column_width
+            ops.append(f"{x:.1f} {top} m {x:.1f} {bottom} l S")
+        for r, row in enumerate(table):
+            for c, cell in enumerate(row):
+                x = MARGIN + c * column_width + 4
+                ops.append(f"BT /F1 9 Tf {x:.1f} {top - (r + 1) * ROW_HEIGHT + 6} Td ({_escape(str(cell))}) Tj ET")
+    return "\n".join(ops).encode("latin-1", "replace")
+
+def write_pdf(path: str, pages: List[Dict]) -> str:
+    """Write a minimal text PDF; each page is {"lines": [...], "table": [[header...], [row...]]}"""
+    objects: List[bytes] = []
+    page_ids = []
+    font_id = 3 + 2 * len(pages)
+    for index, page in enumerate(pages):
+        page_id, content_id = 3 + 2 * index, 4 + 2 * index
+        page_ids.append(page_id)
+        content = _page_content(page.get("lines", []), page.get("table"))
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode(),
+        *objects,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+
+    body = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        body += f"{offset:010d} 00000 n \n".encode()
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(body)
+    return path
@@ -0,0 +1,5 @@
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) that avoids loading a tokenizer"""
+    if not text:
+        return 0
+    return len(text) // 4 + 1
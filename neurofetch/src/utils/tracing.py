@@ -0,0 +1,280 @@
+import contextvars
+import functools
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+# W3C trace context header: version-trace_id-parent_span_id-flags
+TRACEPARENT_HEADER = "traceparent"
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+# Spans a replica recorded for an agent call ride back to the server under this key of the reply data
+REMOTE_SPANS_FIELD = "_trace_spans"
+
+_current: contextvars.ContextVar = contextvars.ContextVar("neurofetch_span", default=None)
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(trace_id, parent_span_id) from a traceparent value, or None if it is not one"""
+    match = TRACEPARENT_RE.match(value.strip().lower()) if isinstance(value, str) else None
+    return match.groups() if match else None
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attributes", "error", "local_root")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], local_root: bool, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        # First span of this trace in this process: its parent, if any, lives in another process
+        self.local_root = local_root
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round(1000 * (self.end - self.start), 3) if self.end else None,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+class Tracer:
+    """Collects spans per trace and keeps the most recently completed traces in a bounded buffer.
+
+    A trace is complete once every span that entered it in this process without a local parent
+    has ended; spans ending after that are still attached while the trace is in the buffer.
+    """
+
+    def __init__(self, capacity: int = 200, max_spans_per_trace: int = 1000):
+        self.capacity = capacity
+        self.max_spans_per_trace = max_spans_per_trace
+        self.completed: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._open: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.dropped_spans = 0
+
+    def start_span(self, name: str, traceparent: Optional[str] = None, root: bool = False,
+                   **attributes) -> Optional[Span]:
+        """Child of the current span, or a continuation of traceparent, or a new trace if root is set;
+        None when there is nothing to attach to, which keeps untraced code paths cheap"""
+        parent = _current.get()
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, False, attributes)
+        else:
+            remote = parse_traceparent(traceparent)
+            if remote is None and not root:
+                return None
+            trace_id, parent_id = remote or (secrets.token_hex(16), None)
+            span = Span(name, trace_id, parent_id, True, attributes)
+        if span.local_root:
+            with self._lock:
+                entry = self._open.setdefault(span.trace_id, {"spans": [], "open_roots": 0})
+                entry["open_roots"] += 1
+        return span
+
+    def finish(self, span: Span, error: Optional[BaseException] = None):
+        span.end = time.time()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        with self._lock:
+            entry = self._open.get(span.trace_id) or self.completed.get(span.trace_id)
+            if entry is None:
+                self.dropped_spans += 1
+                return
+            if len(entry["spans"]) < self.max_spans_per_trace:
+                entry["spans"].append(span.to_dict())
+            else:
+                self.dropped_spans += 1
+            if span.local_root and span.trace_id in self._open:
+                entry["open_roots"] -= 1
+                if entry["open_roots"] == 0:
+                    self._complete(span.trace_id, self._open.pop(span.trace_id))
+
+    def _complete(self, trace_id: str, entry: Dict[str, Any]):
+        self.completed[trace_id] = entry
+        self.completed.move_to_end(trace_id)
+        while len(self.completed) > self.capacity:
+            self.completed.popitem(last=False)
+
+    def record_remote(self, spans: List[Dict[str, Any]]):
+        """Attach spans another process recorded for traces seen here, e.g. a replica running an agent call"""
+        with self._lock:
+            for span in spans:
+                entry = self._open.get(span.get("trace_id")) or self.completed.get(span.get("trace_id"))
+                if entry is None or len(entry["spans"]) >= self.max_spans_per_trace:
+                    self.dropped_spans += 1
+                    continue
+                entry["spans"].append(span)
+
+    def take_spans(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Spans recorded so far for a trace, removed from this process (used by replicas to send them back)"""
+        with self._lock:
+            entry = self._open.get(trace_id) or self.completed.pop(trace_id, None)
+            if entry is None:
+                return []
+            spans, entry["spans"] = entry["spans"], []
+            return spans
+
+    @contextmanager
+    def span(self, name: str, traceparent: Optional[str] = None, root: bool = False,
+             **attributes) -> Iterator[Optional[Span]]:
+        span = self.start_span(name, traceparent, root, **attributes)
+        if span is None:
+            yield None
+            return
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.finish(span, e)
+            raise
+        else:
+            self.finish(span)
+        finally:
+            _current.reset(token)
+
+    def traces(self, limit: int = 50, min_duration_ms: float = 0.0) -> List[Dict[str, Any]]:
+        """Summaries of the most recent completed traces, newest first"""
+        with self._lock:
+            entries = [(trace_id, list(entry["spans"])) for trace_id, entry in self.completed.items()]
+        summaries = []
+        for trace_id, spans in reversed(entries):
+            summary = summarize(trace_id, spans)
+            if summary["duration_ms"] >= min_duration_ms:
+                summaries.append(summary)
+            if len(summaries) >= limit:
+                break
+        return summaries
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.completed.get(trace_id) or self._open.get(trace_id)
+            spans = list(entry["spans"]) if entry else None
+        if spans is None:
+            return None
+        return {**summarize(trace_id, spans), "spans": sorted(spans, key=lambda span: span["start"])}
+
+def summarize(trace_id: str, spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    ended = [span for span in spans if span["end"] is not None]
+    start = min((span["start"] for span in spans), default=0.0)
+    end = max((span["end"] for span in ended), default=start)
+    known = {span["span_id"] for span in spans}
+    roots = [span["name"] for span in spans if span["parent_id"] not in known]
+    # Where the time went: the slowest spans, nested ones included
+    slowest = sorted(ended, key=lambda span: span["duration_ms"], reverse=True)[:5]
+    return {
+        "trace_id": trace_id,
+        "root": roots[0] if roots else None,
+        "start": start,
+        "duration_ms": round(1000 * (end - start), 3),
+        "spans": len(spans),
+        "errors": sum(1 for span in spans if span["error"]),
+        "slowest": [{"name": span["name"], "duration_ms": span["duration_ms"]} for span in slowest]
+    }
+
+TRACER = Tracer(capacity=int(os.environ.get("NEUROFETCH_TRACE_BUFFER", 200)))
+
+def span(name: str, traceparent: Optional[str] = None, root: bool = False, **attributes):
+    return TRACER.span(name, traceparent, root, **attributes)
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+def activate(span: Span) -> contextvars.Token:
+    """Make span the current span; pass the token to deactivate() when it ends"""
+    return _current.set(span)
+
+def deactivate(token: contextvars.Token):
+    _current.reset(token)
+
+def current_traceparent() -> Optional[str]:
+    span = _current.get()
+    return span.traceparent if span is not None else None
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Outgoing HTTP headers carrying the current span, so the callee continues this trace"""
+    headers = dict(headers or {})
+    traceparent = current_traceparent()
+    if traceparent:
+        headers[TRACEPARENT_HEADER] = traceparent
+    return headers
+
+def bind(fn: Callable) -> Callable:
+    """fn run under the caller's current span, for handing work to another thread"""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+def traced(coro: Awaitable) -> Awaitable:
+    """Wrap a coroutine so it runs under the caller's current span on another thread's loop,
+    e.g. with run_coroutine_threadsafe, whose tasks do not inherit the caller's context"""
+    parent = _current.get()
+
+    async def run():
+        _current.set(parent)
+        return await coro
+    return run()
+
+def trace_flask(app, tracer: Tracer = TRACER, path: str = "/debug/traces"):
+    """Open a span per request, continuing an incoming traceparent header, and serve the buffer on path"""
+    from flask import g, jsonify, request
+
+    @app.before_request
+    def _start_span():
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        span = tracer.start_span(f"{request.method} {route}", request.headers.get(TRACEPARENT_HEADER), root=True,
+                                 path=request.path)
+        g.trace_span, g.trace_token = span, _current.set(span)
+
+    @app.after_request
+    def _add_headers(response):
+        span = getattr(g, "trace_span", None)
+        if span is not None:
+            response.headers[TRACEPARENT_HEADER] = span.traceparent
+            response.headers["X-Trace-Id"] = span.trace_id
+            span.attributes["status"] = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_span(error=None):
+        span = getattr(g, "trace_span", None)
+        if span is None:
+            return
+        g.trace_span = None
+        try:
+            _current.reset(g.trace_token)
+        except ValueError:
+            # A streamed response finishes in a different context than the one the request started in
+            _current.set(None)
+        tracer.finish(span, error)
+
+    @app.route(path, methods=["GET"])
+    def list_traces():
+        return jsonify({
+            "traces": tracer.traces(int(request.args.get("limit", 50)), float(request.args.get("min_ms", 0))),
+            "capacity": tracer.capacity,
+            "dropped_spans": tracer.dropped_spans
+        })
+
+    @app.route(f"{path}/<trace_id>", methods=["GET"])
+    def get_trace(trace_id):
+        trace = tracer.get(trace_id)
+        if trace is None:
+            return jsonify({"error": f"Trace {trace_id} not found"}), 404
+        return jsonify(trace)
+
+    return app
@@ -0,0 +1,105 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .synthetic_pdf import write_pdf
+
+class WarmUp:
+    """Runs warm-up steps once in the background; the worker is ready when every step has succeeded.
+
+    Readiness is separate from liveness: a live worker that is still loading models or whose
+    warm-up failed stays unready, and failed steps are retried every retry_interval seconds.
+    """
+
+    def __init__(self, steps: Dict[str, Callable[[], Optional[Dict[str, Any]]]], retry_interval: float = 30.0):
+        self.steps = steps
+        self.retry_interval = retry_interval
+        self.logger = logging.getLogger("warmup")
+        self.results: Dict[str, Dict[str, Any]] = {name: {"status": "pending"} for name in steps}
+        self.started_at = None
+        self.ready_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return all(result["status"] == "ok" for result in self.results.values())
+
+    def start(self):
+        """Start warming up; safe to call from every readiness check"""
+        with self._lock:
+            if self._thread is None:
+                self.started_at = time.time()
+                self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+                self._thread.start()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "started": self.started_at is not None,
+            "warmup_s": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "steps": dict(self.results)
+        }
+
+    def _run_step(self, name: str):
+        self.results[name] = {"status": "running"}
+        started = time.perf_counter()
+        try:
+            result = {"status": "ok", **(self.steps[name]() or {})}
+        except Exception as e:
+            self.logger.warning(f"Warm-up step {name} failed: {e}")
+            result = {"status": "error", "error": str(e)}
+        result["elapsed_ms"] = round(1000 * (time.perf_counter() - started), 1)
+        self.results[name] = result
+
+    def _run(self):
+        pending = list(self.steps)
+        while True:
+            for name in pending:
+                self._run_step(name)
+            pending = [name for name, result in self.results.items() if result["status"] != "ok"]
+            if not pending:
+                break
+            time.sleep(self.retry_interval)
+        self.ready_at = time.time()
+        self.logger.info(f"Warm-up finished in {self.ready_at - self.started_at:.2f}s")
+
+def enabled_steps(steps: Dict[str, Callable], names: Optional[Iterable[str]]) -> Dict[str, Callable]:
+    """Keep the named steps (all of them when names is None); an empty list disables warm-up"""
+    if names is None:
+        return steps
+    wanted = [name.strip() for name in names if name.strip()]
+    unknown = set(wanted) - set(steps)
+    if unknown:
+        raise ValueError(f"Unknown warm-up steps: {sorted(unknown)}")
+    return {name: steps[name] for name in wanted}
+
+def steps_from_env(steps: Dict[str, Callable]) -> Dict[str, Callable]:
+    names = os.environ.get("NEUROFETCH_WARMUP_STEPS")
+    return enabled_steps(steps, None if names is None else names.split(","))
+
+def warm_embeddings(embeddings) -> Dict[str, Any]:
+    """Load the embedding model with one short query"""
+    return {"dimensions": len(embeddings.embed_query("warm-up"))}
+
+def warm_vector_index(embeddings) -> Dict[str, Any]:
+    """Load FAISS and run one search on a throwaway index, leaving the real index untouched"""
+    from langchain_community.vectorstores import FAISS
+    vector = embeddings.embed_query("warm-up")
+    index = FAISS.from_embeddings([("warm-up", vector)], embeddings)
+    return {"hits": len(index.similarity_search_by_vector(vector, k=1))}
+
+def warm_table_extraction(structured_agent) -> Dict[str, Any]:
+    """Extract a one-table synthetic PDF so camelot and its PDF backend initialize before real traffic"""
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_path = write_pdf(os.path.join(directory, "warmup.pdf"), [{
+            "lines": ["Warm-up"],
+            "table": [["Quarter", "Revenue"], ["Q1", "10"], ["Q2", "12"]]
+        }])
+        result = structured_agent.process({"pdf_path": pdf_path, "data_type": "table", "pages": "1"})
+    if not result.get("success"):
+        raise RuntimeError(result.get("error", "table extraction failed"))
+    return {"method": result["data"]["extraction_method"], "tables": result["data"]["total_tables"]}